@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+"""
+Book Assembly
+Joins the chapter outputs of a book into one WAV file with chapter markers
+
+The chapters' sample data is copied into the book byte for byte and only
+the headers are written anew, so nothing is decoded or re-encoded and
+memory use does not depend on the length of the book. Every chapter must
+therefore have the same format (sample format, rate and channels), which
+is the case for outputs rendered with the same OUTPUT_FORMAT and
+OUTPUT_SAMPLE_RATE.
+
+Chapter starts are written as cue points with their titles as labels
+(cue and LIST/adtl chunks), which audio editors and many players show as
+markers. The same chapters are written to <book>.chapters.txt in
+FFmpeg's metadata format, so the book can be encoded to M4B or MKA with
+chapters. Books past 4 GB are written as RF64.
+
+Chapter order and titles come from a split manifest if one is given,
+otherwise from the file names (01_Preface.wav, 02_...).
+
+Usage:
+  python assemble.py [audio_folder | manifest.json] [output.wav] [--title TITLE]
+"""
+
+import argparse
+import os
+import re
+import struct
+import sys
+import time
+from collections import namedtuple
+from pathlib import Path
+
+from wav_io import RF64_SIZE, WAVE_FORMAT_PCM, read_wav_info
+
+COPY_BUFFER = 1 << 20
+CHAPTERS_SUFFIX = ".chapters.txt"
+DS64_SIZE = 28      # riff size, data size, sample count (8 bytes each), table length
+
+# Files next to the chapters that are not chapters themselves
+_NOT_A_CHAPTER = re.compile(r"_\d+(\.\d+)?x$|\.partial$")
+
+Chapter = namedtuple("Chapter", "path title info frames")
+
+
+def chapter_title(stem):
+    """Title for a chapter file name: 03_The_Origin -> The Origin"""
+
+    title = re.sub(r"^\d+[\s_.-]*", "", stem).replace("_", " ").strip()
+    return title or stem
+
+
+def find_chapters(source, output_file=None, audio_dir="audio_output"):
+    """
+    List the chapter files of a book in order
+
+    Args:
+        source (Path): Folder of chapter WAVs, or a split manifest (.json)
+        output_file (Path): The book being written, left out of the list
+        audio_dir (str): Where the chapters of a manifest were rendered
+
+    Returns:
+        list: (path, title) pairs
+    """
+
+    source = Path(source)
+    if source.suffix.lower() == ".json":
+        from split_manifest import load_manifest
+
+        manifest = load_manifest(source)
+        return [(Path(audio_dir) / f"{c['name']}.wav", c["title"]) for c in manifest["chapters"]]
+
+    def is_chapter(path):
+        # Books assembled earlier are recognized by their chapters file
+        return not (path.name.startswith(".") or _NOT_A_CHAPTER.search(path.stem)
+                    or path.with_name(path.stem + CHAPTERS_SUFFIX).exists() or path.resolve() == skip)
+
+    skip = Path(output_file).resolve() if output_file else None
+    files = sorted(p for p in source.glob("*.wav") if is_chapter(p))
+    return [(path, chapter_title(path.stem)) for path in files]
+
+
+def _chapter_frames(path, info):
+    # Trust the file size over the header if the writer never patched it
+    available = (path.stat().st_size - info.data_offset) // info.block_align
+    return min(info.frames, available) if info.data_size else available
+
+
+def check_chapters(chapters):
+    """
+    Read the headers of every chapter and make sure they can be joined without decoding
+
+    Raises:
+        ValueError: A chapter is missing, unreadable or in another format
+    """
+
+    checked = []
+    for path, title in chapters:
+        try:
+            info = read_wav_info(path)
+        except (OSError, ValueError) as e:
+            raise ValueError(f"{path}: {e}")
+        layout = (info.format_tag, info.channels, info.sample_rate, info.bits_per_sample)
+        if checked and layout != checked[0].info[:4]:
+            first = checked[0]
+            raise ValueError(
+                f"{path.name} is {info.bits_per_sample}-bit {info.sample_rate} Hz with {info.channels} channel(s), "
+                f"but {first.path.name} is {first.info.bits_per_sample}-bit {first.info.sample_rate} Hz with "
+                f"{first.info.channels} channel(s); render both with the same OUTPUT_FORMAT and OUTPUT_SAMPLE_RATE"
+            )
+        checked.append(Chapter(Path(path), title, info, _chapter_frames(Path(path), info)))
+    return checked
+
+
+def _chunk(chunk_id, body):
+    return chunk_id + struct.pack("<I", len(body)) + body + b"\x00" * (len(body) & 1)
+
+
+def marker_chunks(starts, titles):
+    """cue chunk with a point at each start frame and a LIST/adtl chunk labelling them"""
+
+    cue = struct.pack("<I", len(starts))
+    labels = b"adtl"
+    for number, (start, title) in enumerate(zip(starts, titles), 1):
+        # Cue point: id, position, data chunk id, chunk start, block start, sample offset
+        cue += struct.pack("<II4sIII", number, start, b"data", 0, 0, start)
+        labels += _chunk(b"labl", struct.pack("<I", number) + title.encode("utf-8") + b"\x00")
+    return _chunk(b"cue ", cue) + _chunk(b"LIST", labels)
+
+
+def book_header(info, data_size, frames, markers):
+    """
+    Header of the book up to the start of its sample data
+
+    A ds64 chunk goes in front of fmt when the book needs RF64, and a JUNK
+    chunk of the same size otherwise, as EBU Tech 3306 recommends.
+    """
+
+    byte_rate = info.sample_rate * info.block_align
+    fmt_body = struct.pack("<HHIIHH", info.format_tag, info.channels, info.sample_rate,
+                           byte_rate, info.block_align, info.bits_per_sample)
+    has_fact = info.format_tag != WAVE_FORMAT_PCM
+    if has_fact:
+        fmt_body += struct.pack("<H", 0)
+
+    # WAVE, ds64/JUNK, fmt, fact (non-PCM formats), markers, data header
+    header_size = 4 + (8 + DS64_SIZE) + (8 + len(fmt_body)) + (12 if has_fact else 0) + len(markers) + 8
+    riff_size = header_size + data_size + (data_size & 1)
+    rf64 = riff_size >= RF64_SIZE
+
+    if rf64:
+        header = b"RF64" + struct.pack("<I", RF64_SIZE) + b"WAVE"
+        header += _chunk(b"ds64", struct.pack("<QQQI", riff_size, data_size, frames, 0))
+    else:
+        header = b"RIFF" + struct.pack("<I", riff_size) + b"WAVE"
+        header += _chunk(b"JUNK", bytes(DS64_SIZE))
+    header += _chunk(b"fmt ", fmt_body)
+    if has_fact:
+        header += _chunk(b"fact", struct.pack("<I", min(frames, RF64_SIZE)))
+    header += markers
+    header += b"data" + struct.pack("<I", RF64_SIZE if rf64 else data_size)
+    return header, rf64
+
+
+def copy_data(path, info, size, out, buffer):
+    """Copy size bytes of a chapter's sample data into out without decoding them"""
+
+    view = memoryview(buffer)
+    with open(path, "rb") as f:
+        f.seek(info.data_offset)
+        remaining = size
+        while remaining:
+            count = f.readinto(view[:min(len(view), remaining)])
+            if not count:
+                raise ValueError(f"{path} ended before its sample data did")
+            out.write(view[:count])
+            remaining -= count
+
+
+def write_ffmetadata(path, chapters, starts, sample_rate, title=None):
+    """Write the chapters in FFmpeg's metadata format (ffmpeg -i book.wav -i this -map_metadata 1 ...)"""
+
+    def escape(value):
+        return re.sub(r"([=;#\\\n])", r"\\\1", value)
+
+    lines = [";FFMETADATA1"]
+    if title:
+        lines.append(f"title={escape(title)}")
+    for chapter, start in zip(chapters, starts):
+        lines += ["", "[CHAPTER]", f"TIMEBASE=1/{sample_rate}", f"START={start}",
+                  f"END={start + chapter.frames}", f"title={escape(chapter.title)}"]
+    Path(path).write_text("\n".join(lines) + "\n", encoding="utf-8")
+
+
+def assemble_book(chapters, output_file, title=None):
+    """
+    Join chapters into one WAV file with chapter markers
+
+    Args:
+        chapters (list): (path, title) pairs in order, from find_chapters
+        output_file (Path): Book to write
+        title (str): Book title for the chapter metadata
+
+    Returns:
+        dict: Chapters, frames, seconds, bytes written and whether RF64 was needed
+
+    Raises:
+        ValueError: The chapters cannot be joined without decoding
+    """
+
+    if not chapters:
+        raise ValueError("No chapters to assemble")
+    chapters = check_chapters(chapters)
+    info = chapters[0].info
+
+    starts = []
+    frames = 0
+    for chapter in chapters:
+        starts.append(frames)
+        frames += chapter.frames
+    data_size = frames * info.block_align
+
+    # Cue points hold 32-bit frame positions (about 49 hours at 24000 Hz)
+    marked = [i for i, start in enumerate(starts) if start <= RF64_SIZE]
+    if len(marked) < len(chapters):
+        print(f"Warning: {len(chapters) - len(marked)} chapters start too late for a cue point; "
+              f"they are only listed in {CHAPTERS_SUFFIX}")
+    markers = marker_chunks([starts[i] for i in marked], [chapters[i].title for i in marked])
+    header, rf64 = book_header(info, data_size, frames, markers)
+
+    output_file = Path(output_file)
+    output_file.parent.mkdir(parents=True, exist_ok=True)
+    partial = output_file.with_name(output_file.stem + ".partial.wav")
+    buffer = bytearray(COPY_BUFFER)
+    with open(partial, "wb") as out:
+        out.write(header)
+        for chapter in chapters:
+            copy_data(chapter.path, chapter.info, chapter.frames * info.block_align, out, buffer)
+        if data_size & 1:
+            out.write(b"\x00")
+    os.replace(partial, output_file)
+
+    write_ffmetadata(output_file.with_name(output_file.stem + CHAPTERS_SUFFIX),
+                     chapters, starts, info.sample_rate, title)
+    return {
+        "chapters": len(chapters),
+        "frames": frames,
+        "seconds": frames / info.sample_rate,
+        "bytes": output_file.stat().st_size,
+        "rf64": rf64,
+    }
+
+
+def default_output(source, audio_dir="audio_output"):
+    """<audio_dir>/<manifest name>.wav for a manifest, <folder>/book.wav for a folder"""
+
+    source = Path(source)
+    if source.suffix.lower() == ".json":
+        return Path(audio_dir) / f"{source.stem}.wav"
+    return source / "book.wav"
+
+
+def assemble(source="audio_output", output_file=None, title=None, audio_dir="audio_output"):
+    """Find the chapters of source, join them and print a summary"""
+
+    output_file = Path(output_file) if output_file else default_output(source, audio_dir)
+    try:
+        chapters = find_chapters(source, output_file, audio_dir)
+        start = time.time()
+        report = assemble_book(chapters, output_file, title)
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}")
+        return False
+
+    hours, rest = divmod(int(report["seconds"]), 3600)
+    print(f"Wrote {output_file}: {report['chapters']} chapters, {hours}:{rest // 60:02d}:{rest % 60:02d}, "
+          f"{report['bytes']:,} bytes{' (RF64)' if report['rf64'] else ''} in {time.time() - start:.1f} seconds")
+    return True
+
+
+def main():
+    """Main function with command line interface"""
+
+    parser = argparse.ArgumentParser(description="Join chapter WAVs into one book with chapter markers")
+    parser.add_argument("source", nargs="?", default="audio_output",
+                        help="Folder of chapter WAVs, or a split manifest (default: audio_output)")
+    parser.add_argument("output", nargs="?", help="Book file (default: book.wav in the folder)")
+    parser.add_argument("--title", help="Book title for the chapter metadata")
+    args = parser.parse_args()
+
+    if not Path(args.source).exists():
+        print(f"Not found: {args.source}")
+        return False
+    return assemble(args.source, args.output, args.title)
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,3 @@
+@echo off
+REM Audiobook command line - run "audiobook --help" for the subcommands
+python "%~dp0audiobook.py" %*
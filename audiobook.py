@@ -0,0 +1,389 @@
+#!/usr/bin/env python3
+"""
+Audiobook Command Line
+One entry point for splitting books and converting them to audio
+
+Subcommands:
+    split      Split a book (text or EPUB) into chapter files
+    bulk-split Split every book under an uploads tree in parallel
+    convert    Convert one text file to audio
+    batch      Convert every file in text_input
+    schedule   Convert an uploads tree, sharing workers fairly between users
+    assemble   Join the chapter outputs into one book with chapter markers
+    verify     Check the outputs and re-queue broken ones
+    plan       Show what a batch would convert, without converting
+    bench      Run a benchmark from the benchmarks folder
+
+Heavy modules (the TTS engine, NumPy, audio code) are only imported by the
+subcommands that use them, so --help, plan and split start instantly.
+Add --import-time to any command to see what was imported and how long it took,
+and --memory-profile to see the peak memory of every stage (see memprofile.py).
+convert --draft and batch --draft make quick proofreading renders (see draft.py).
+"""
+
+import sys
+import time
+
+_START = time.perf_counter()
+_IMPORT_TIMES = []
+
+SPLIT_METHODS = {
+    # method: (module, description)
+    "smart": ("smart_splitter", "detect chapter patterns automatically"),
+    "chapters": ("split_book", "split on 'Chapter N' markers"),
+    "toc": ("jaynes_splitter_ultimate", "split on Table of Contents section titles"),
+    "epub": ("epub_reader", "read chapters from an EPUB's own table of contents"),
+}
+
+WORDS_PER_MINUTE = 150
+MEMORY_PROFILE_ENV = "AUDIOBOOK_MEMORY_PROFILE"    # memprofile.ENV_VAR, known without importing it
+
+
+def lazy_import(name):
+    """Import a module on first use and record how long the import took"""
+
+    import importlib
+
+    if name in sys.modules:
+        return sys.modules[name]
+    before = len(sys.modules)
+    start = time.perf_counter()
+    module = importlib.import_module(name)
+    _IMPORT_TIMES.append((name, time.perf_counter() - start, len(sys.modules) - before))
+    return module
+
+
+def print_import_report():
+    """Print the import-time report requested with --import-time"""
+
+    total = time.perf_counter() - _START
+    print(file=sys.stderr)
+    print("Import-time report", file=sys.stderr)
+    print("-" * 40, file=sys.stderr)
+    for name, seconds, modules in _IMPORT_TIMES:
+        print(f"  {name:<28} {seconds * 1000:8.1f} ms  ({modules} modules)", file=sys.stderr)
+    if not _IMPORT_TIMES:
+        print("  (no heavy modules were imported)", file=sys.stderr)
+    print(f"  {'modules loaded':<28} {len(sys.modules):8d}", file=sys.stderr)
+    print(f"  {'total run time':<28} {total * 1000:8.1f} ms", file=sys.stderr)
+    print("For a per-module breakdown run: python -X importtime audiobook.py ...", file=sys.stderr)
+
+
+def load_settings(args):
+    """Return (voice, speed) from the command line, falling back to config.txt"""
+
+    tts_config = lazy_import("tts_config")
+    config = tts_config.load_config(args.config)
+    voice = args.voice or config["VOICE"]
+    speed = args.speed if args.speed is not None else tts_config.get_float(config, "SPEED", 1.0)
+    return voice, speed
+
+
+def cmd_split(args):
+    import os
+    from pathlib import Path
+
+    config = lazy_import("tts_config").load_config(args.config)
+    if not (os.environ.get(MEMORY_PROFILE_ENV) or config.get("MEMORY_PROFILE")):
+        return split_book(args)
+    memprofile = lazy_import("memprofile")
+    with memprofile.job(f"split-{Path(args.input).stem}", config=config):
+        return split_book(args)
+
+
+def split_book(args):
+    """Split args.input with the method asked for (or the default for its type)"""
+
+    method = args.method or ("epub" if args.input.lower().endswith(".epub") else "smart")
+    module_name, _ = SPLIT_METHODS[method]
+    splitter = lazy_import(module_name)
+    output = args.output or "chapters"
+
+    if method == "epub":
+        return bool(splitter.split_epub(args.input, output, args.manifest))
+    if method == "smart":
+        result = splitter.analyze_document_structure(args.input)
+        if not result:
+            return False
+        content, _, encoding = result
+        return splitter.smart_split_document(content, output, args.manifest, args.input, encoding)
+    if method == "chapters":
+        return splitter.split_book_by_chapters(args.input, output, args.manifest)
+    from pathlib import Path
+    return splitter.split_jaynes_book_ultimate(Path(args.input), output, args.manifest)
+
+
+def cmd_bulk_split(args):
+    from pathlib import Path
+
+    bulk_split = lazy_import("bulk_split")
+    if not Path(args.root).is_dir():
+        print(f"Folder not found: {args.root}")
+        return False
+    report = bulk_split.bulk_split(args.root, args.output, args.workers, args.manifest)
+    print(f"{report['split']} split, {report['unchanged']} unchanged, "
+          f"{report['failed']} without chapters or unreadable ({report['seconds']:.1f} seconds)")
+    return report["failed"] == 0
+
+
+def cmd_convert(args):
+    voice, speed = load_settings(args)
+    if args.draft:
+        if args.split or args.input.lower().endswith(".json"):
+            print("--draft converts a chapter text file; split the book first")
+            return False
+        return draft_files([args.input], voice, speed, args)
+    if args.split:
+        # Convert a whole book, starting on chapter 1 while the rest is still being split
+        streaming_splitter = lazy_import("streaming_splitter")
+        options = {"skip_lines": args.skip_lines, "min_words": args.min_words}
+        if args.titles:
+            from pathlib import Path
+            lines = Path(args.titles).read_text(encoding="utf-8").splitlines()
+            options["titles"] = [t.strip() for t in lines if t.strip()]
+        return streaming_splitter.convert_book_streaming(args.input, voice, speed, **options)
+    converter = lazy_import("text_to_audio_batch")
+    return converter.convert_text_to_audio(args.input, voice, speed, config_file=args.config)
+
+
+def cmd_batch(args):
+    voice, speed = load_settings(args)
+    if args.draft:
+        from pathlib import Path
+        inputs = sorted(Path(args.input).glob("*.txt"))
+        if not inputs:
+            print(f"No .txt files found in {args.input}")
+            return True
+        return draft_files(inputs, voice, speed, args)
+    batch_runner = lazy_import("batch_runner")
+    completed = None if args.keep_inputs else args.completed
+    return batch_runner.run_batch(args.input, voice, speed, completed, args.config)
+
+
+def draft_files(inputs, voice, speed, args):
+    """Render proofreading drafts; the inputs, finished outputs and build database are left alone"""
+
+    draft = lazy_import("draft")
+    config = lazy_import("tts_config").load_config(args.config)
+    return len(draft.draft_files(inputs, voice, speed, config=config)) == len(inputs)
+
+
+def cmd_schedule(args):
+    from pathlib import Path
+
+    voice, speed = load_settings(args)
+    fair_scheduler = lazy_import("fair_scheduler")
+    if not Path(args.root).is_dir():
+        print(f"Folder not found: {args.root}")
+        return False
+    report = fair_scheduler.run_schedule(args.root, args.output, voice, speed, args.workers,
+                                         args.config, args.dry_run)
+    fair_scheduler.print_report(report)
+    return not any(row["failed"] for row in report["users"].values())
+
+
+def cmd_assemble(args):
+    from pathlib import Path
+
+    assemble = lazy_import("assemble")
+    if not Path(args.source).exists():
+        print(f"Not found: {args.source}")
+        return False
+    return assemble.assemble(args.source, args.output, args.title, args.audio)
+
+
+def cmd_verify(args):
+    from pathlib import Path
+
+    verify = lazy_import("verify")
+    if not Path(args.output).is_dir():
+        print(f"Folder not found: {args.output}")
+        return False
+    _, speed = load_settings(args)
+    result = verify.verify_dir(args.output, speed, (args.input, args.completed), args.input, not args.no_requeue)
+    for output_file, problems in result["problems"].items():
+        for problem in problems:
+            print(f"  FAILED {output_file}: {problem}")
+    print(f"{result['checked']} outputs checked in {result['seconds']:.1f} seconds: "
+          f"{result['failed']} failed, {result['requeued']} re-queued")
+    return result["failed"] == 0
+
+
+def cmd_plan(args):
+    from pathlib import Path
+
+    voice, speed = load_settings(args)
+    inputs = sorted(Path(args.input).glob("*.txt"))
+    if not inputs:
+        print(f"No .txt files found in {args.input}")
+        return True
+
+    build_db = lazy_import("build_db")
+    db = build_db.BuildDB(Path(args.output) / ".build.json")
+    config = lazy_import("tts_config").load_config(args.config)
+    lexicon = lazy_import("lexicon").load_lexicon(config, args.input)
+    settings = build_db.build_settings(config, voice, speed, lexicon)
+
+    print(f"Voice: {voice}   Speed: {speed}x   Output: {args.output}")
+    print(f"{'File':<48} {'Words':>8} {'Est. audio':>11} {'Output':>10}")
+    total_words = 0
+    for input_file in inputs:
+        with open(input_file, "r", encoding="utf-8", errors="replace") as f:
+            words = len(f.read().split())
+        total_words += words
+        minutes = words / WORDS_PER_MINUTE / speed
+        key = build_db.build_key(db.input_hash(input_file), settings)
+        status = db.status(Path(args.output) / f"{input_file.stem}.wav", key)
+        print(f"{input_file.name[:48]:<48} {words:>8,} {minutes:>9.1f} m {status:>10}")
+
+    hours = total_words / WORDS_PER_MINUTE / speed / 60
+    print(f"{len(inputs)} files, {total_words:,} words, about {hours:.1f} hours of audio")
+    return True
+
+
+def cmd_bench(args):
+    import pkgutil
+    from pathlib import Path
+
+    available = sorted(m.name for m in pkgutil.iter_modules([str(Path(__file__).parent / "benchmarks")]))
+    if not args.name:
+        print("Available benchmarks:")
+        for name in available:
+            print(f"  {name}")
+        return True
+    if args.name not in available:
+        print(f"Unknown benchmark '{args.name}' (choose from: {', '.join(available)})")
+        return False
+
+    benchmark = lazy_import(f"benchmarks.{args.name}")
+    sys.argv = [f"benchmarks/{args.name}.py"] + args.bench_args
+    return benchmark.main()
+
+
+def build_parser():
+    import argparse
+
+    def add_global_options(p, subcommand=False):
+        # Only the main parser has defaults, so a subcommand's copy of an
+        # option leaves the value given before the subcommand alone
+        def default(value):
+            return argparse.SUPPRESS if subcommand else value
+
+        p.add_argument("--import-time", action="store_true", default=default(False),
+                       help="Report import times when the command ends")
+        p.add_argument("--config", default=default("config.txt"), help="Settings file (default: config.txt)")
+        p.add_argument("--memory-profile", choices=("rss", "full"), default=default(None),
+                       help="Report peak memory per stage of every split and conversion "
+                            "(full also traces Python allocations)")
+
+    parser = argparse.ArgumentParser(prog="audiobook", description="Split books and convert them to audio")
+    add_global_options(parser)
+    # The same options are accepted after the subcommand (split book.txt --import-time)
+    common = argparse.ArgumentParser(add_help=False)
+    add_global_options(common, subcommand=True)
+    sub = parser.add_subparsers(dest="command", metavar="command")
+
+    def add_parser(name, **kwargs):
+        return sub.add_parser(name, parents=[common], **kwargs)
+
+    split = add_parser("split", help="Split a book into chapter files")
+    split.add_argument("input", help="Book text file or EPUB")
+    split.add_argument("--method", choices=SPLIT_METHODS,
+                       help="; ".join(f"{k}: {v[1]}" for k, v in SPLIT_METHODS.items())
+                       + " (default: epub for .epub files, otherwise smart)")
+    split.add_argument("--output", help="Folder for the chapter files (default: chapters)")
+    split.add_argument("--manifest", help="Write a JSON split manifest here instead of chapter files")
+    split.set_defaults(func=cmd_split)
+
+    bulk = add_parser("bulk-split", help="Split every book under an uploads tree in parallel")
+    bulk.add_argument("root", nargs="?", default="tempuploads", help="One folder per user (default: tempuploads)")
+    bulk.add_argument("--output", default="split_output", help="Output folder (default: split_output)")
+    bulk.add_argument("--workers", type=int, help="Worker processes (default: one per CPU core)")
+    bulk.add_argument("--manifest", action="store_true", help="Write split manifests instead of chapter files")
+    bulk.set_defaults(func=cmd_bulk_split)
+
+    def add_voice_options(p):
+        p.add_argument("--voice", help="Voice (default: VOICE from config.txt)")
+        p.add_argument("--speed", type=float, help="Speech speed (default: SPEED from config.txt)")
+
+    convert = add_parser("convert", help="Convert one text file to audio")
+    convert.add_argument("input", help="Text file or split manifest (.json) to convert")
+    convert.add_argument("--split", action="store_true",
+                         help="Input is a whole book: split it and convert chapters as they are found")
+    convert.add_argument("--titles", help="With --split, split on the section titles in this file")
+    convert.add_argument("--skip-lines", type=int, default=0, help="With --split, ignore boundaries in the first N lines")
+    convert.add_argument("--min-words", type=int, default=0, help="With --split, skip shorter chapters")
+    convert.add_argument("--draft", action="store_true",
+                         help="Quick low-fidelity render for proofreading, into audio_output/drafts")
+    add_voice_options(convert)
+    convert.set_defaults(func=cmd_convert)
+
+    batch = add_parser("batch", help="Convert every file in a folder")
+    batch.add_argument("--input", default="text_input", help="Folder of .txt files (default: text_input)")
+    batch.add_argument("--completed", default="completed", help="Where finished inputs are moved")
+    batch.add_argument("--keep-inputs", action="store_true", help="Leave finished inputs in place")
+    batch.add_argument("--draft", action="store_true",
+                       help="Quick low-fidelity renders for proofreading; inputs stay where they are")
+    add_voice_options(batch)
+    batch.set_defaults(func=cmd_batch)
+
+    schedule = add_parser("schedule", help="Convert an uploads tree, sharing workers fairly between users")
+    schedule.add_argument("root", nargs="?", default="tempuploads", help="One folder per user (default: tempuploads)")
+    schedule.add_argument("--output", default="audio_output", help="Output folder (default: audio_output)")
+    schedule.add_argument("--workers", type=int, help="Chapters rendered at once (default: SCHEDULER_WORKERS)")
+    schedule.add_argument("--dry-run", action="store_true", help="Show the planned order without converting")
+    add_voice_options(schedule)
+    schedule.set_defaults(func=cmd_schedule)
+
+    book = add_parser("assemble", help="Join the chapter outputs into one book with chapter markers")
+    book.add_argument("source", nargs="?", default="audio_output",
+                      help="Folder of chapter WAVs, or a split manifest (default: audio_output)")
+    book.add_argument("--output", help="Book file (default: book.wav in the folder)")
+    book.add_argument("--title", help="Book title for the chapter metadata")
+    book.add_argument("--audio", default="audio_output", help="Where a manifest's chapters were rendered")
+    book.set_defaults(func=cmd_assemble)
+
+    check = add_parser("verify", help="Check the outputs and re-queue broken ones")
+    check.add_argument("--output", default="audio_output", help="Output folder (default: audio_output)")
+    check.add_argument("--input", default="text_input", help="Where re-queued inputs go (default: text_input)")
+    check.add_argument("--completed", default="completed", help="Where finished inputs were moved")
+    check.add_argument("--no-requeue", action="store_true", help="Only report, leave inputs and build records alone")
+    add_voice_options(check)
+    check.set_defaults(func=cmd_verify)
+
+    plan = add_parser("plan", help="Show what a batch would convert")
+    plan.add_argument("--input", default="text_input", help="Folder of .txt files (default: text_input)")
+    plan.add_argument("--output", default="audio_output", help="Output folder (default: audio_output)")
+    add_voice_options(plan)
+    plan.set_defaults(func=cmd_plan)
+
+    bench = add_parser("bench", help="Run a benchmark (no name lists them)")
+    bench.add_argument("name", nargs="?", help="Benchmark name")
+    bench.add_argument("bench_args", nargs="...", help="Arguments passed to the benchmark")
+    bench.set_defaults(func=cmd_bench)
+
+    return parser
+
+
+def main(argv=None):
+    """Main function with command line interface"""
+
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.memory_profile:
+        # Through the environment, so worker processes profile their jobs too
+        import os
+        os.environ[MEMORY_PROFILE_ENV] = args.memory_profile
+    if not args.command:
+        parser.print_help()
+        success = True
+    else:
+        success = args.func(args)
+    if args.import_time:
+        print_import_report()
+    return success
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Kokoro TTS Batch Runner
+Converts every text file in text_input (convert.bat and audiobook.py batch run this)
+
+Files whose output is up to date in the build database (same text, voice,
+speed, engine, output settings and lexicon) are skipped, so re-running a batch
+only renders what changed. With VERIFY=on, an output that fails
+verification (see verify.py) is re-queued once at the end of the batch.
+
+The runner, and the streamer it starts, run on the CPUs and at the
+priority set by CPU_AFFINITY, NUMA and WORKER_PRIORITY (see placement.py).
+"""
+
+import shutil
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+
+def find_inputs(input_dir="text_input"):
+    """Return the .txt files waiting in input_dir, in name order"""
+
+    return sorted(Path(input_dir).glob("*.txt"))
+
+
+def broken_output(output_file, input_file, speed):
+    """Problems verify.py finds in a finished render (only used with VERIFY=on, as it imports NumPy)"""
+
+    from verify import verify_output
+
+    return verify_output(output_file, len(input_file.read_text(encoding="utf-8", errors="replace").split()), speed)
+
+
+def run_batch(input_dir="text_input", voice="af_bella", speed=1.0, completed_dir="completed", config_file="config.txt"):
+    """
+    Convert the text files in input_dir that are not up to date, moving each finished input to completed_dir
+
+    Args:
+        input_dir (str): Folder with the .txt files to convert
+        voice (str): Voice to use
+        speed (float): Speech speed
+        completed_dir (str): Where converted inputs are moved (None to leave them)
+        config_file (str): Settings for the conversions and their build keys
+
+    Returns:
+        bool: True if every file converted
+    """
+
+    from build_db import BuildDB, build_key, build_settings
+    from lexicon import load_lexicon
+    from placement import Placement
+    from text_to_audio_batch import convert_text_to_audio
+    from tts_config import get_bool, load_config
+
+    if not Path(input_dir).exists():
+        print(f"Error: {input_dir} folder not found!")
+        print(f"Please create the {input_dir} folder and put your text files in it.")
+        return False
+
+    inputs = find_inputs(input_dir)
+    if not inputs:
+        print(f"No .txt files found in {input_dir} folder!")
+        return True
+
+    if completed_dir:
+        Path(completed_dir).mkdir(exist_ok=True)
+
+    db = BuildDB()
+    config = load_config(config_file)
+    placement = Placement.from_config(config)
+    placement.apply()
+
+    print(f"Using voice: {voice}")
+    print(f"Using speed: {speed}x")
+    if placement.pinned or placement.priority != "normal":
+        print(f"Placement: {placement.describe()}")
+    print()
+
+    settings = build_settings(config, voice, speed, load_lexicon(config, input_dir))
+    verify = get_bool(config, "VERIFY")
+
+    failed = []
+    requeued = set()
+    skipped = 0
+    batch_start = time.time()
+    for count, input_file in enumerate(inputs, 1):
+        output_file = Path("audio_output") / f"{input_file.stem}.wav"
+        key = build_key(db.input_hash(input_file), settings)
+        if db.is_fresh(output_file, key):
+            print(f"Up to date: {input_file.name}")
+            skipped += 1
+            if completed_dir:
+                shutil.move(str(input_file), Path(completed_dir) / input_file.name)
+            continue
+
+        print(f"Processing file {count}: {input_file.name}")
+        print(f"Start time: {datetime.now():%Y-%m-%d %H:%M:%S}")
+        print()
+
+        if convert_text_to_audio(str(input_file), voice, speed, config_file=config_file):
+            db.record(output_file, key)
+            db.save()
+            print("=" * 40)
+            print(f"   File Complete: {input_file.name}")
+            print("=" * 40)
+            if completed_dir:
+                shutil.move(str(input_file), Path(completed_dir) / input_file.name)
+        elif (verify and input_file not in requeued and output_file.exists()
+              and broken_output(output_file, input_file, speed)):
+            # The render finished but left a broken file; try it once more at the end
+            requeued.add(input_file)
+            inputs.append(input_file)
+            print(f"Re-queued {input_file.name}: its output failed verification")
+        else:
+            print("=" * 40)
+            print(f"   FAILED: {input_file.name}")
+            print("=" * 40)
+            failed.append(input_file.name)
+        print()
+
+    duration = time.time() - batch_start
+    print("=" * 40)
+    print("   Batch Processing Complete!")
+    print("=" * 40)
+    print(f"Processed {len(inputs) - len(requeued) - skipped} files in {duration/60:.1f} minutes "
+          f"({skipped} up to date, {len(requeued)} re-queued, {len(failed)} failed)")
+    for name in failed:
+        print(f"  FAILED: {name}")
+    return not failed
+
+
+def main():
+    """Main function with command line interface"""
+
+    from tts_config import load_config, get_float
+
+    config = load_config()
+    input_dir = sys.argv[1] if len(sys.argv) > 1 else "text_input"
+    return run_batch(input_dir, config["VOICE"], get_float(config, "SPEED", 1.0))
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,4 @@
+"""
+Benchmarks for the audiobook pipeline
+Run from the repository root, e.g. python -m benchmarks.time_stretch
+"""
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+Engine Backend Benchmark
+Compares the real-time factor and output of the TTS engines on the same text
+
+The first engine listed is the reference. Every other engine's audio is
+compared with it on log-mel spectra: "spectral" is the cosine similarity
+of the average spectra (same voice timbre), "frames" the mean cosine
+similarity of frames after stretching both renders to the same length
+(same words at the same places). Identical audio scores 1.000 on both.
+
+Engines are given as names from tts_engine.ENGINES; "onnx:<model>" runs the
+ONNX engine with another model file, e.g. onnx:models/kokoro-v1.0.int8.onnx.
+
+Usage:
+  python -m benchmarks.engines <text_file> [--engines streamer,onnx,onnx:models/kokoro-v1.0.int8.onnx]
+"""
+
+import sys
+import time
+
+import numpy as np
+
+from tts_config import get_float, load_config
+from tts_engine import ENGINES
+
+MEL_BANDS = 64
+FFT_SIZE = 1024
+HOP = 256
+
+
+def create_engine(spec, config):
+    """Create an engine from a name or "onnx:<model file>", timing the model load"""
+
+    name, _, model = spec.partition(":")
+    engine_class = ENGINES[name]
+    options = engine_class.options(config) if hasattr(engine_class, "options") else {}
+    if model:
+        options["model"] = model
+    voice = config["VOICE"]
+    speed = get_float(config, "SPEED", 1.0)
+
+    start_time = time.perf_counter()
+    engine = engine_class(voice, speed, **options)
+    return engine, time.perf_counter() - start_time
+
+
+def log_mel(samples, sample_rate):
+    """Log-mel spectrogram of mono audio, shaped (frames, MEL_BANDS)"""
+
+    mono = samples.mean(axis=1) if samples.ndim == 2 else samples
+    if len(mono) < FFT_SIZE:
+        mono = np.pad(mono, (0, FFT_SIZE - len(mono)))
+    frames = np.lib.stride_tricks.sliding_window_view(mono, FFT_SIZE)[::HOP]
+    power = np.abs(np.fft.rfft(frames * np.hanning(FFT_SIZE), axis=1)) ** 2
+
+    # Triangular filters evenly spaced on the mel scale
+    mel = np.linspace(0, 2595 * np.log10(1 + (sample_rate / 2) / 700), MEL_BANDS + 2)
+    edges = 700 * (10 ** (mel / 2595) - 1)
+    bins = np.fft.rfftfreq(FFT_SIZE, 1 / sample_rate)
+    filters = np.zeros((MEL_BANDS, len(bins)))
+    for k in range(MEL_BANDS):
+        low, center, high = edges[k:k + 3]
+        rising = (bins - low) / (center - low)
+        falling = (high - bins) / (high - center)
+        filters[k] = np.maximum(0, np.minimum(rising, falling))
+    energy = power @ filters.T
+    # 80 dB floor below the loudest band, so near-silence does not dominate
+    return np.log10(np.maximum(energy, energy.max() * 1e-8 + 1e-20))
+
+
+def _cosine(a, b, axis=-1):
+    return np.sum(a * b, axis=axis) / (np.linalg.norm(a, axis=axis) * np.linalg.norm(b, axis=axis) + 1e-12)
+
+
+def similarity(reference, other):
+    """Return (spectral, frames) similarity of two log-mel spectrograms"""
+
+    reference_shape = reference.mean(axis=0) - reference.mean()
+    other_shape = other.mean(axis=0) - other.mean()
+    spectral = float(_cosine(reference_shape, other_shape))
+
+    # Stretch other to the reference's frame count by linear interpolation
+    positions = np.linspace(0, len(other) - 1, len(reference))
+    lower = np.floor(positions).astype(int)
+    upper = np.minimum(lower + 1, len(other) - 1)
+    weight = (positions - lower)[:, None]
+    aligned = other[lower] * (1 - weight) + other[upper] * weight
+    reference = reference - reference.mean(axis=0)
+    aligned = aligned - aligned.mean(axis=0)
+    frames = float(np.mean(_cosine(reference, aligned)))
+    return spectral, frames
+
+
+def main():
+    """Run the benchmark and print a comparison table"""
+
+    args = sys.argv[1:]
+    config = load_config()
+    engines = ["streamer", "onnx"]
+    if "--engines" in args:
+        i = args.index("--engines")
+        engines = args[i + 1].split(",")
+        del args[i:i + 2]
+
+    if not args:
+        print(__doc__.strip())
+        return False
+
+    with open(args[0], "r", encoding="utf-8") as f:
+        text = f.read()
+    print(f"Text: {args[0]} ({len(text.split()):,} words), voice {config['VOICE']}")
+    print("-" * 50)
+
+    results = []
+    reference = None
+    for spec in engines:
+        try:
+            engine, load_seconds = create_engine(spec, config)
+            engine.synthesize("Warm up.")
+            start_time = time.perf_counter()
+            audio, sample_rate = engine.synthesize(text)
+            seconds = time.perf_counter() - start_time
+        except Exception as e:
+            print(f"{spec}: skipped ({e})")
+            continue
+
+        duration = len(audio) / sample_rate
+        mel = log_mel(audio, sample_rate)
+        if reference is None:
+            reference = mel
+            scores = (1.0, 1.0)
+        else:
+            scores = similarity(reference, mel)
+        results.append((spec, load_seconds, seconds, duration, scores))
+
+    if not results:
+        return False
+
+    print(f"{'Engine':<40} {'Load (s)':>9} {'Synth (s)':>10} {'Audio (s)':>10} {'RTF':>6} {'Spectral':>9} {'Frames':>7}")
+    for spec, load_seconds, seconds, duration, (spectral, frames) in results:
+        rtf = seconds / duration if duration else float("inf")
+        print(f"{spec[:40]:<40} {load_seconds:>9.1f} {seconds:>10.1f} {duration:>10.1f} {rtf:>6.2f} "
+              f"{spectral:>9.3f} {frames:>7.3f}")
+    print("RTF = synthesis time / audio length (below 1.0 is faster than real time)")
+    return True
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
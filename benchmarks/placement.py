@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Worker Placement Benchmark
+Compares render throughput of unpinned and pinned workers, optionally next to other busy services
+
+Every worker process renders the same amount of synthetic audio through
+the resampler used for the output stage (a cache-heavy NumPy workload
+like the engines' own). It runs once with the workers free to move
+between cores, once with each pinned to its own CPU set
+(placement.plan_cpu_sets) and once pinned at low priority. With --load N,
+N busy processes stand in for the other services on a shared machine and
+their work rate is reported as well, to show what the render costs them.
+
+Usage:
+  python -m benchmarks.placement [--workers N] [--seconds S] [--load N]
+"""
+
+import argparse
+import multiprocessing
+import sys
+import time
+
+import numpy as np
+
+from placement import Placement, available_cpus, format_cpu_list, numa_nodes
+from wav_io import DEFAULT_BLOCK_FRAMES, Resampler
+
+SAMPLE_RATE = 24000
+
+
+def render_workload(seconds, seed=0):
+    """Resample `seconds` of noise from 24000 to 16000 Hz block by block"""
+
+    rng = np.random.default_rng(seed)
+    audio = (rng.standard_normal((int(seconds * SAMPLE_RATE), 1)) * 0.1).astype(np.float32)
+    resampler = Resampler(SAMPLE_RATE, 16000)
+    for start in range(0, len(audio), DEFAULT_BLOCK_FRAMES):
+        resampler.process(audio[start:start + DEFAULT_BLOCK_FRAMES])
+    resampler.flush()
+
+
+def _worker(placement, slot, seconds, start, results):
+    if placement is not None:
+        placement.apply(slot)
+    start.wait()
+    began = time.perf_counter()
+    render_workload(seconds, seed=slot)
+    results.put(time.perf_counter() - began)
+
+
+def _busy(stop, counter):
+    count = 0
+    while not stop.is_set():
+        for _ in range(10000):
+            pass
+        count += 1
+    counter.value = count
+
+
+def run_case(placement, workers, seconds, load):
+    """
+    Render with every worker at once next to `load` busy processes
+
+    Returns:
+        tuple: (wall seconds, audio seconds rendered per second, busy loops per second per load process)
+    """
+
+    context = multiprocessing.get_context("spawn" if sys.platform == "win32" else "fork")
+    stop = context.Event()
+    counters = [context.Value("q", 0) for _ in range(load)]
+    busy = [context.Process(target=_busy, args=(stop, counter)) for counter in counters]
+    for process in busy:
+        process.start()
+
+    start = context.Barrier(workers + 1)
+    results = context.Queue()
+    processes = [context.Process(target=_worker, args=(placement, slot, seconds, start, results))
+                 for slot in range(workers)]
+    for process in processes:
+        process.start()
+    start.wait()
+    began = time.perf_counter()
+    for process in processes:
+        process.join()
+    wall = time.perf_counter() - began
+
+    stop.set()
+    for process in busy:
+        process.join()
+    loops = sum(counter.value for counter in counters) / max(load, 1) / wall if load else None
+    return wall, workers * seconds / wall, loops
+
+
+def main():
+    """Run the benchmark and print a comparison table"""
+
+    cpus = available_cpus()
+    parser = argparse.ArgumentParser(description="Compare unpinned and pinned render workers")
+    parser.add_argument("--workers", type=int, default=max(len(cpus) // 2, 1), help="Worker processes")
+    parser.add_argument("--seconds", type=float, default=120.0, help="Seconds of audio per worker")
+    parser.add_argument("--load", type=int, default=0, help="Busy processes standing in for other services")
+    args = parser.parse_args(sys.argv[1:])
+
+    nodes = numa_nodes()
+    print(f"CPUs: {format_cpu_list(cpus)}   NUMA nodes: {len(nodes) or 1}   "
+          f"Workers: {args.workers}   Load: {args.load}")
+    cases = [
+        ("unpinned", None),
+        ("pinned", Placement(args.workers, cpus)),
+        ("pinned, low priority", Placement(args.workers, cpus, priority="low")),
+    ]
+    for name, placement in cases[1:]:
+        print(f"  {name}: {placement.describe()}")
+    print("-" * 64)
+
+    print(f"{'Placement':<22} {'Wall (s)':>9} {'x realtime':>11} {'Load loops/s':>13}")
+    for name, placement in cases:
+        wall, rate, loops = run_case(placement, args.workers, args.seconds, args.load)
+        print(f"{name:<22} {wall:>9.2f} {rate:>11.1f} {f'{loops:,.0f}' if loops is not None else '-':>13}")
+    return True
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+"""
+Splitter Scaling Benchmark
+Time and peak memory of every splitter on synthetic books of growing size
+
+For each size a book is generated (synthetic_book.py, same seed every
+run) and each splitter splits it into chapter files in a fresh process,
+so one run's memory cannot hide in the next one's peak. The table shows
+the time, the peak resident memory, the memory the split needed on top
+of the interpreter as a multiple of the book's size, the stage where the
+peak happened and how many of the generated chapters came out. Growth is
+the exponent between the smallest and the largest book: 1.0 is linear,
+and anything above 1.3 is flagged as non-linear. A split that does not
+find every generated chapter is flagged too.
+
+After the tables, every splitter in CHAPTER_CHECKS also gets a book of
+the smallest size with the heading style and noise listed there, and
+must find every chapter. The benchmark fails if any split finds more or
+fewer chapters than the book has.
+
+Every splitter gets books in the heading style it is made for (toc for
+the TOC splitter, Chapter N for the rest) unless --style is given.
+
+Usage:
+  python -m benchmarks.splitters [--sizes 1,4,16] [--splitters smart,chapters,toc,streaming,bulk]
+                                 [--style roman] [--noise light] [--encoding cp1252] [--timeout 900]
+"""
+
+import argparse
+import math
+import multiprocessing
+import os
+import sys
+import tempfile
+from contextlib import redirect_stdout
+from pathlib import Path
+
+from synthetic_book import NOISE_LEVELS, STYLES, generate_book, parse_size
+
+NONLINEAR = 1.3
+
+CHAPTER_CHECKS = [
+    # (splitter, heading style, noise)
+    # Headings with no "Chapter N" text go to the heading detector, and
+    # heavy noise puts the chapter title in every other page's running head
+    ("smart", "caps", "heavy"),
+    ("smart", "caps", "light"),
+]
+
+
+def _smart(book, output_dir):
+    import smart_splitter
+
+    result = smart_splitter.analyze_document_structure(book)
+    if not result:
+        return False
+    content, _, encoding = result
+    return smart_splitter.smart_split_document(content, output_dir, None, book, encoding)
+
+
+def _chapters(book, output_dir):
+    import split_book
+
+    return split_book.split_book_by_chapters(book, output_dir)
+
+
+def _toc(book, output_dir):
+    import jaynes_splitter_ultimate
+
+    return jaynes_splitter_ultimate.split_jaynes_book_ultimate(Path(book), output_dir)
+
+
+def _streaming(book, output_dir, toc=False):
+    import streaming_splitter
+    from jaynes_splitter_ultimate import TOC_ORDER
+
+    Path(output_dir).mkdir(parents=True, exist_ok=True)
+    options = {"titles": TOC_ORDER, "skip_lines": 100} if toc else {}
+    for chapter in streaming_splitter.iter_chapters(book, **options):
+        with open(Path(output_dir) / f"{streaming_splitter.chapter_name(chapter)}.txt", "w", encoding="utf-8") as f:
+            f.write(chapter.text)
+    return True
+
+
+def _bulk(book, output_dir):
+    import bulk_split
+
+    return bulk_split.split_one({"book": book, "output": output_dir, "manifest": False})["status"] == "split"
+
+
+SPLITTERS = {
+    # name: (function, heading style it is made for)
+    "smart": (_smart, "chapter"),
+    "chapters": (_chapters, "chapter"),
+    "toc": (_toc, "toc"),
+    "streaming": (_streaming, "chapter"),
+    "bulk": (_bulk, "chapter"),
+}
+
+
+def _run(name, book, output_dir, style, results):
+    import memprofile
+
+    function = SPLITTERS[name][0]
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+        with memprofile.profiling(name) as profiler:
+            if name == "streaming":
+                ok = function(book, output_dir, toc=style == "toc")
+            else:
+                ok = function(book, output_dir)
+    report = profiler.report()
+    found = sum(1 for _ in Path(output_dir).rglob("*.txt"))
+    results.put((bool(ok), report["seconds"], report["peak_rss"], report["stages"][0]["rss_start"],
+                 report["peak_stage"], found))
+
+
+def run_splitter(name, book, style, timeout):
+    """
+    Split a book in a fresh process
+
+    Returns:
+        tuple: (ok, seconds, peak RSS, RSS before splitting, peak stage, chapter files), or None on timeout
+    """
+
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    with tempfile.TemporaryDirectory() as output_dir:
+        process = context.Process(target=_run, args=(name, book, output_dir, style, results))
+        process.start()
+        process.join(timeout)
+        if process.is_alive():
+            process.kill()
+            process.join()
+            return None
+        return results.get() if not results.empty() else (False, 0.0, 0, 0, "crashed", 0)
+
+
+def growth(sizes, values):
+    """Exponent of value ~ size^k between the smallest and largest size"""
+
+    if len(sizes) < 2 or values[0] <= 0 or values[-1] <= 0:
+        return None
+    return math.log(values[-1] / values[0]) / math.log(sizes[-1] / sizes[0])
+
+
+def main():
+    """Run the benchmark and print a table per splitter"""
+
+    parser = argparse.ArgumentParser(description="Time and peak memory of the splitters on growing books")
+    parser.add_argument("--sizes", default="1,4,16", help="Book sizes in MB (default: 1,4,16)")
+    parser.add_argument("--splitters", default=",".join(SPLITTERS), help="Splitters to run (default: all)")
+    parser.add_argument("--style", choices=STYLES, help="Heading style for every splitter")
+    parser.add_argument("--noise", choices=NOISE_LEVELS, default="none", help="PDF noise (default: none)")
+    parser.add_argument("--encoding", default="utf-8", help="Text encoding (default: utf-8)")
+    parser.add_argument("--timeout", type=float, default=900, help="Seconds before a split is given up")
+    args = parser.parse_args(sys.argv[1:])
+
+    sizes = sorted(parse_size(f"{size.strip()}MB") for size in args.sizes.split(","))
+    names = [name.strip() for name in args.splitters.split(",") if name.strip()]
+    unknown = [name for name in names if name not in SPLITTERS]
+    if unknown:
+        print(f"Unknown splitter {unknown[0]!r} (choose from: {', '.join(SPLITTERS)})")
+        return False
+
+    print(f"Books: {args.sizes} MB, {args.noise} noise, {args.encoding}")
+    flagged = []
+    miscounted = []
+    with tempfile.TemporaryDirectory() as book_dir:
+        books = {}
+        for name in names:
+            style = args.style or SPLITTERS[name][1]
+            print()
+            print(f"{name} ({style} headings)")
+            print(f"  {'Size (MB)':>9} {'Seconds':>8} {'MB/s':>7} {'Peak MB':>8} {'x input':>8} "
+                  f"{'Chapters':>10}  Peak stage")
+            rows = []
+            for size in sizes:
+                key = (size, style)
+                if key not in books:
+                    path = Path(book_dir) / f"book_{style}_{size / 2 ** 20:g}MB.txt"
+                    books[key] = generate_book(path, size, style, args.noise, args.encoding)
+                book = books[key]
+                result = run_splitter(name, book["path"], style, args.timeout)
+                if result is None:
+                    print(f"  {book['bytes'] / 2 ** 20:>9.1f} {'timeout':>8}")
+                    break
+                ok, seconds, peak, baseline, stage, found = result
+                rows.append((book["bytes"], seconds, max(peak - baseline, 1)))
+                megabytes = book["bytes"] / 2 ** 20
+                chapters = f"{found}/{len(book['chapters'])}"
+                if found != len(book["chapters"]) and f"{name} ({style}, {args.noise})" not in miscounted:
+                    miscounted.append(f"{name} ({style}, {args.noise})")
+                print(f"  {megabytes:>9.1f} {seconds:>8.2f} {megabytes / max(seconds, 1e-6):>7.1f} "
+                      f"{peak / 2 ** 20:>8.1f} {(peak - baseline) / book['bytes']:>8.2f} "
+                      f"{chapters:>10}  {stage}{'' if ok else '  (failed)'}")
+
+            time_growth = growth([r[0] for r in rows], [r[1] for r in rows])
+            memory_growth = growth([r[0] for r in rows], [r[2] for r in rows])
+            if time_growth is not None:
+                nonlinear = [what for what, k in (("time", time_growth), ("memory", memory_growth))
+                             if k is not None and k > NONLINEAR]
+                print(f"  Growth: time ~ size^{time_growth:.2f}, memory ~ size^{memory_growth:.2f}"
+                      + (f"  NON-LINEAR {' and '.join(nonlinear)}" if nonlinear else ""))
+                if nonlinear:
+                    flagged.append(name)
+
+        print()
+        print(f"Chapter counts ({sizes[0] / 2 ** 20:g} MB books)")
+        for name, style, noise in CHAPTER_CHECKS:
+            if name not in names:
+                continue
+            path = Path(book_dir) / f"check_{style}_{noise}.txt"
+            book = generate_book(path, sizes[0], style, noise, args.encoding)
+            result = run_splitter(name, book["path"], style, args.timeout)
+            found = result[5] if result else 0
+            expected = len(book["chapters"])
+            print(f"  {name:<10} {style:<8} {noise:<6} {found:>5}/{expected}"
+                  + ("" if found == expected else "  WRONG"))
+            if found != expected:
+                miscounted.append(f"{name} ({style}, {noise})")
+
+    print()
+    print(f"Non-linear: {', '.join(flagged)}" if flagged else "Every splitter scaled linearly")
+    print(f"Wrong chapter count: {', '.join(miscounted)}" if miscounted else "Every chapter was found")
+    return not miscounted
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Speed Variant Benchmark
+Compares time-stretching a finished render with synthesizing it again
+
+Usage:
+  python -m benchmarks.time_stretch <render.wav> [text_file voice] [--speeds 1.2,1.5]
+"""
+
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from time_stretch import stretch_file
+from wav_io import read_wav_info
+
+
+def time_stretching(wav_file, speeds):
+    """Return {speed: seconds} spent time-stretching wav_file to each speed"""
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for speed in speeds:
+            start_time = time.perf_counter()
+            stretch_file(wav_file, Path(tmp) / f"variant_{speed:g}.wav", speed)
+            results[speed] = time.perf_counter() - start_time
+    return results
+
+
+def time_resynthesis(text_file, voice, speeds):
+    """Return {speed: seconds} spent rendering text_file again at each speed"""
+
+    from text_to_audio import convert_text_to_audio
+
+    results = {}
+    for speed in speeds:
+        output_name = f"bench_resynth_{speed:g}x"
+        start_time = time.perf_counter()
+        ok = convert_text_to_audio(text_file, voice, output_name, speed)
+        results[speed] = time.perf_counter() - start_time if ok else None
+        output_file = Path("audio_output") / f"{output_name}.wav"
+        if output_file.exists():
+            os.remove(output_file)
+    return results
+
+
+def main():
+    """Run the benchmark and print a comparison table"""
+
+    args = sys.argv[1:]
+    speeds = [1.2, 1.5]
+    if "--speeds" in args:
+        i = args.index("--speeds")
+        speeds = [float(s) for s in args[i + 1].split(",")]
+        del args[i:i + 2]
+
+    if not args:
+        print(__doc__.strip())
+        return False
+
+    wav_file = args[0]
+    info = read_wav_info(wav_file)
+    print(f"Source: {wav_file} ({info.duration:.1f} seconds of audio)")
+    print("-" * 50)
+
+    stretch = time_stretching(wav_file, speeds)
+    resynth = {}
+    if len(args) >= 3:
+        resynth = time_resynthesis(args[1], args[2], speeds)
+
+    print(f"{'Speed':>6} {'Stretch (s)':>12} {'x realtime':>11} {'Re-synth (s)':>13} {'Saving':>8}")
+    for speed in speeds:
+        s = stretch[speed]
+        line = f"{speed:>5g}x {s:>12.2f} {info.duration / s:>11.0f}"
+        r = resynth.get(speed)
+        if r:
+            line += f" {r:>13.1f} {r / s:>7.0f}x"
+        print(line)
+    return True
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Build Database
+Remembers what every output was rendered from, so batches only redo stale files
+
+Each output in audio_output is recorded with a build key: a hash of the
+input text, the voice, speed, engine and engine version, and the settings
+that shape the output file (OUTPUT_FORMAT, OUTPUT_SAMPLE_RATE and the
+post-processing settings), and the pronunciation lexicon if there is one. A file is up to date when its output still
+exists unchanged and its key matches, no matter whether the input was
+moved to completed/ and copied back, or config.txt was edited in between.
+
+Input hashes are cached by size and modification time, so checking a file
+whose input has not been touched costs two stat calls and no reading.
+"""
+
+import hashlib
+import json
+import os
+import sys
+from pathlib import Path
+
+DB_FILE = "audio_output/.build.json"
+DB_VERSION = 1
+
+# Settings besides voice and speed that change the rendered file
+OUTPUT_SETTINGS = ("OUTPUT_FORMAT", "OUTPUT_SAMPLE_RATE", "POSTPROCESS")
+POSTPROCESS_SETTINGS = ("SENTENCE_GAP_MS", "SILENCE_THRESHOLD_DB", "TARGET_LOUDNESS")
+
+
+def build_settings(config, voice, speed, lexicon=None):
+    """
+    Collect everything besides the text that decides what an output sounds like
+
+    Args:
+        config (dict): Settings from tts_config.load_config
+        voice (str): Voice used
+        speed (float): Speed used
+        lexicon (Lexicon): Pronunciation lexicon applied to the text
+
+    Returns:
+        dict: Settings that go into every build key of a run
+    """
+
+    from tts_config import get_bool
+    from tts_engine import ENGINES, engine_name, engine_version
+
+    engine = engine_name(config)
+    settings = {
+        "voice": voice,
+        "speed": float(speed),
+        "engine": engine,
+        "engine_version": engine_version(engine),
+    }
+    keys = OUTPUT_SETTINGS + getattr(ENGINES[engine], "settings", ())
+    if get_bool(config, "POSTPROCESS"):
+        keys += POSTPROCESS_SETTINGS
+    for key in keys:
+        settings[key] = config.get(key, "")
+    if lexicon:
+        settings["lexicon"] = lexicon.digest
+    return settings
+
+
+def build_key(text_hash, settings):
+    """Hash of an input's text hash and the settings it is rendered with"""
+
+    payload = json.dumps({"text": text_hash, **settings}, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _stat(path):
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+class BuildDB:
+    """The outputs rendered so far and the keys they were built with"""
+
+    def __init__(self, db_file=DB_FILE):
+        self.db_file = Path(db_file)
+        self.inputs = {}
+        self.outputs = {}
+        try:
+            with open(self.db_file, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") == DB_VERSION:
+                self.inputs = data["inputs"]
+                self.outputs = data["outputs"]
+        except (FileNotFoundError, ValueError, KeyError):
+            pass
+
+    def input_hash(self, input_file):
+        """SHA-256 of an input file, re-read only if its size or time changed"""
+
+        path = str(Path(input_file).resolve())
+        stat = _stat(path)
+        cached = self.inputs.get(path)
+        if cached and cached["stat"] == stat:
+            return cached["sha256"]
+
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+        self.inputs[path] = {"stat": stat, "sha256": digest.hexdigest()}
+        return self.inputs[path]["sha256"]
+
+    def is_fresh(self, output_file, key):
+        """True if output_file exists as recorded and was built with key"""
+
+        entry = self.outputs.get(str(output_file))
+        if not entry or entry["key"] != key:
+            return False
+        try:
+            return _stat(output_file) == entry["stat"]
+        except FileNotFoundError:
+            return False
+
+    def status(self, output_file, key):
+        """'up to date', 'stale' (rendered with other text or settings) or 'new'"""
+
+        if self.is_fresh(output_file, key):
+            return "up to date"
+        return "stale" if Path(output_file).exists() else "new"
+
+    def record(self, output_file, key):
+        """Remember that output_file was just built with key"""
+
+        self.outputs[str(output_file)] = {"key": key, "stat": _stat(output_file)}
+
+    def forget(self, output_file):
+        """Drop an output's record, so the next batch renders it again"""
+
+        self.outputs.pop(str(output_file), None)
+
+    def save(self):
+        self.db_file.parent.mkdir(parents=True, exist_ok=True)
+        partial = self.db_file.with_name(self.db_file.name + ".part")
+        with open(partial, "w", encoding="utf-8") as f:
+            json.dump({"version": DB_VERSION, "inputs": self.inputs, "outputs": self.outputs}, f, indent=1)
+        os.replace(partial, self.db_file)
+
+
+def main():
+    """Main function - show which outputs in the database are still present"""
+
+    db = BuildDB(sys.argv[1] if len(sys.argv) > 1 else DB_FILE)
+    if not db.outputs:
+        print(f"No builds recorded in {db.db_file}")
+        return True
+
+    for output_file, entry in sorted(db.outputs.items()):
+        state = "ok" if db.is_fresh(output_file, entry["key"]) else "changed or missing"
+        print(f"  {output_file:<60} {entry['key'][:12]}  {state}")
+    print(f"{len(db.outputs)} outputs, {len(db.inputs)} inputs cached")
+    return True
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+"""
+Bulk Book Splitter
+Splits every book under an uploads tree (tempuploads/<user>/<book>.txt) in parallel
+
+EPUB uploads (<book>.epub) are split along their own table of contents
+by epub_reader instead of by searching the text for chapter headings.
+
+Books are split by a pool of worker processes, one book per task. A book
+that was split before, whose source has not changed since (same size and
+time, or failing that the same SHA-256) and whose chapter files are all
+still there, is skipped. Every run writes a summary report to
+split_report.json in the output folder.
+
+Usage:
+  python bulk_split.py [root] [--output split_output] [--workers N] [--manifest]
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from split_manifest import read_book, safe_name
+
+# Compiled once when the module is imported; every worker process imports
+# the module once, so the patterns are shared by all books it splits
+CHAPTER_PATTERNS = [
+    ("Chapter N", re.compile(r'^[ \t]*(Chapter[ \t]+\d+)\b', re.MULTILINE)),
+    ("CHAPTER N", re.compile(r'^[ \t]*(CHAPTER[ \t]+\d+)\b', re.MULTILINE)),
+    ("Chapter roman", re.compile(r'^[ \t]*(Chapter[ \t]+[IVXLC]+)\b', re.MULTILINE)),
+    ("CHAPTER roman", re.compile(r'^[ \t]*(CHAPTER[ \t]+[IVXLC]+)\b', re.MULTILINE)),
+    ("Part N", re.compile(r'^[ \t]*(Part[ \t]+\d+)\b', re.MULTILINE)),
+    ("PART N", re.compile(r'^[ \t]*(PART[ \t]+\d+)\b', re.MULTILINE)),
+]
+
+STATE_FILE = ".split_state.json"
+REPORT_FILE = "split_report.json"
+
+
+def find_books(root):
+    """Return the books directly inside each user folder under root"""
+
+    books = []
+    for user_dir in sorted(p for p in Path(root).iterdir() if p.is_dir()):
+        books.extend(sorted(p for p in user_dir.iterdir() if p.suffix.lower() in (".txt", ".epub")))
+    return books
+
+
+def file_sha256(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def clear_outputs(output_dir):
+    """Delete the chapter files and manifest of an earlier split of a book"""
+
+    if output_dir.is_dir():
+        for path in output_dir.iterdir():
+            if path.is_file() and path.suffix in (".txt", ".json"):
+                path.unlink()
+
+
+def outputs_exist(output_dir, previous):
+    """Whether everything an earlier split of a book wrote is still in output_dir"""
+
+    outputs = previous.get("outputs")
+    return bool(outputs) and all((output_dir / name).is_file() for name in outputs)
+
+
+def find_chapter_spans(content):
+    """
+    Pick the chapter pattern with the most line-start matches and return its spans
+
+    Returns:
+        tuple: (pattern name, [(title, start, end), ...]); no spans if nothing fits
+    """
+
+    best_name, best_matches = None, []
+    for name, pattern in CHAPTER_PATTERNS:
+        matches = list(pattern.finditer(content))
+        if len(matches) > len(best_matches):
+            best_name, best_matches = name, matches
+
+    if len(best_matches) < 2:
+        return None, []
+
+    spans = []
+    for i, match in enumerate(best_matches):
+        end = best_matches[i + 1].start() if i + 1 < len(best_matches) else len(content)
+        spans.append((match.group(1), match.start(), end))
+    return best_name, spans
+
+
+def split_one(task):
+    """
+    Split one book (runs in a worker process)
+
+    Args:
+        task (dict): book, output folder, previous hash and manifest flag
+
+    Returns:
+        dict: Result row for the summary report
+    """
+
+    from memprofile import job
+
+    with job(f"split-{Path(task['book']).stem}", Path(task["output"]) / ".memory"):
+        return _split_one(task)
+
+
+def _split_one(task):
+    from memprofile import mark
+
+    start_time = time.perf_counter()
+    book = Path(task["book"])
+    result = {"book": str(book), "size": book.stat().st_size}
+
+    mark("hash")
+    source_hash = file_sha256(book)
+    result["sha256"] = source_hash
+    if source_hash == task.get("previous_hash"):
+        result.update(status="unchanged", seconds=time.perf_counter() - start_time)
+        return result
+
+    if book.suffix.lower() == ".epub":
+        return _split_epub(book, Path(task["output"]), task["manifest"], result, start_time)
+
+    mark("read")
+    content, encoding = read_book(book)
+    if content is None:
+        result.update(status="unreadable", seconds=time.perf_counter() - start_time)
+        return result
+
+    mark("find chapters")
+    pattern_name, spans = find_chapter_spans(content)
+    if not spans:
+        result.update(status="no chapters found", seconds=time.perf_counter() - start_time)
+        return result
+
+    mark("write")
+    output_dir = Path(task["output"])
+    clear_outputs(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    if task["manifest"]:
+        from split_manifest import build_manifest
+
+        manifest = build_manifest(book, encoding, spans, content)
+        outputs = [f"{book.stem}.json"]
+        with open(output_dir / outputs[0], 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=2)
+    else:
+        outputs = []
+        for index, (title, start, end) in enumerate(spans, 1):
+            outputs.append(f"{index:02d}_{safe_name(title)}.txt")
+            with open(output_dir / outputs[-1], 'w', encoding='utf-8') as f:
+                f.write(content[start:end].strip())
+
+    result.update(status="split", pattern=pattern_name, chapters=len(spans), outputs=outputs,
+                  words=len(content.split()), seconds=time.perf_counter() - start_time)
+    return result
+
+
+def _split_epub(book, output_dir, manifest, result, start_time):
+    import zipfile
+    from xml.etree.ElementTree import ParseError
+
+    import epub_reader
+
+    outputs = []
+    try:
+        if manifest:
+            data = epub_reader.build_manifest(book)
+            chapters = [(c["title"], c["words"]) for c in data["chapters"]]
+        else:
+            chapters = []
+            for chapter in epub_reader.iter_chapters(book):
+                if not outputs:
+                    clear_outputs(output_dir)
+                    output_dir.mkdir(parents=True, exist_ok=True)
+                outputs.append(f"{chapter.index:02d}_{safe_name(chapter.title)}.txt")
+                with open(output_dir / outputs[-1], 'w', encoding='utf-8') as f:
+                    f.write(chapter.text)
+                chapters.append((chapter.title, len(chapter.text.split())))
+    except (OSError, ValueError, KeyError, zipfile.BadZipFile, ParseError):
+        result.update(status="unreadable", seconds=time.perf_counter() - start_time)
+        return result
+    if not chapters:
+        result.update(status="no chapters found", seconds=time.perf_counter() - start_time)
+        return result
+
+    if manifest:
+        clear_outputs(output_dir)
+        output_dir.mkdir(parents=True, exist_ok=True)
+        outputs = [f"{book.stem}.json"]
+        with open(output_dir / outputs[0], 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=2)
+    result.update(status="split", pattern="EPUB table of contents", chapters=len(chapters), outputs=outputs,
+                  words=sum(words for _, words in chapters), seconds=time.perf_counter() - start_time)
+    return result
+
+
+def bulk_split(root="tempuploads", output_root="split_output", workers=None, manifest=False):
+    """
+    Split every book under root with a process pool
+
+    Args:
+        root (str): Uploads tree with one folder per user
+        output_root (str): Chapters go to output_root/<user>/<book>/
+        workers (int): Worker processes (default: one per CPU core)
+        manifest (bool): Write split manifests instead of chapter files
+
+    Returns:
+        dict: The summary report
+    """
+
+    output_root = Path(output_root)
+    output_root.mkdir(parents=True, exist_ok=True)
+    state_file = output_root / STATE_FILE
+    state = json.loads(state_file.read_text()) if state_file.exists() else {}
+
+    books = find_books(root)
+    tasks = []
+    results = []
+    for book in books:
+        stat = book.stat()
+        output_dir = output_root / book.parent.name / book.stem
+        previous = state.get(str(book), {})
+        if previous.get("manifest", False) != manifest or not outputs_exist(output_dir, previous):
+            # Split the other way last time, or its chapters were deleted
+            previous = {}
+        # Same size and modification time: skip without even hashing
+        if previous.get("size") == stat.st_size and previous.get("mtime") == stat.st_mtime:
+            results.append({"book": str(book), "size": stat.st_size, "status": "unchanged", "seconds": 0.0})
+            continue
+        tasks.append({
+            "book": str(book),
+            "output": str(output_dir),
+            "previous_hash": previous.get("sha256"),
+            "manifest": manifest,
+        })
+
+    workers = workers or os.cpu_count() or 1
+    print(f"Found {len(books)} books under {root}; {len(tasks)} to check with {workers} workers")
+
+    start_time = time.perf_counter()
+    if tasks:
+        with ProcessPoolExecutor(max_workers=min(workers, len(tasks))) as pool:
+            for result in pool.map(split_one, tasks):
+                results.append(result)
+                print(f"  {result['status']:<18} {result['book']}")
+                if result["status"] in ("split", "unchanged"):
+                    # Unchanged books were split before, with these outputs
+                    outputs = result.get("outputs") or state[result["book"]]["outputs"]
+                    stat = os.stat(result["book"])
+                    state[result["book"]] = {"size": stat.st_size, "mtime": stat.st_mtime,
+                                             "sha256": result["sha256"], "manifest": manifest,
+                                             "outputs": outputs}
+                else:
+                    # Only a book that split is skipped next time
+                    state.pop(result["book"], None)
+    elapsed = time.perf_counter() - start_time
+
+    state_file.write_text(json.dumps(state, indent=2))
+    processed = sum(r["size"] for r in results if r["status"] == "split")
+    report = {
+        "root": str(root),
+        "workers": workers,
+        "seconds": elapsed,
+        "books": len(books),
+        "split": sum(1 for r in results if r["status"] == "split"),
+        "unchanged": sum(1 for r in results if r["status"] == "unchanged"),
+        "failed": sum(1 for r in results if r["status"] not in ("split", "unchanged")),
+        "megabytes_per_second": processed / 1e6 / elapsed if elapsed > 0 else 0.0,
+        "results": sorted(results, key=lambda r: r["book"]),
+    }
+    (output_root / REPORT_FILE).write_text(json.dumps(report, indent=2))
+    return report
+
+
+def main():
+    """Main function with command line interface"""
+
+    parser = argparse.ArgumentParser(description="Split every book under an uploads tree in parallel")
+    parser.add_argument("root", nargs="?", default="tempuploads", help="Uploads tree (default: tempuploads)")
+    parser.add_argument("--output", default="split_output", help="Output folder (default: split_output)")
+    parser.add_argument("--workers", type=int, help="Worker processes (default: one per CPU core)")
+    parser.add_argument("--manifest", action="store_true", help="Write split manifests instead of chapter files")
+    args = parser.parse_args()
+
+    if not Path(args.root).is_dir():
+        print(f"Folder not found: {args.root}")
+        return False
+
+    report = bulk_split(args.root, args.output, args.workers, args.manifest)
+    print("-" * 50)
+    print(f"{report['split']} split, {report['unchanged']} unchanged, {report['failed']} without chapters or unreadable")
+    print(f"Took {report['seconds']:.1f} seconds ({report['megabytes_per_second']:.1f} MB/s)")
+    print(f"Report: {Path(args.output) / REPORT_FILE}")
+    return report["failed"] == 0
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+"""
+Draft Renders
+Quick, low-fidelity renders for proofreading a book by ear
+
+A draft uses the cheapest settings there are: the onnx engine with the
+int8 model when it is there (DRAFT_ENGINE/DRAFT_ONNX_MODEL pick others),
+no post-processing, several chunks synthesized at once on every CPU, and
+8-bit mu-law at 16000 Hz on disk (a third of the size of a 24000 Hz int16
+file). The streamer engine loads the model again for every run and uses
+every core by itself, so it drafts one batch at a time and is not much
+faster than a final render. Drafts go to audio_output/drafts/ and never
+touch the finished outputs, the build database or the inputs.
+
+Drafts are rendered incrementally (see incremental.py). With INCREMENTAL=on
+the final render splits and packs sentences the same way, so draft chunk N
+holds exactly the sentences of final chunk N, and after fixing the text the
+next draft and the final render both re-synthesize only the chunks that
+changed; with INCREMENTAL=off the final render has no chunks of its own.
+The timestamp index next to each draft finds a sentence by its time.
+
+Usage:
+  python draft.py <text file or folder> [voice] [speed]
+"""
+
+import sys
+import time
+from pathlib import Path
+
+from tts_config import get_float, load_config
+
+DRAFT_DIR = "drafts"
+DEFAULT_ENGINE = "onnx"
+DEFAULT_FORMAT = "mulaw"
+DEFAULT_SAMPLE_RATE = 16000
+
+
+def int8_model(model):
+    """The int8-quantized model next to a float32 one (kokoro-v1.0.onnx -> kokoro-v1.0.int8.onnx)"""
+
+    model = Path(model)
+    if model.name.endswith(".int8.onnx"):
+        return model
+    return model.with_name(f"{model.stem}.int8.onnx")
+
+
+def draft_workers(config):
+    """Chunks synthesized at once (DRAFT_WORKERS, default one per CPU)"""
+
+    from placement import available_cpus
+
+    workers = get_float(config, "DRAFT_WORKERS")
+    return max(int(workers), 1) if workers else len(available_cpus())
+
+
+def draft_config(config):
+    """
+    Settings for draft renders, derived from config.txt
+
+    Returns:
+        dict: config with the engine, model, workers, thread count and
+            output stage switched to the draft settings
+    """
+
+    from placement import available_cpus
+    from tts_engine import ENGINES, engine_name
+
+    draft = dict(config)
+    draft["ENGINE"] = config.get("DRAFT_ENGINE", "").strip() or DEFAULT_ENGINE
+    # Engines that cannot run chunks side by side get one at a time
+    workers = draft_workers(config) if ENGINES[engine_name(draft)].concurrent else 1
+    draft["DRAFT_WORKERS"] = str(workers)
+    model = config.get("DRAFT_ONNX_MODEL", "").strip()
+    if not model:
+        quantized = int8_model(config.get("ONNX_MODEL") or "models/kokoro-v1.0.onnx")
+        model = str(quantized) if quantized.exists() else config.get("ONNX_MODEL", "")
+    draft["ONNX_MODEL"] = model
+    # Parallel chunks rather than parallel operators inside one chunk
+    draft["ONNX_THREADS"] = str(max(len(available_cpus()) // workers, 1))
+    draft["OUTPUT_FORMAT"] = config.get("DRAFT_FORMAT", "").strip() or DEFAULT_FORMAT
+    draft["OUTPUT_SAMPLE_RATE"] = config.get("DRAFT_SAMPLE_RATE", "").strip() or str(DEFAULT_SAMPLE_RATE)
+    draft["POSTPROCESS"] = "off"
+    return draft
+
+
+def render_draft(input_file, engine, config, output_dir, workers=1, lexicon=None):
+    """
+    Render a draft of one text file
+
+    Args:
+        input_file (Path): Chapter text file
+        engine: Engine from tts_engine.get_engine, created with draft_config
+        config (dict): Settings from draft_config
+        output_dir (Path): Folder for the drafts
+        workers (int): Chunks synthesized at once
+        lexicon (Lexicon): Pronunciation lexicon to apply first
+
+    Returns:
+        dict: output, reused and synthesized sentences, seconds of audio,
+            seconds taken and the real-time factor (audio / time taken)
+    """
+
+    from incremental import render_incremental
+    from memprofile import job
+    from wav_io import read_wav_info
+
+    input_file = Path(input_file)
+    output_file = Path(output_dir) / f"{input_file.stem}.wav"
+    output_file.parent.mkdir(parents=True, exist_ok=True)
+    with open(input_file, "r", encoding="utf-8") as f:
+        source_text = f.read()
+    text = lexicon.apply(source_text)[0] if lexicon else source_text
+
+    start_time = time.perf_counter()
+    with job(f"draft-{input_file.stem}", Path(output_dir) / ".memory"):
+        counts = render_incremental(input_file, output_file, engine, text=text, config=config,
+                                    source_text=source_text, chapter={"title": input_file.name},
+                                    workers=workers)
+    seconds = time.perf_counter() - start_time
+
+    audio_seconds = 0.0
+    if output_file.exists():
+        with open(output_file, "rb") as f:
+            info = read_wav_info(f)
+        audio_seconds = info.frames / info.sample_rate
+    return dict(counts, output=output_file, audio_seconds=audio_seconds, seconds=seconds,
+                speedup=audio_seconds / max(seconds, 1e-6))
+
+
+def draft_files(inputs, voice, speed, output_dir=None, config=None):
+    """
+    Render drafts of text files with one engine
+
+    Args:
+        inputs (list): Text files
+        voice (str): Voice to use
+        speed (float): Speech speed
+        output_dir (str): Folder for the drafts (default: audio_output/drafts)
+        config (dict): Settings from tts_config.load_config
+
+    Returns:
+        list: Results of render_draft, one per file that rendered
+    """
+
+    from lexicon import load_lexicon
+    from memprofile import stage
+    from tts_engine import get_engine
+
+    config = config if config is not None else load_config()
+    output_dir = Path(output_dir or Path("audio_output") / DRAFT_DIR)
+    settings = draft_config(config)
+    workers = int(settings["DRAFT_WORKERS"])
+    with stage("load engine"):
+        try:
+            engine = get_engine(settings, voice, speed)
+        except (FileNotFoundError, ImportError) as e:
+            print(f"Error: {e} (drafts use the {settings['ENGINE']} engine; DRAFT_ENGINE picks another)")
+            return []
+    if engine.name == "streamer":
+        print("Warning: the streamer engine loads the model for every run and drafts little faster "
+              "than a final render; DRAFT_ENGINE=onnx is much quicker")
+    print(f"Draft: {engine.name} engine, {'one chunk at a time' if workers == 1 else f'{workers} chunks at once'}, "
+          f"{settings['OUTPUT_FORMAT']} at {settings['OUTPUT_SAMPLE_RATE']} Hz -> {output_dir}")
+
+    results = []
+    for input_file in inputs:
+        input_file = Path(input_file)
+        print(f"Drafting '{input_file.name}'...")
+        try:
+            result = render_draft(input_file, engine, settings, output_dir, workers,
+                                  load_lexicon(config, input_file.parent))
+        except Exception as e:
+            print(f"Error: {e}")
+            continue
+        print(f"Draft saved to {result['output']}: {result['audio_seconds'] / 60:.1f} minutes of audio "
+              f"in {result['seconds']:.1f} seconds ({result['speedup']:.1f}x real time)")
+        results.append(result)
+    return results
+
+
+def main():
+    """Main function with command line interface"""
+
+    if len(sys.argv) < 2:
+        print("Draft Renders")
+        print("=" * 40)
+        print("Usage:")
+        print("  python draft.py <text file or folder> [voice] [speed]")
+        print()
+        print("Drafts go to audio_output/drafts/ (see DRAFT_* in config.txt).")
+        return False
+
+    source = Path(sys.argv[1])
+    if not source.exists():
+        print(f"Error: '{source}' not found!")
+        return False
+    inputs = sorted(source.glob("*.txt")) if source.is_dir() else [source]
+    if not inputs:
+        print(f"No .txt files found in {source}")
+        return True
+
+    config = load_config()
+    voice = sys.argv[2] if len(sys.argv) > 2 else config["VOICE"]
+    speed = float(sys.argv[3]) if len(sys.argv) > 3 else get_float(config, "SPEED", 1.0)
+    results = draft_files(inputs, voice, speed, config=config)
+    if len(results) > 1:
+        audio = sum(r["audio_seconds"] for r in results)
+        seconds = sum(r["seconds"] for r in results)
+        print(f"{len(results)} drafts, {audio / 60:.1f} minutes of audio in {seconds:.1f} seconds "
+              f"({audio / max(seconds, 1e-6):.1f}x real time)")
+    return len(results) == len(inputs)
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
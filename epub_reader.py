@@ -0,0 +1,543 @@
+#!/usr/bin/env python3
+"""
+EPUB Reader
+Reads the chapters of an EPUB straight from its XHTML, with no text extraction step
+
+The splitters have to guess where chapters begin in text flattened from a
+PDF. An EPUB already says: its package file (OPF) lists the documents in
+reading order (the spine) and its table of contents (nav.xhtml, or
+toc.ncx in EPUB 2) names the ones that begin a chapter. A spine document
+the table of contents does not list continues the chapter before it, and
+an entry pointing at an anchor (chapter.xhtml#part2) starts a chapter at
+that element, so books with several chapters per document split too.
+
+Documents are decompressed from the zip as a stream and fed to an
+incremental HTML parser one block at a time, so only the chapter being
+read is ever held in memory, however large the book is. Footnote
+references, footnotes and page-break markers are left out of the text.
+
+Chapters are written as NN_Title.txt files or as a split manifest, like
+the other splitters, and can be converted with the same commands.
+
+Usage:
+  python epub_reader.py <book.epub> [output_folder] [--manifest manifest.json]
+"""
+
+import codecs
+import hashlib
+import os
+import posixpath
+import re
+import sys
+import xml.etree.ElementTree as ET
+import zipfile
+from html.parser import HTMLParser
+from pathlib import Path
+from urllib.parse import unquote
+
+from split_manifest import MANIFEST_VERSION, safe_name
+from streaming_splitter import Chapter
+
+READ_BLOCK = 1 << 16
+
+# Tags that end a paragraph of text
+BLOCK_TAGS = {
+    "address", "article", "aside", "blockquote", "br", "dd", "div", "dl", "dt", "figcaption",
+    "figure", "footer", "h1", "h2", "h3", "h4", "h5", "h6", "header", "hr", "li", "nav", "ol",
+    "p", "pre", "section", "table", "td", "th", "tr", "ul",
+}
+SKIP_TAGS = {"head", "script", "style", "svg", "math"}
+# HTML elements that never have an end tag (<br>, <meta charset=...>)
+VOID_TAGS = {
+    "area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "param", "source",
+    "track", "wbr",
+}
+SKIP_TYPES = {"noteref", "footnote", "endnote", "rearnote", "pagebreak"}
+HEADING_TAGS = {"h1", "h2", "h3"}
+
+_XML_ENCODING = re.compile(rb'^<\?xml[^>]*encoding=["\']([\w.-]+)["\']')
+_SPACE = re.compile(r"\s+")
+
+
+def _local(tag):
+    """Tag name without its XML namespace"""
+
+    return tag.rsplit("}", 1)[-1]
+
+
+def _resolve(base_dir, href):
+    """Zip member name of an href relative to base_dir (fragment dropped)"""
+
+    return posixpath.normpath(posixpath.join(base_dir, unquote(href.split("#", 1)[0])))
+
+
+def _fragment(href):
+    """The anchor id an href points at, or None for the top of the document"""
+
+    return unquote(href.split("#", 1)[1]) or None if "#" in href else None
+
+
+class TextExtractor(HTMLParser):
+    """
+    Incremental XHTML to plain text converter
+
+    Text is collected into paragraphs, split at block-level tags, with
+    whitespace collapsed. The first h1-h3 heading and the document title
+    are kept to name chapters the table of contents does not. Elements
+    whose id is one of anchors start a new paragraph, and marks records
+    (paragraph index, id) for each, so a document can be cut at them.
+    """
+
+    def __init__(self, anchors=()):
+        super().__init__(convert_charrefs=True)
+        self.anchors = set(anchors)
+        self.marks = []
+        self.paragraphs = []
+        self.heading = None
+        self.title = None
+        self._current = []
+        self._skip_depth = 0
+        self._in_title = False
+        self._heading_depth = 0
+        self._heading_text = []
+
+    def _end_paragraph(self):
+        text = _SPACE.sub(" ", "".join(self._current)).strip()
+        if text:
+            self.paragraphs.append(text)
+        self._current = []
+
+    def _mark(self, tag, attributes):
+        anchor = attributes.get("id") or (attributes.get("name") if tag == "a" else None)
+        if anchor in self.anchors:
+            self._end_paragraph()
+            self.marks.append((len(self.paragraphs), anchor))
+
+    def handle_starttag(self, tag, attrs):
+        if tag in VOID_TAGS:
+            # No end tag will follow, so they must not open a level
+            self.handle_startendtag(tag, attrs)
+            return
+        if tag == "title":
+            # The document title is inside <head>, which is otherwise skipped
+            self._in_title = True
+        if self._skip_depth:
+            self._skip_depth += 1
+            return
+        attributes = dict(attrs)
+        if tag in SKIP_TAGS or SKIP_TYPES.intersection((attributes.get("epub:type") or "").split()):
+            self._skip_depth = 1
+            return
+        self._mark(tag, attributes)
+        if tag in BLOCK_TAGS:
+            self._end_paragraph()
+        if tag in HEADING_TAGS and self.heading is None:
+            self._heading_depth = 1
+        elif self._heading_depth:
+            self._heading_depth += 1
+
+    def handle_startendtag(self, tag, attrs):
+        if self._skip_depth:
+            return
+        self._mark(tag, dict(attrs))
+        if tag in BLOCK_TAGS:
+            self._end_paragraph()
+            if self._heading_depth:
+                self._heading_text.append(" ")
+
+    def handle_endtag(self, tag):
+        if tag in VOID_TAGS:
+            # An XHTML <br></br> closes nothing that was counted
+            return
+        if tag == "title":
+            self._in_title = False
+        if self._skip_depth:
+            self._skip_depth -= 1
+            return
+        if self._heading_depth:
+            self._heading_depth -= 1
+            if not self._heading_depth:
+                self.heading = _SPACE.sub(" ", "".join(self._heading_text)).strip() or None
+        if tag in BLOCK_TAGS:
+            self._end_paragraph()
+
+    def handle_data(self, data):
+        if self._in_title:
+            self.title = (self.title or "") + data
+        if self._skip_depth:
+            return
+        if self._heading_depth:
+            self._heading_text.append(data)
+        self._current.append(data)
+
+    def close(self):
+        super().close()
+        self._end_paragraph()
+        if self.title:
+            self.title = _SPACE.sub(" ", self.title).strip() or None
+
+
+def extract_member(zf, member, digest=None, anchors=()):
+    """
+    Decompress and parse one document of the book block by block
+
+    Args:
+        zf (ZipFile): The open book
+        member (str): Document to read
+        digest: hashlib object updated with the raw bytes
+        anchors (set): Element ids to record the paragraph positions of
+
+    Returns:
+        TextExtractor with the document's paragraphs, heading, title and marks
+    """
+
+    parser = TextExtractor(anchors)
+    decoder = None
+    with zf.open(member) as f:
+        while True:
+            block = f.read(READ_BLOCK)
+            if digest is not None:
+                digest.update(block)
+            if decoder is None:
+                match = _XML_ENCODING.match(block)
+                encoding = match.group(1).decode("ascii") if match else "utf-8"
+                try:
+                    decoder = codecs.getincrementaldecoder(encoding)(errors="replace")
+                except LookupError:
+                    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+            parser.feed(decoder.decode(block, final=not block))
+            if not block:
+                break
+    parser.close()
+    return parser
+
+
+def _package_path(zf):
+    with zf.open("META-INF/container.xml") as f:
+        for element in ET.parse(f).iter():
+            if _local(element.tag) == "rootfile" and element.get("full-path"):
+                return element.get("full-path")
+    raise ValueError("META-INF/container.xml names no package file")
+
+
+def _nav_entries(zf, member):
+    """[(document, anchor id or None, title)] from an EPUB 3 navigation document's toc"""
+
+    class NavParser(HTMLParser):
+        def __init__(self):
+            super().__init__(convert_charrefs=True)
+            self.entries = []
+            self.in_toc = 0
+            self.href = None
+            self.text = []
+
+        def handle_starttag(self, tag, attrs):
+            attributes = dict(attrs)
+            if tag == "nav" and "toc" in (attributes.get("epub:type") or "").split():
+                self.in_toc = 1
+            elif tag == "nav" and self.in_toc:
+                self.in_toc += 1
+            elif tag == "a" and self.in_toc and attributes.get("href"):
+                self.href, self.text = attributes["href"], []
+
+        def handle_endtag(self, tag):
+            if tag == "nav" and self.in_toc:
+                self.in_toc -= 1
+            elif tag == "a" and self.href is not None:
+                document = _resolve(posixpath.dirname(member), self.href)
+                self.entries.append((document, _fragment(self.href), _SPACE.sub(" ", "".join(self.text)).strip()))
+                self.href = None
+
+        def handle_data(self, data):
+            if self.href is not None:
+                self.text.append(data)
+
+    parser = NavParser()
+    parser.feed(zf.read(member).decode("utf-8", errors="replace"))
+    parser.close()
+    return parser.entries
+
+
+def _ncx_entries(zf, member):
+    """[(document, anchor id or None, title)] from an EPUB 2 toc.ncx"""
+
+    entries = []
+    with zf.open(member) as f:
+        # Document order, so an outer navPoint comes before the ones inside it
+        for element in ET.parse(f).iter():
+            if _local(element.tag) != "navPoint":
+                continue
+            label = next((e.text for e in element.iter() if _local(e.tag) == "text"), None)
+            content = next((e for e in element if _local(e.tag) == "content"), None)
+            if content is not None and content.get("src"):
+                document = _resolve(posixpath.dirname(member), content.get("src"))
+                entries.append((document, _fragment(content.get("src")), _SPACE.sub(" ", label or "").strip()))
+    return entries
+
+
+def read_package(zf):
+    """
+    Read the reading order and table of contents of an open book
+
+    Returns:
+        tuple: ([spine documents in reading order],
+            {document: [(anchor id or None, toc title), ...] in toc order})
+    """
+
+    opf = _package_path(zf)
+    base = posixpath.dirname(opf)
+    with zf.open(opf) as f:
+        root = ET.parse(f).getroot()
+
+    items = {}
+    nav = None
+    for element in root.iter():
+        if _local(element.tag) == "item" and element.get("href"):
+            items[element.get("id")] = (_resolve(base, element.get("href")), element.get("media-type", ""))
+            if "nav" in (element.get("properties") or "").split():
+                nav = items[element.get("id")][0]
+
+    spine = next((e for e in root.iter() if _local(e.tag) == "spine"), None)
+    if spine is None:
+        raise ValueError(f"{opf} has no spine")
+    documents = [items[ref.get("idref")][0] for ref in spine
+                 if _local(ref.tag) == "itemref" and ref.get("idref") in items and ref.get("linear") != "no"]
+
+    entries = []
+    try:
+        if nav:
+            entries = _nav_entries(zf, nav)
+        elif spine.get("toc") in items:
+            entries = _ncx_entries(zf, items[spine.get("toc")][0])
+    except (KeyError, ET.ParseError) as e:
+        print(f"Warning: could not read the table of contents ({e}); using one chapter per document")
+
+    toc = {}
+    for document, anchor, title in entries:
+        # The first (outermost) entry for a place wins
+        if title and anchor not in (a for a, _ in toc.get(document, [])):
+            toc.setdefault(document, []).append((anchor, title))
+    return documents, toc
+
+
+def _anchor_positions(parsed):
+    """{anchor id: index of the first paragraph after it} from a TextExtractor"""
+
+    positions = {}
+    for index, anchor in parsed.marks:
+        positions.setdefault(anchor, index)
+    return positions
+
+
+def _entry_starts(document, entries, parsed):
+    """Sorted [(paragraph index, anchor id or None, title)] where a document's toc entries begin"""
+
+    positions = _anchor_positions(parsed)
+    starts = {}
+    for anchor, title in entries:
+        if anchor is None:
+            index = 0
+        elif anchor in positions:
+            index = positions[anchor]
+        else:
+            if len(entries) > 1:
+                print(f"Warning: {document} has no element with id '{anchor}'; "
+                      f"'{title}' starts at the top of the document")
+            anchor, index = None, 0
+        # Entries at the same place are one chapter, named by the first
+        starts.setdefault(index, (index, anchor, title))
+    return sorted(starts.values())
+
+
+def _finished(section, min_words):
+    text = "\n\n".join(section["paragraphs"])
+    if text and len(text.split()) >= min_words:
+        yield section["title"], section["documents"], section["fragments"], text, section["digest"].hexdigest()
+
+
+def _add_piece(section, document, digest, start, end, paragraphs):
+    """Add the part of a document between two anchors (None: its start or end) to a chapter"""
+
+    section["documents"].append(document)
+    section["fragments"].append([start, end])
+    section["paragraphs"].extend(paragraphs)
+    section["digest"].update(digest.digest())
+
+
+def _iter_sections(epub_file, min_words=0):
+    """Yield (title, documents, fragments, text, sha256 of the documents) for each chapter"""
+
+    with zipfile.ZipFile(epub_file) as zf:
+        documents, toc = read_package(zf)
+        sections = []
+
+        for document in documents:
+            digest = hashlib.sha256()
+            entries = toc.get(document, [])
+            try:
+                parsed = extract_member(zf, document, digest, {a for a, _ in entries if a})
+            except KeyError:
+                print(f"Warning: {document} is listed in the spine but missing from the book")
+                continue
+
+            starts = _entry_starts(document, entries, parsed)
+            if (not toc or not sections) and (not starts or starts[0][0] > 0):
+                # Every document is a chapter without a toc, and the first always starts one
+                starts.insert(0, (0, None, None))
+            if sections and (not starts or starts[0][0] > 0):
+                # Paragraphs before the first entry continue the chapter before it
+                end = starts[0] if starts else (len(parsed.paragraphs), None)
+                _add_piece(sections[-1], document, digest, None, end[1], parsed.paragraphs[:end[0]])
+
+            for number, (index, anchor, title) in enumerate(starts):
+                # A new chapter; the one before it is complete
+                if sections:
+                    yield from _finished(sections.pop(), min_words)
+                title = title or parsed.heading or parsed.title or Path(document).stem
+                sections.append({"title": title, "documents": [], "fragments": [], "paragraphs": [],
+                                 "digest": hashlib.sha256()})
+                end = starts[number + 1] if number + 1 < len(starts) else (len(parsed.paragraphs), None)
+                _add_piece(sections[-1], document, digest, anchor, end[1], parsed.paragraphs[index:end[0]])
+
+        if sections:
+            yield from _finished(sections.pop(), min_words)
+
+
+def iter_chapters(epub_file, min_words=0):
+    """
+    Yield the chapters of an EPUB in reading order as soon as each is read
+
+    Args:
+        epub_file (str): The book
+        min_words (int): Chapters shorter than this are skipped
+
+    Yields:
+        Chapter(index, title, text), as streaming_splitter.iter_chapters does
+    """
+
+    for index, (title, _, _, text, _) in enumerate(_iter_sections(epub_file, min_words), 1):
+        yield Chapter(index, title, text)
+
+
+def build_manifest(epub_file, min_words=0):
+    """
+    Build a split manifest for an EPUB
+
+    Chapters name the zip members they are read from ("documents") instead
+    of a byte range of the source, and for each the anchor ids the chapter
+    runs between ("fragments", null for the start or end of the document);
+    split_manifest.read_chapter reads either.
+    """
+
+    chapters = []
+    for index, (title, documents, fragments, text, sha256) in enumerate(_iter_sections(epub_file, min_words), 1):
+        chapters.append({
+            "index": index,
+            "name": f"{index:02d}_{safe_name(title)}",
+            "title": title,
+            "documents": documents,
+            "fragments": fragments,
+            "start": 0,
+            "end": len(text.encode("utf-8")),
+            "encoding": "utf-8",
+            "words": len(text.split()),
+            "sha256": sha256,
+        })
+    return {
+        "version": MANIFEST_VERSION,
+        "source": str(Path(epub_file).resolve()),
+        "source_size": os.stat(epub_file).st_size,
+        "chapters": chapters,
+    }
+
+
+def read_chapter(manifest, chapter, verify=True):
+    """Read the text of one manifest chapter back out of its EPUB"""
+
+    changed = ValueError(f"{manifest['source']} changed since it was split - split it again")
+    # Manifests written before chapters were cut at anchors read whole documents
+    fragments = chapter.get("fragments") or [[None, None]] * len(chapter["documents"])
+    # Every anchor a document was cut at, so its paragraphs break as they did then
+    anchors = {}
+    for other in manifest["chapters"]:
+        for document, pair in zip(other.get("documents", ()), other.get("fragments", ())):
+            anchors.setdefault(document, set()).update(anchor for anchor in pair if anchor)
+    digest = hashlib.sha256()
+    paragraphs = []
+    with zipfile.ZipFile(manifest["source"]) as zf:
+        for document, (start, end) in zip(chapter["documents"], fragments):
+            member_digest = hashlib.sha256()
+            try:
+                parsed = extract_member(zf, document, member_digest, anchors.get(document, ()))
+            except KeyError:
+                raise changed
+            positions = _anchor_positions(parsed)
+            if any(anchor and anchor not in positions for anchor in (start, end)):
+                raise changed
+            paragraphs.extend(parsed.paragraphs[positions.get(start, 0):positions.get(end, len(parsed.paragraphs))])
+            digest.update(member_digest.digest())
+    if verify and digest.hexdigest() != chapter["sha256"]:
+        raise changed
+    return "\n\n".join(paragraphs)
+
+
+def split_epub(epub_file, output_folder="chapters", manifest_file=None, min_words=0):
+    """
+    Write the chapters of an EPUB as NN_Title.txt files, or a manifest
+
+    Returns:
+        list: (title, words) of every chapter written
+    """
+
+    from memprofile import mark
+
+    if manifest_file is not None:
+        from split_manifest import write_manifest
+
+        mark("manifest")
+        manifest = build_manifest(epub_file, min_words)
+        write_manifest(manifest, manifest_file)
+        return [(c["title"], c["words"]) for c in manifest["chapters"]]
+
+    Path(output_folder).mkdir(parents=True, exist_ok=True)
+    written = []
+    # Chapters are extracted and written one at a time, so this is one stage
+    mark("extract and write")
+    for chapter in iter_chapters(epub_file, min_words):
+        filename = f"{chapter.index:02d}_{safe_name(chapter.title)}.txt"
+        with open(Path(output_folder) / filename, "w", encoding="utf-8") as f:
+            f.write(chapter.text)
+        words = len(chapter.text.split())
+        written.append((chapter.title, words))
+        print(f"Created: {filename} ({words:,} words)")
+    print(f"\nSplit complete! Created {len(written)} files in '{output_folder}' folder.")
+    return written
+
+
+def main():
+    """Main function with command line interface"""
+
+    args = sys.argv[1:]
+    manifest_file = None
+    if "--manifest" in args:
+        position = args.index("--manifest")
+        manifest_file = args[position + 1] if position + 1 < len(args) else None
+        del args[position:position + 2]
+        if manifest_file is None:
+            print("--manifest needs a file name")
+            return False
+    if not args:
+        print(__doc__.strip())
+        return False
+
+    try:
+        chapters = split_epub(args[0], args[1] if len(args) > 1 else "chapters", manifest_file)
+    except (OSError, ValueError, KeyError, zipfile.BadZipFile, ET.ParseError) as e:
+        print(f"Error reading {args[0]}: {e}")
+        return False
+    return bool(chapters)
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
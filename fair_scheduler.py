@@ -0,0 +1,389 @@
+#!/usr/bin/env python3
+"""
+Fair-Share Upload Scheduler
+Renders the uploads tree (tempuploads/<user>/...) without letting one user's book starve the others
+
+Instead of converting files in glob order, the next free worker goes to
+the user who has been given the least render time so far relative to
+their weight (USER_WEIGHTS), and within a user to the chapter predicted
+to finish soonest. Every user therefore hears a first chapter early, no
+matter how long the other books in the queue are. USER_MAX_JOBS caps how
+many of one user's chapters render at once (MAX_JOBS_PER_USER for users
+not listed). Each worker slot runs on its own CPUs (see placement.py), and
+USER_PRIORITY runs a user's chapters at another priority (e.g. Bob:low).
+
+Render times are predicted from the file size and the median speed of
+past runs in <output>/.metrics.jsonl, where the workers log their runs.
+Audio goes to <output>/<user>/, and each user's time to first chapter,
+with the median over all users, is written to <output>/schedule_report.json.
+
+Usage:
+  python fair_scheduler.py [root] [--output audio_output] [--workers N] [--dry-run]
+"""
+
+import argparse
+import heapq
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from collections import deque, namedtuple
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pathlib import Path
+
+from placement import PRIORITIES, Placement
+from progress import METRICS_ENV_VAR, METRICS_FILE
+from tts_config import get_float, get_list, load_config
+
+DEFAULT_BYTES_PER_SECOND = 100.0   # until there are metrics to learn from
+REPORT_FILE = "schedule_report.json"
+
+Job = namedtuple("Job", "user path output_dir predicted")
+
+
+def find_jobs(root):
+    """Return {user: [text files]} for every user folder under root"""
+
+    jobs = {}
+    for user_dir in sorted(p for p in Path(root).iterdir() if p.is_dir()):
+        files = sorted(p for p in user_dir.rglob("*.txt") if not p.name.startswith("."))
+        if files:
+            jobs[user_dir.name] = files
+    return jobs
+
+
+def render_rate(metrics_file=METRICS_FILE):
+    """Median text bytes rendered per second over the successful runs in the metrics log"""
+
+    rates = []
+    try:
+        with open(metrics_file, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    run = json.loads(line)
+                except ValueError:
+                    continue
+                if run.get("returncode") == 0 and run.get("bytes_per_second"):
+                    rates.append(run["bytes_per_second"])
+    except FileNotFoundError:
+        pass
+    return statistics.median(rates) if rates else DEFAULT_BYTES_PER_SECOND
+
+
+def per_user(config, key, convert=float):
+    """Read a USER:VALUE,USER:VALUE setting into a dictionary"""
+
+    values = {}
+    for item in get_list(config, key):
+        user, sep, value = item.rpartition(":")
+        try:
+            if not sep or not user.strip():
+                raise ValueError
+            values[user.strip()] = convert(value)
+        except ValueError:
+            print(f"Warning: ignoring invalid {key} entry {item!r} in config")
+    return values
+
+
+class FairScheduler:
+    """Hands out jobs by weighted fair share across users, shortest job first within a user"""
+
+    def __init__(self, jobs, weights=None, caps=None, default_cap=None):
+        """
+        Args:
+            jobs (list): Job tuples
+            weights (dict): User -> share of the workers (default 1)
+            caps (dict): User -> most jobs running at once
+            default_cap (int): Cap for users not in caps (None: no cap)
+        """
+
+        self.pending = {}
+        for job in sorted(jobs, key=lambda j: (j.predicted, str(j.path))):
+            self.pending.setdefault(job.user, deque()).append(job)
+        self.users = sorted(self.pending)
+        weights = weights or {}
+        caps = caps or {}
+        self.weights = {user: max(weights.get(user, 1.0), 1e-6) for user in self.users}
+        self.caps = {user: caps.get(user, default_cap) for user in self.users}
+        self.service = dict.fromkeys(self.users, 0.0)
+        self.running = dict.fromkeys(self.users, 0)
+
+    def __len__(self):
+        return sum(len(queue) for queue in self.pending.values())
+
+    def next_job(self):
+        """Start the next job, or return None if every user with work waiting is at their cap"""
+
+        eligible = [user for user in self.users
+                    if self.pending[user] and (self.caps[user] is None or self.running[user] < self.caps[user])]
+        if not eligible:
+            return None
+        # Least predicted render time received per unit of weight; ties go by name
+        user = min(eligible, key=self.service.get)
+        job = self.pending[user].popleft()
+        self.running[user] += 1
+        self.service[user] += job.predicted / self.weights[user]
+        return job
+
+    def finished(self, job):
+        self.running[job.user] -= 1
+
+
+class GlobOrder:
+    """Jobs one after another in folder and name order, as a plain batch runs them"""
+
+    def __init__(self, jobs):
+        self.pending = deque(sorted(jobs, key=lambda j: (j.user, str(j.path))))
+
+    def __len__(self):
+        return len(self.pending)
+
+    def next_job(self):
+        return self.pending.popleft() if self.pending else None
+
+    def finished(self, job):
+        pass
+
+
+def simulate(scheduler, workers):
+    """
+    Play a schedule through on predicted times
+
+    Returns:
+        tuple: ({user: predicted seconds to first chapter}, [jobs in start order])
+    """
+
+    clock = 0.0
+    running = []
+    first = {}
+    order = []
+    while len(scheduler) or running:
+        while len(running) < workers:
+            job = scheduler.next_job()
+            if job is None:
+                break
+            order.append(job)
+            heapq.heappush(running, (clock + job.predicted, len(order), job))
+        if not running:
+            break
+        clock, _, job = heapq.heappop(running)
+        scheduler.finished(job)
+        first.setdefault(job.user, clock)
+    return first, order
+
+
+def _priority(name):
+    name = name.strip().lower()
+    if name not in PRIORITIES:
+        raise ValueError(name)
+    return name
+
+
+def _cap(value):
+    cap = int(value)
+    if cap < 1:
+        # A user who may never run a job would never finish
+        raise ValueError(value)
+    return cap
+
+
+def _median(values):
+    return statistics.median(values) if values else None
+
+
+def render_job(job, voice, speed, log_dir, placement=None, slot=0, priority=None, metrics_file=None):
+    """
+    Convert one chapter in its own process, with its output logged to log_dir
+    and its run summary to metrics_file
+
+    The process places itself on the CPUs of its worker slot as soon as
+    it starts (placement.apply_inherited), before the engine has started
+    any threads.
+    """
+
+    log_dir.mkdir(parents=True, exist_ok=True)
+    command = [
+        sys.executable, str(Path(__file__).with_name("text_to_audio_batch.py")),
+        str(job.path), voice, str(speed), str(job.output_dir),
+    ]
+    env = dict(os.environ)
+    if metrics_file is not None:
+        env[METRICS_ENV_VAR] = str(metrics_file)
+    if placement is not None:
+        env.update(placement.environment(slot, priority))
+    try:
+        with open(log_dir / f"{job.path.stem}.log", "w", encoding="utf-8") as log:
+            process = subprocess.Popen(command, stdout=log, stderr=subprocess.STDOUT, stdin=subprocess.DEVNULL,
+                                       env=env)
+            return process.wait() == 0
+    except OSError as e:
+        print(f"Error: {e}")
+        return False
+
+
+def run_schedule(root="tempuploads", output_root="audio_output", voice="af_bella", speed=1.0,
+                 workers=None, config_file="config.txt", dry_run=False):
+    """
+    Render every chapter under root in fair-share order
+
+    Args:
+        root (str): Uploads tree with one folder per user
+        output_root (str): Audio goes to output_root/<user>/
+        voice (str): Voice to use
+        speed (float): Speech speed
+        workers (int): Chapters rendered at once (default: SCHEDULER_WORKERS)
+        config_file (str): Settings file
+        dry_run (bool): Only show the planned order and predicted waits
+
+    Returns:
+        dict: The schedule report
+    """
+
+    from build_db import BuildDB, build_key, build_settings
+    from lexicon import load_lexicon
+
+    config = load_config(config_file)
+    workers = workers or int(get_float(config, "SCHEDULER_WORKERS", 1))
+    default_cap = get_float(config, "MAX_JOBS_PER_USER")
+    if default_cap is not None and default_cap < 1:
+        print(f"Warning: ignoring invalid MAX_JOBS_PER_USER={config['MAX_JOBS_PER_USER']!r} in config")
+        default_cap = None
+    caps = per_user(config, "USER_MAX_JOBS", _cap)
+    weights = per_user(config, "USER_WEIGHTS")
+    priorities = per_user(config, "USER_PRIORITY", _priority)
+    placement = Placement.from_config(config, workers)
+    metrics_file = Path(output_root) / Path(METRICS_FILE).name
+    rate = render_rate(metrics_file)
+
+    db = BuildDB()
+    settings_by_dir = {}
+    keys = {}
+    jobs = []
+    up_to_date = 0
+    for user, files in find_jobs(root).items():
+        for path in files:
+            relative = path.relative_to(Path(root) / user)
+            output_dir = Path(output_root) / user / relative.parent
+            if path.parent not in settings_by_dir:
+                settings_by_dir[path.parent] = build_settings(config, voice, speed, load_lexicon(config, path.parent))
+            key = build_key(db.input_hash(path), settings_by_dir[path.parent])
+            output_file = output_dir / f"{path.stem}.wav"
+            if db.is_fresh(output_file, key):
+                up_to_date += 1
+                continue
+            keys[path] = (output_file, key)
+            jobs.append(Job(user, path, output_dir, path.stat().st_size / rate))
+
+    def make_scheduler():
+        return FairScheduler(jobs, weights, caps, int(default_cap) if default_cap is not None else None)
+
+    predicted_fair, order = simulate(make_scheduler(), workers)
+    predicted_glob, _ = simulate(GlobOrder(jobs), workers)
+    users = sorted({job.user for job in jobs})
+    print(f"{len(jobs)} chapters from {len(users)} users to render ({up_to_date} up to date), "
+          f"{workers} at a time, predicted at {rate:.0f} bytes/second")
+    print(f"Predicted median time to first chapter: {_median(list(predicted_fair.values())) or 0:.0f}s "
+          f"(glob order: {_median(list(predicted_glob.values())) or 0:.0f}s)")
+    print(f"Workers: {placement.describe()}")
+
+    if dry_run:
+        for job in order:
+            print(f"  {job.user:<16} {job.path.name[:44]:<44} {job.predicted / 60:7.1f} min")
+        return {"users": {}, "predicted_median_first_chapter": _median(list(predicted_fair.values()))}
+
+    scheduler = make_scheduler()
+    start_time = time.monotonic()
+    first = {}
+    counts = {user: {"done": 0, "failed": 0} for user in users}
+    log_root = Path(output_root) / ".logs"
+    free_slots = list(range(workers))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {}
+        while len(scheduler) or futures:
+            while len(futures) < workers:
+                job = scheduler.next_job()
+                if job is None:
+                    break
+                slot = free_slots.pop(0)
+                print(f"Start  {job.user}: {job.path.name}")
+                future = pool.submit(render_job, job, voice, speed, log_root / job.user,
+                                     placement, slot, priorities.get(job.user), metrics_file)
+                futures[future] = (job, slot)
+            if not futures:
+                break
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                job, slot = futures.pop(future)
+                free_slots.append(slot)
+                scheduler.finished(job)
+                elapsed = time.monotonic() - start_time
+                if future.result():
+                    first.setdefault(job.user, elapsed)
+                    counts[job.user]["done"] += 1
+                    db.record(*keys[job.path])
+                    db.save()
+                    print(f"Done   {job.user}: {job.path.name} ({elapsed:.0f}s)")
+                else:
+                    counts[job.user]["failed"] += 1
+                    print(f"FAILED {job.user}: {job.path.name} (log in {log_root / job.user})")
+
+    report = {
+        "root": str(root),
+        "workers": workers,
+        "seconds": time.monotonic() - start_time,
+        "median_first_chapter": _median(list(first.values())),
+        "predicted_median_first_chapter": _median(list(predicted_fair.values())),
+        "users": {
+            user: {
+                **counts[user],
+                "weight": weights.get(user, 1.0),
+                "first_chapter": first.get(user),
+                "predicted_first_chapter": predicted_fair.get(user),
+            }
+            for user in users
+        },
+    }
+    Path(output_root).mkdir(parents=True, exist_ok=True)
+    (Path(output_root) / REPORT_FILE).write_text(json.dumps(report, indent=2))
+    return report
+
+
+def print_report(report):
+    """Print each user's time to first chapter and the median"""
+
+    if not report["users"]:
+        return
+    print(f"{'User':<20} {'Done':>5} {'Failed':>7} {'First chapter':>14}")
+    for user, row in report["users"].items():
+        first = f"{row['first_chapter']:.0f}s" if row["first_chapter"] is not None else "-"
+        print(f"{user[:20]:<20} {row['done']:>5} {row['failed']:>7} {first:>14}")
+    if report["median_first_chapter"] is not None:
+        print(f"Median time to first chapter: {report['median_first_chapter']:.0f}s")
+
+
+def main():
+    """Main function with command line interface"""
+
+    parser = argparse.ArgumentParser(description="Render an uploads tree, sharing workers fairly between users")
+    parser.add_argument("root", nargs="?", default="tempuploads", help="Uploads tree (default: tempuploads)")
+    parser.add_argument("--output", default="audio_output", help="Output folder (default: audio_output)")
+    parser.add_argument("--workers", type=int, help="Chapters rendered at once (default: SCHEDULER_WORKERS)")
+    parser.add_argument("--dry-run", action="store_true", help="Show the planned order without rendering")
+    args = parser.parse_args()
+
+    if not Path(args.root).is_dir():
+        print(f"Folder not found: {args.root}")
+        return False
+
+    config = load_config()
+    report = run_schedule(args.root, args.output, config["VOICE"], get_float(config, "SPEED", 1.0),
+                          args.workers, dry_run=args.dry_run)
+    print_report(report)
+    return not any(row["failed"] for row in report["users"].values())
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
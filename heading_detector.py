@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+"""
+Statistical Heading Detector
+Finds chapter headings in messy text (e.g. PDF extractions) that has no "Chapter N" markers
+
+Every line gets a score from features computed for all lines at once with
+NumPy over a line-offset index: length, word count, share of capital
+letters, share of capitalized words, digits, blank lines around it and how
+it starts and ends. The few lines that score well are then checked against
+the rest of the document: lines whose text, page number aside, repeats
+every page or two (running heads, page numbers) are dropped, headings that follow a common template
+("Part #", "#. Title") are favoured, and headings are kept at least
+min_words apart.
+"""
+
+import bisect
+import re
+import sys
+from collections import defaultdict
+
+import numpy as np
+
+MAX_HEADING_CHARS = 60
+MAX_HEADING_WORDS = 10
+CANDIDATE_SCORE = 3.5
+HEADING_SCORE = 4.5
+# Running heads repeat at least every other page (odd and even pages often
+# alternate between the book title and the chapter title)
+RUNNING_HEAD_LINES = 150
+
+# Character class bits
+SPACE, UPPER, LOWER, DIGIT = 1, 2, 4, 8
+
+_SENTENCE_END = [ord(c) for c in '.,;:!?)"\'\u201d\u2019']
+_TEMPLATE_NUMBER = re.compile(r'\b(?:\d+|[IVXLC]+|[ivxlc]+)\b')
+# A page number alone on its line or set off from a running head by a wide gap
+_PAGE_NUMBER = re.compile(r'^\d+$|^\d+(?:\s{2,}|\t)|(?:\s{2,}|\t)\d+$')
+
+
+def _codes(content):
+    # One integer per character (code point), so positions match the str
+    return np.frombuffer(content.encode('utf-32-le'), dtype=np.uint32)
+
+
+def _totals(flags):
+    # totals[j] is the number of flags set before position j
+    totals = np.empty(len(flags) + 1, dtype=np.int32)
+    totals[0] = 0
+    np.cumsum(flags, dtype=np.int32, out=totals[1:])
+    return totals
+
+
+def _character_classes():
+    # Lookup table from code point (anything above 255 maps to 256) to class bits
+    table = np.zeros(257, dtype=np.uint8)
+    table[[9, 10, 11, 12, 13, 32, 160]] = SPACE
+    table[ord('A'):ord('Z') + 1] = UPPER
+    table[ord('a'):ord('z') + 1] = LOWER
+    table[ord('0'):ord('9') + 1] = DIGIT
+    # Latin-1 letters, so accented capitals count as capitals
+    table[192:223] = UPPER
+    table[223:256] = LOWER
+    table[[215, 247]] = 0
+    return table
+
+
+_CLASSES = _character_classes()
+
+
+def line_features(content):
+    """
+    Compute per-line features for the whole document
+
+    Returns:
+        dict: NumPy arrays with one entry per line (starts, ends, chars,
+            words, upper, letters, digits, capitalized, blank_before,
+            blank_after, first, last)
+    """
+
+    codes = _codes(content)
+    newlines = np.flatnonzero(codes == 10)
+    starts = np.concatenate(([0], newlines + 1))
+    ends = np.concatenate((newlines, [len(codes)]))
+
+    classes = _CLASSES[np.minimum(codes, 256)]
+    space = (classes & SPACE) > 0
+    upper = (classes & UPPER) > 0
+    word_start = ~space & np.concatenate(([True], space[:-1]))
+
+    def per_line(totals):
+        return totals[ends] - totals[starts]
+
+    text_totals = _totals(~space)
+    chars = per_line(text_totals)
+    features = {
+        "starts": starts,
+        "ends": ends,
+        "chars": chars,
+        "words": per_line(_totals(word_start)),
+        "upper": per_line(_totals(upper)),
+        "letters": per_line(_totals((classes & (UPPER | LOWER)) > 0)),
+        "digits": per_line(_totals((classes & DIGIT) > 0)),
+        "capitalized": per_line(_totals(word_start & upper)),
+    }
+
+    # Length of the run of blank lines just before and just after each line
+    blank = chars == 0
+    line_numbers = np.arange(len(blank))
+    last_text = np.maximum.accumulate(np.where(blank, -1, line_numbers))
+    next_text = np.minimum.accumulate(np.where(blank, len(blank), line_numbers)[::-1])[::-1]
+    features["blank_before"] = line_numbers - np.concatenate(([-1], last_text[:-1])) - 1
+    features["blank_after"] = np.concatenate((next_text[1:], [len(blank)])) - line_numbers - 1
+
+    # First and last non-space character of each line (0 for blank lines);
+    # the running count of text characters steps up exactly at each one
+    first = np.searchsorted(text_totals, text_totals[starts] + 1) - 1
+    last = np.searchsorted(text_totals, text_totals[ends]) - 1
+    padded = np.concatenate((codes, [0]))
+    features["first"] = np.where(blank, 0, padded[first.clip(0, len(codes))])
+    features["last"] = np.where(blank, 0, padded[last.clip(0, len(codes))])
+    return features
+
+
+def score_lines(features):
+    """
+    Score every line as a possible heading from its own features
+
+    Returns:
+        numpy.ndarray: One score per line (higher is more heading-like)
+    """
+
+    chars = features["chars"]
+    words = features["words"]
+    letters = features["letters"]
+    score = np.zeros(len(chars))
+
+    score += 2.0 * (features["blank_before"] > 0) + 1.5 * (features["blank_after"] > 0)
+    score += 0.5 * (np.minimum(features["blank_before"], 3) + np.minimum(features["blank_after"], 3) > 2)
+
+    caps_ratio = features["upper"] / np.maximum(letters, 1)
+    score += 2.0 * ((caps_ratio >= 0.8) & (letters >= 2))
+    score += 1.0 * (features["capitalized"] / np.maximum(words, 1) >= 0.6)
+    score += 1.0 * (words <= 5)
+
+    digit_ratio = features["digits"] / np.maximum(chars, 1)
+    score += 1.0 * ((features["digits"] > 0) & (letters > 0))
+    score += 0.5 * (digit_ratio == 1)
+
+    first_lower = (features["first"] >= 97) & (features["first"] <= 122)
+    score -= 2.0 * first_lower
+    # A lone lowercase-bearing word ending a sentence is a paragraph's tail
+    # wrapped onto its own line, while "IV." or "1." can still be a heading
+    sentence_like = (words >= 2) | (features["upper"] < letters)
+    score -= 3.0 * (np.isin(features["last"], _SENTENCE_END) & sentence_like)
+
+    heading_shaped = (chars > 0) & (chars <= MAX_HEADING_CHARS) & (words <= MAX_HEADING_WORDS)
+    return np.where(heading_shaped, score, -np.inf)
+
+
+def _template(text):
+    return _TEMPLATE_NUMBER.sub('#', text)
+
+
+def _without_page_number(text):
+    return _PAGE_NUMBER.sub('', text).strip()
+
+
+def detect_headings(content, min_words=500):
+    """
+    Find the lines of a document most likely to be chapter headings
+
+    Args:
+        content (str): The document text
+        min_words (int): Fewest words allowed between two headings
+
+    Returns:
+        list: (title, position) of each heading, in document order
+    """
+
+    if not content:
+        return []
+
+    features = line_features(content)
+    scores = score_lines(features)
+    word_position = np.concatenate(([0], np.cumsum(features["words"])))[:-1]
+
+    candidates = np.flatnonzero(scores >= CANDIDATE_SCORE)
+    texts = {i: content[features["starts"][i]:features["ends"][i]].strip() for i in candidates}
+
+    # Running heads and page numbers repeat the same text every page or two
+    # (measured in lines, so it holds for any page size) with only the page
+    # number changing. A chapter title copied into the running heads also
+    # appears once on its own line without a page number, and that one stays
+    repeats = defaultdict(list)
+    for i in candidates:
+        repeats[_without_page_number(texts[i])].append(i)
+
+    running = set()
+    for text, lines in repeats.items():
+        if len(lines) >= 3 and np.median(np.diff(lines)) <= RUNNING_HEAD_LINES:
+            numbered = [i for i in lines if texts[i] != text]
+            running.update(numbered or lines)
+
+    # Real headings that share a template ("Part #", "#. Title") back each other up
+    groups = defaultdict(list)
+    for i in candidates:
+        if i not in running:
+            groups[_template(texts[i])].append(i)
+
+    final = {}
+    for template, lines in groups.items():
+        for i in lines:
+            bonus = 2.0 if len(lines) >= 2 and template != texts[i] else 0.0
+            final[i] = scores[i] + bonus
+
+    # Best scores first, skipping any heading too close to one already taken
+    chosen = []
+    taken = []
+    for i in sorted(final, key=lambda i: (-final[i], i)):
+        if final[i] < HEADING_SCORE:
+            break
+        position = word_position[i]
+        k = bisect.bisect_left(taken, position)
+        if (k < len(taken) and taken[k] - position < min_words) or (k > 0 and position - taken[k - 1] < min_words):
+            continue
+        taken.insert(k, position)
+        chosen.append(i)
+
+    if len(chosen) < 2:
+        return []
+    return [(texts[i], int(features["starts"][i])) for i in sorted(chosen)]
+
+
+def heading_spans(content, min_words=500):
+    """
+    Split a document on its detected headings
+
+    Returns:
+        list: (title, start, end) character spans; text before the first
+            heading is left out, like the other splitters do
+    """
+
+    headings = detect_headings(content, min_words)
+    spans = []
+    for k, (title, start) in enumerate(headings):
+        end = headings[k + 1][1] if k + 1 < len(headings) else len(content)
+        spans.append((title, start, end))
+    return spans
+
+
+def main():
+    """Main function - list the headings found in a text file"""
+
+    if len(sys.argv) < 2:
+        print("Usage: python heading_detector.py <book.txt> [min_words]")
+        return False
+
+    from split_manifest import read_book
+
+    content, _ = read_book(sys.argv[1])
+    if content is None:
+        print("Could not read file with any supported encoding")
+        return False
+
+    min_words = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    spans = heading_spans(content, min_words)
+    for title, start, end in spans:
+        print(f"  {title[:50]:<50} {len(content[start:end].split()):>8,} words")
+    print(f"Found {len(spans)} headings")
+    return True
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,372 @@
+#!/usr/bin/env python3
+"""
+Incremental Re-Rendering
+Re-synthesizes only the sentences of a chapter that changed since the last render
+
+Sentences are packed into chunks that fill the model's input (see
+segmenter.py), and every render keeps a manifest (sentence hashes of each
+chunk -> audio sample range) next to a raw copy of its audio in
+audio_output/.renders/. On the next run the new sentences are diffed
+against the manifest: chunks whose sentences are all unchanged are copied
+straight from the previous audio, and only the stretches around edited or
+inserted sentences are packed again and sent to the engine, so fixing a
+typo takes seconds instead of a full render.
+
+Chunks to synthesize go to the streamer in batches, one run per batch.
+The pauses between the chunks of a batch are only guessed, so a batch is
+kept as a single manifest entry that later runs reuse or re-render whole,
+and audio is only ever spliced where one run ended. With workers > 1,
+engines that can render several chunks at once (concurrent = True)
+synthesize that many in parallel; the audio is still written in playback
+order.
+"""
+
+import difflib
+import hashlib
+import json
+import os
+import sys
+import time
+from collections import deque
+from pathlib import Path
+
+from segmenter import pack_chunks, split_sentences
+from timestamps import build_index, index_path, text_spans
+from wav_io import WavWriter, iter_wav_blocks
+
+MANIFEST_VERSION = 3
+RENDER_CACHE = ".renders"
+
+
+def sentence_hash(sentence):
+    """Stable key for a sentence; whitespace differences do not count as edits"""
+
+    normalized = " ".join(sentence.split())
+    return hashlib.sha1(normalized.encode("utf-8")).hexdigest()[:16]
+
+
+def cache_paths(output_file):
+    """Return (raw render, manifest) paths kept for an output file"""
+
+    output_file = Path(output_file)
+    cache_dir = output_file.parent / RENDER_CACHE
+    return cache_dir / output_file.name, cache_dir / f"{output_file.stem}.manifest.json"
+
+
+def engine_settings(engine, config):
+    """Settings from config.txt that change the engine's audio (as in build_db.build_settings)"""
+
+    return {key: (config or {}).get(key, "") for key in getattr(engine, "settings", ())}
+
+
+def load_manifest(manifest_file, engine, config=None):
+    """Return the previous manifest if it was rendered with the same settings"""
+
+    try:
+        with open(manifest_file, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+    same_settings = (
+        manifest.get("version") == MANIFEST_VERSION
+        and manifest.get("engine") == engine.name
+        and manifest.get("voice") == engine.voice
+        and manifest.get("speed") == engine.speed
+        and manifest.get("settings") == engine_settings(engine, config)
+    )
+    return manifest if same_settings else None
+
+
+def plan_render(sentences, manifest, max_tokens):
+    """
+    Decide which audio can be reused and pack the rest into chunks
+
+    A previous chunk is reused when all of its sentences are still there,
+    in order and unchanged. The sentences between reused chunks are packed
+    into new chunks, so an edit only re-renders the chunks around it.
+
+    Returns:
+        list: (old manifest entries to copy, None) or (None, Chunks to synthesize)
+            in playback order; Chunk first/last index into sentences
+    """
+
+    new_hashes = [sentence_hash(s) for s in sentences]
+    reused = []         # (first new sentence, last new sentence, old entries, old end)
+    if manifest:
+        entries = manifest["chunks"]
+        old_hashes = [h for entry in entries for h in entry["hashes"]]
+        matcher = difflib.SequenceMatcher(None, old_hashes, new_hashes, autojunk=False)
+        new_index = {}
+        for block in matcher.get_matching_blocks():
+            for k in range(block.size):
+                new_index[block.a + k] = (block.b + k, block.a)
+
+        old_position = 0
+        for entry in entries:
+            count = len(entry["hashes"])
+            if count == 0:
+                # Continuation of a sentence too long for one chunk
+                if reused and reused[-1][3] == old_position:
+                    reused[-1][2].append(entry)
+                continue
+            matches = [new_index.get(old_position + k) for k in range(count)]
+            if all(matches) and len({block for _, block in matches}) == 1:
+                first = matches[0][0]
+                reused.append((first, first + count, [entry], old_position + count))
+            old_position += count
+
+    plan = []
+    position = 0
+    for first, last, entries, _ in reused + [(len(sentences), len(sentences), [], None)]:
+        chunks = [chunk._replace(first=chunk.first + position, last=chunk.last + position)
+                  for chunk in pack_chunks(sentences[position:first], max_tokens)]
+        if chunks:
+            plan.append((None, chunks))
+        if entries:
+            plan.append((entries, None))
+        position = last
+    return plan
+
+
+def batch_chunks(chunks, max_chars):
+    """
+    Group consecutive chunks into batches of up to max_chars characters (0: one chunk each)
+
+    The pieces of a sentence too long for one chunk always share a batch.
+    """
+
+    batches = []
+    size = 0
+    for chunk in chunks:
+        same_sentence = max_chars and batches and batches[-1][-1][1:] == chunk[1:]
+        if batches and (same_sentence or size + len(chunk.text) <= max_chars):
+            batches[-1].append(chunk)
+            size += len(chunk.text)
+        else:
+            batches.append([chunk])
+            size = len(chunk.text)
+    return batches
+
+
+def synthesize_chunks(engine, chunks, workers=1):
+    """Yield (audio, sample_rate) of every chunk, in order (see synthesize_batches)"""
+
+    batches = synthesize_batches(engine, batch_chunks(chunks, getattr(engine, "batch_chars", 0)), workers)
+    try:
+        for results in batches:
+            yield from results
+    finally:
+        batches.close()
+
+
+def synthesize_batches(engine, batches, workers=1):
+    """
+    Yield a list of (audio, sample_rate), one per chunk, for every batch, in order
+
+    Engines that start a process per call (synthesize_batch) render up to
+    engine.batch_chars characters of chunks per call, so a render loads the
+    model once per batch instead of once per chunk. With workers > 1 and a
+    concurrent engine, up to `workers` calls run at once and at most twice
+    that many finished ones wait to be written, so memory stays bounded
+    however long the chapter is.
+    """
+
+    def run(batch):
+        if len(batch) > 1:
+            return engine.synthesize_batch([chunk.text for chunk in batch])
+        return [engine.synthesize(batch[0].text)]
+
+    if workers <= 1 or len(batches) < 2 or not getattr(engine, "concurrent", False):
+        for batch in batches:
+            yield run(batch)
+        return
+
+    from concurrent.futures import ThreadPoolExecutor
+
+    pool = ThreadPoolExecutor(workers)
+    pending = deque()
+    try:
+        for batch in batches:
+            pending.append(pool.submit(run, batch))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+def render_incremental(input_file, output_file, engine, text=None, config=None, source_text=None, chapter=None,
+                       workers=1):
+    """
+    Render a chapter, reusing audio of sentences that have not changed
+
+    Args:
+        input_file (str): Chapter text file
+        output_file (str): Where the finished WAV goes
+        engine: Engine from tts_engine.get_engine
+        text (str): Chapter text, if it was already read
+        config (dict): Settings for the output stage (POSTPROCESS, OUTPUT_FORMAT, ...)
+        source_text (str): Text the timestamp index offsets refer to (default: text)
+        chapter (dict): Chapter details for the timestamp index
+        workers (int): Chunks synthesized at once (concurrent engines only)
+
+    Returns:
+        dict: Counts of reused and synthesized sentences
+    """
+
+    if text is None:
+        with open(input_file, "r", encoding="utf-8") as f:
+            text = f.read()
+
+    raw_file, manifest_file = cache_paths(output_file)
+    raw_file.parent.mkdir(parents=True, exist_ok=True)
+
+    sentences = split_sentences(text)
+    manifest = load_manifest(manifest_file, engine, config)
+    plan = plan_render(sentences, manifest, engine.max_tokens)
+    chunks = [chunk for _, gap in plan if gap is not None for chunk in gap]
+    synthesized = sum(last - first for first, last in {(chunk.first, chunk.last) for chunk in chunks})
+    reused = len(sentences) - synthesized
+    print(f"Sentences: {len(sentences)} total, {reused} unchanged, {synthesized} to synthesize "
+          f"in {len(chunks)} chunks")
+
+    sample_rate = manifest["sample_rate"] if manifest else None
+    channels = manifest["channels"] if manifest else 1
+    writer = None
+    partial = raw_file.with_name(raw_file.name + ".part")
+    entries = []
+    previous = None
+
+    def write(blocks, hashes):
+        start = writer.frames_written
+        for block in blocks:
+            writer.write(block)
+        entries.append({"hashes": hashes, "start": start, "end": writer.frames_written})
+
+    # Batches never span reused audio, so each one is a single engine run
+    # between two exact splice points
+    steps = []
+    for old_entries, gap in plan:
+        if old_entries is not None:
+            steps.append((old_entries, None))
+        else:
+            steps.extend((None, batch) for batch in batch_chunks(gap, getattr(engine, "batch_chars", 0)))
+
+    rendered = synthesize_batches(engine, [batch for _, batch in steps if batch is not None], workers)
+    try:
+        for old_entries, batch in steps:
+            if old_entries is not None:
+                if writer is None:
+                    writer = WavWriter(partial, sample_rate, channels, "float32")
+                for entry in old_entries:
+                    write(iter_wav_blocks(raw_file, start_frame=entry["start"], end_frame=entry["end"]),
+                          entry["hashes"])
+                continue
+
+            results = next(rendered)
+            for audio, rate in results:
+                if sample_rate is None:
+                    sample_rate, channels = rate, audio.shape[1]
+                elif rate != sample_rate:
+                    raise RuntimeError(f"Engine returned {rate} Hz audio, expected {sample_rate} Hz")
+            if writer is None:
+                writer = WavWriter(partial, sample_rate, channels, "float32")
+            chunk = batch[0]
+            if len(batch) > 1:
+                # Cut apart at guessed pauses, so the run is kept whole
+                write([audio for audio, _ in results],
+                      [sentence_hash(s) for s in sentences[chunk.first:batch[-1].last]])
+            elif previous is not None and previous[1:] == chunk[1:]:
+                # Pieces of one long sentence share its range; only the first lists its hash
+                write([audio for audio, _ in results], [])
+            else:
+                write([audio for audio, _ in results], [sentence_hash(s) for s in sentences[chunk.first:chunk.last]])
+            previous = batch[-1]
+    finally:
+        rendered.close()
+        if writer is not None:
+            writer.close()
+
+    if writer is None:
+        print("Nothing to render - the chapter is empty")
+        return {"reused": 0, "synthesized": 0}
+
+    os.replace(partial, raw_file)
+    with open(manifest_file, "w", encoding="utf-8") as f:
+        json.dump({
+            "version": MANIFEST_VERSION,
+            "engine": engine.name,
+            "voice": engine.voice,
+            "speed": engine.speed,
+            "settings": engine_settings(engine, config),
+            "sample_rate": sample_rate,
+            "channels": channels,
+            "chunks": entries,
+        }, f)
+
+    # The raw render stays in the cache; the output is written from it
+    # through the output stage in one streaming pass
+    from postprocess import postprocess_file
+
+    index = _timestamp_index(raw_file, entries, sentences, source_text or text, text, chapter)
+    postprocess_file(raw_file, output_file, config or {}, index)
+    index.save(index_path(output_file))
+
+    return {"reused": reused, "synthesized": synthesized}
+
+
+def _timestamp_index(raw_file, entries, sentences, source_text, text, chapter):
+    # Each entry lists the hashes of the sentences it holds; an entry
+    # without hashes continues the sentence range before it
+    chunks = []
+    cursor = 0
+    for entry in entries:
+        if entry["hashes"]:
+            chunks.append((cursor, cursor + len(entry["hashes"]), entry["start"], entry["end"]))
+            cursor += len(entry["hashes"])
+        elif chunks:
+            chunks.append((chunks[-1][0], chunks[-1][1], entry["start"], entry["end"]))
+    offsets, lengths = text_spans(source_text, len(sentences), text)
+    return build_index(raw_file, chunks, sentences, offsets, lengths, chapter)
+
+
+def main():
+    """Main function with command line interface"""
+
+    if len(sys.argv) < 2:
+        print("Incremental Re-Rendering")
+        print("=" * 40)
+        print("Usage:")
+        print("  python incremental.py <input_file> [voice] [speed]")
+        print()
+        print("Only sentences that changed since the last run are synthesized.")
+        return False
+
+    from tts_config import load_config
+    from tts_engine import get_engine
+
+    input_path = Path(sys.argv[1])
+    if not input_path.exists():
+        print(f"Error: Input file '{input_path}' not found!")
+        return False
+
+    config = load_config()
+    voice = sys.argv[2] if len(sys.argv) > 2 else None
+    speed = float(sys.argv[3]) if len(sys.argv) > 3 else None
+    engine = get_engine(config, voice, speed)
+
+    output_file = Path("audio_output") / f"{input_path.stem}.wav"
+    output_file.parent.mkdir(exist_ok=True)
+
+    start_time = time.time()
+    counts = render_incremental(input_path, output_file, engine, config=config)
+    print(f"Saved {output_file}: {counts['reused']} sentences reused, "
+          f"{counts['synthesized']} synthesized in {time.time() - start_time:.1f} seconds")
+    return True
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
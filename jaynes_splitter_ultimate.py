@@ -9,15 +9,47 @@ import re
 from pathlib import Path
 import sys
 
-def split_jaynes_book_ultimate(input_file: Path, output_folder: str = "jaynes_chapters_ultimate") -> bool:
+# The EXACT order from the Table of Contents
+TOC_ORDER = [
+    "Preface",
+    "Introduction", 
+    "The Consciousness of Consciousness",
+    "Consciousness",
+    "The Mind of Iliad", 
+    "The Bicameral Mind",
+    "The Double Brain",
+    "The Origin of Civilization",
+    "Gods, Graves, and Idols",
+    "Literate Bicameral Theocracies", 
+    "The Causes of Consciousness",
+    "A Change of Mind in Mesopotamia",
+    "The Intellectual Consciousness of Greece",
+    "The Moral Consciousness of the Khabiru",
+    "The Quest for Authorization",
+    "Of Prophets and Possession",
+    "Of Poetry and Music",
+    "Hypnosis",
+    "Schizophrenia", 
+    "The Auguries of Science",
+    "Afterword"
+]
+
+def split_jaynes_book_ultimate(input_file: Path, output_folder: str = "jaynes_chapters_ultimate",
+                               manifest_file: str = None) -> bool:
     """
     Splits Julian Jaynes book using the actual content sections
+    
+    With manifest_file set, writes a split manifest instead of section files.
     """
     
+    from memprofile import mark
+    
     # Create output folder
-    Path(output_folder).mkdir(exist_ok=True)
+    if manifest_file is None:
+        Path(output_folder).mkdir(exist_ok=True)
     
     # Read the book file
+    mark("read")
     try:
         encodings = ['utf-8-sig', 'utf-8', 'cp1252', 'latin1']
         content = None
@@ -39,33 +71,11 @@ def split_jaynes_book_ultimate(input_file: Path, output_folder: str = "jaynes_ch
         print(f"Error reading file: {e}")
         return False
     
+    mark("find sections")
     print(f"Document size: {len(content):,} characters")
     print(f"Document size: {len(content.split()):,} words")
     
-    # Define the EXACT order from Table of Contents
-    toc_order = [
-        "Preface",
-        "Introduction", 
-        "The Consciousness of Consciousness",
-        "Consciousness",
-        "The Mind of Iliad", 
-        "The Bicameral Mind",
-        "The Double Brain",
-        "The Origin of Civilization",
-        "Gods, Graves, and Idols",
-        "Literate Bicameral Theocracies", 
-        "The Causes of Consciousness",
-        "A Change of Mind in Mesopotamia",
-        "The Intellectual Consciousness of Greece",
-        "The Moral Consciousness of the Khabiru",
-        "The Quest for Authorization",
-        "Of Prophets and Possession",
-        "Of Poetry and Music",
-        "Hypnosis",
-        "Schizophrenia", 
-        "The Auguries of Science",
-        "Afterword"
-    ]
+    toc_order = TOC_ORDER
     
     print(f"\nLooking for ACTUAL content sections ({len(toc_order)} sections)...")
     
@@ -95,7 +105,14 @@ def split_jaynes_book_ultimate(input_file: Path, output_folder: str = "jaynes_ch
     print(f"\nFound {len(section_positions)} actual content sections")
     
     # Create chapter files in TOC order
+    mark("write")
     chapter_count = 0
+    spans = []
+    
+    # Character offset of each line, for manifests
+    line_starts = [0]
+    for line in lines:
+        line_starts.append(line_starts[-1] + len(line) + 1)
     
     for section_title in toc_order:
         if section_title not in section_positions:
@@ -121,6 +138,12 @@ def split_jaynes_book_ultimate(input_file: Path, output_folder: str = "jaynes_ch
             print(f"Skipping '{section_title}' - too short ({len(section_content.split())} words)")
             continue
         
+        if manifest_file is not None:
+            end = min(line_starts[next_start_line], len(content))
+            spans.append((section_title, line_starts[start_line], end))
+            chapter_count += 1
+            continue
+        
         # Create filename
         safe_title = re.sub(r'[^\w\s-]', '', section_title).strip()
         safe_title = re.sub(r'[-\s]+', '_', safe_title)
@@ -138,6 +161,14 @@ def split_jaynes_book_ultimate(input_file: Path, output_folder: str = "jaynes_ch
             print(f"Error writing section file {filename}: {e}")
             return False
     
+    if manifest_file is not None:
+        from split_manifest import build_manifest, write_manifest
+        
+        # Sections are numbered in TOC order, as the files would be
+        manifest = build_manifest(input_file, encoding, spans, content)
+        write_manifest(manifest, manifest_file)
+        return True
+    
     print(f"\nSplit complete! Created {chapter_count} section files in '{output_folder}' folder.")
     print("Files are now in the CORRECT Table of Contents order!")
     return True
@@ -158,7 +189,9 @@ def main():
     print("Using ACTUAL content sections, not TOC titles...")
     print("="*50)
     
-    success = split_jaynes_book_ultimate(input_file)
+    # --manifest writes jaynes_chapters.json instead of section copies
+    manifest_file = "jaynes_chapters.json" if "--manifest" in sys.argv else None
+    success = split_jaynes_book_ultimate(input_file, manifest_file=manifest_file)
     
     if success:
         print("\nSuccess! Book successfully split into sections!")
@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""
+Pronunciation Lexicon
+Rewrites words the model mispronounces before the text is synthesized
+
+A lexicon is a text file of WORD=SPOKEN FORM lines, e.g.
+
+    Khabiru=Kah-BEE-roo
+    Mesopotamia=Mess-oh-poh-TAY-mee-uh
+    # comments and blank lines are ignored
+
+The global lexicon (LEXICON in config.txt) applies to every book; a
+lexicon.lex in the folder of the text being converted adds to it and wins
+where both list a word. Entries match whole words; an entry written in
+lowercase also matches the Capitalized and UPPERCASE forms.
+
+All entries are compiled into one regular expression shaped like a trie
+(common prefixes are shared), so the text is rewritten in a single pass
+however many entries there are, instead of one str.replace per entry.
+load_lexicon compiles each combination of lexicon files once per process
+and hands out the same Lexicon until one of the files changes.
+"""
+
+import functools
+import hashlib
+import json
+import re
+import sys
+import time
+from pathlib import Path
+
+LEXICON_FILE = "lexicon.lex"
+BOOK_LEXICON = "lexicon.lex"
+
+
+def load_entries(lexicon_file):
+    """
+    Read a lexicon file
+
+    Returns:
+        dict: Word -> spoken form (empty if the file does not exist)
+    """
+
+    entries = {}
+    path = Path(lexicon_file)
+    if not path.exists():
+        return entries
+
+    with open(path, "r", encoding="utf-8-sig") as f:
+        for number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            word, sep, spoken = line.partition("=")
+            word, spoken = word.strip(), spoken.strip()
+            if not sep or not word:
+                print(f"Warning: ignoring line {number} of {path}: {line!r}")
+                continue
+            entries[word] = spoken
+    return entries
+
+
+def _trie(words):
+    root = {}
+    for word in words:
+        node = root
+        for char in word:
+            node = node.setdefault(char, {})
+        node[""] = None
+    return root
+
+
+def _trie_pattern(node):
+    # Shared prefixes become one branch: {"cat", "car"} -> ca(?:r|t)
+    branches = [re.escape(char) + _trie_pattern(child) for char, child in sorted(node.items()) if char]
+    if not branches:
+        return ""
+    if len(branches) == 1 and "" not in node:
+        return branches[0]
+    pattern = "(?:" + "|".join(branches) + ")"
+    return pattern + "?" if "" in node else pattern
+
+
+def _capitalize_words(text):
+    # "new york" -> "New York"; unlike str.title() the rest of each word is kept
+    return " ".join(word[:1].upper() + word[1:] for word in text.split(" "))
+
+
+def _case_variants(word, spoken):
+    yield word, spoken
+    if word.islower():
+        yield _capitalize_words(word), _capitalize_words(spoken)
+        yield word.upper(), spoken.upper()
+
+
+class Lexicon:
+    """A compiled set of pronunciation entries"""
+
+    def __init__(self, entries=None):
+        """
+        Args:
+            entries (dict): Word -> spoken form
+        """
+
+        self.entries = dict(entries or {})
+        self.table = {}
+        for word, spoken in self.entries.items():
+            for variant, replacement in _case_variants(word, spoken):
+                # Entries written out explicitly beat generated case variants
+                if variant == word or variant not in self.entries:
+                    self.table[variant] = replacement
+
+        self.pattern = None
+        if self.table:
+            # Greedy branches make the longest entry win ("New York City" over "New York")
+            self.pattern = re.compile(r"(?<!\w)" + _trie_pattern(_trie(self.table)) + r"(?!\w)")
+
+    def __len__(self):
+        return len(self.entries)
+
+    @property
+    def digest(self):
+        """Hash of the entries, for build keys"""
+
+        payload = json.dumps(self.entries, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def apply(self, text):
+        """
+        Rewrite every listed word in text in one pass
+
+        Returns:
+            tuple: (rewritten text, number of replacements)
+        """
+
+        if self.pattern is None:
+            return text, 0
+        table = self.table
+        return self.pattern.subn(lambda match: table[match.group()], text)
+
+
+def load_lexicon(config=None, book_dir=None):
+    """
+    Combine the global lexicon and the book's own lexicon.lex
+
+    Args:
+        config (dict): Settings from tts_config.load_config (LEXICON)
+        book_dir (Path): Folder of the text being converted
+
+    Returns:
+        Lexicon: Possibly empty
+    """
+
+    config = config or {}
+    files = [Path(config.get("LEXICON", LEXICON_FILE) or LEXICON_FILE).resolve()]
+    if book_dir is not None:
+        files.append((Path(book_dir) / BOOK_LEXICON).resolve())
+    # Keyed on modification times, so an edited lexicon is compiled again
+    key = []
+    for path in dict.fromkeys(files):
+        try:
+            key.append((str(path), path.stat().st_mtime_ns))
+        except OSError:
+            pass
+    return _compiled(tuple(key))
+
+
+@functools.lru_cache(maxsize=32)
+def _compiled(files):
+    """Lexicon of (path, mtime) pairs, later files winning; cached by load_lexicon"""
+
+    entries = {}
+    for path, _ in files:
+        entries.update(load_entries(path))
+    return Lexicon(entries)
+
+
+def main():
+    """Main function - apply a lexicon to a text file and report what changed"""
+
+    if len(sys.argv) < 3:
+        print("Usage: python lexicon.py <lexicon_file> <input_file> [output_file]")
+        return False
+
+    start = time.perf_counter()
+    lexicon = Lexicon(load_entries(sys.argv[1]))
+    compiled = time.perf_counter() - start
+
+    with open(sys.argv[2], "r", encoding="utf-8") as f:
+        text = f.read()
+    start = time.perf_counter()
+    rewritten, count = lexicon.apply(text)
+    elapsed = time.perf_counter() - start
+
+    print(f"{len(lexicon):,} entries compiled in {compiled * 1000:.1f} ms")
+    print(f"{count:,} replacements in {len(text):,} characters in {elapsed * 1000:.1f} ms")
+    if len(sys.argv) > 3:
+        with open(sys.argv[3], "w", encoding="utf-8") as f:
+            f.write(rewritten)
+        print(f"Wrote {sys.argv[3]}")
+    return True
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,461 @@
+#!/usr/bin/env python3
+"""
+Memory Profiling
+Peak memory per stage of a split or conversion, reported per job
+
+Off unless MEMORY_PROFILE is set in config.txt (or AUDIOBOOK_MEMORY_PROFILE
+in the environment, which --memory-profile on the audiobook command sets so
+that worker processes inherit it):
+
+  rss   Resident memory of the process and of the processes it started
+        (the streamer), sampled every MEMORY_PROFILE_INTERVAL seconds, plus
+        the kernel's exact peak (VmHWM), reset at every stage boundary.
+        Costs well under 1% - cheap enough for a sample of production jobs.
+  full  Also traces Python allocations (tracemalloc): the Python peak of
+        every stage and the lines holding the most memory when it ends.
+        Allocation-heavy steps (splitting) run several times slower; use
+        it to find out where the memory goes, not on every job.
+
+The splitters and converters mark their stages (read, split, lexicon,
+synthesize, timestamps, finish, verify, ...). Each peak is attributed to
+the innermost stage running when it happened, and the seconds of a stage
+leave out the stages inside it. When a job ends, a table is printed and a
+JSON report is written to MEMORY_PROFILE_DIR/<job>.json.
+
+Stages are marked from the job's own thread; marks from other threads
+(such as the streaming splitter's scanner) are ignored and their memory
+counts toward whatever stage the job's thread is in.
+
+Usage:
+  python memprofile.py report.json     # print a saved report
+"""
+
+# json, threading and datetime are only imported once a job is profiled,
+# so the stage marks in the splitters cost next to nothing when it is off
+import os
+import sys
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+MODES = ("rss", "full")
+ENV_VAR = "AUDIOBOOK_MEMORY_PROFILE"
+DEFAULT_DIR = "audio_output/.memory"
+SAMPLE_INTERVAL = 0.05
+TRACE_FRAMES = 1            # frames kept per allocation; more is slower
+TOP_LINES = 5
+ROOT = "(other)"            # time in a job outside any marked stage
+
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+_active = None
+
+
+def profile_mode(config=None):
+    """The profiling mode from the environment or config.txt: None, 'rss' or 'full'"""
+
+    value = os.environ.get(ENV_VAR)
+    if value is None:
+        if config is None:
+            from tts_config import load_config
+
+            config = load_config()
+        value = config.get("MEMORY_PROFILE", "")
+    value = value.strip().lower()
+    if value in ("", "0", "off", "no", "false"):
+        return None
+    if value in ("1", "on", "yes", "true"):
+        return "rss"
+    if value not in MODES:
+        print(f"Warning: unknown MEMORY_PROFILE {value!r}, using rss")
+        return "rss"
+    return value
+
+
+def process_rss(pid="self"):
+    """Resident memory of a process in bytes, or None if it cannot be read"""
+
+    try:
+        with open(f"/proc/{pid}/statm", "rb") as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def descendants(pid):
+    """Every process started by pid, directly or not (Linux)"""
+
+    found = []
+    pending = [pid]
+    while pending:
+        parent = pending.pop()
+        try:
+            tasks = os.listdir(f"/proc/{parent}/task")
+        except OSError:
+            continue
+        for task in tasks:
+            try:
+                with open(f"/proc/{parent}/task/{task}/children", "rb") as f:
+                    children = [int(child) for child in f.read().split()]
+            except (OSError, ValueError):
+                continue
+            found.extend(children)
+            pending.extend(children)
+    return found
+
+
+def _peak_rss():
+    """Peak resident memory since the last reset (VmHWM), in bytes"""
+
+    try:
+        with open("/proc/self/status", "rb") as f:
+            for line in f:
+                if line.startswith(b"VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+def _reset_peak_rss():
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def _new_stats():
+    return {"calls": 0, "seconds": 0.0, "rss_start": None, "rss_end": None, "rss_peak": 0,
+            "children_peak": 0, "python_peak": 0, "python_end": None, "top": []}
+
+
+class MemoryProfiler:
+    """Stage stack and peak memory of one job"""
+
+    def __init__(self, name, mode="rss", report_dir=DEFAULT_DIR, interval=SAMPLE_INTERVAL):
+        import threading
+
+        self.name = name
+        self.mode = mode
+        self.report_dir = Path(report_dir)
+        self.interval = interval
+        self.pid = os.getpid()
+        self.thread_id = threading.get_ident()
+        self.stack = []         # [path, marked, started, seconds in nested stages]
+        self.stages = {}        # path -> stats, in the order first seen
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._sampler = None
+        self._tracing = False
+        self._exact_peaks = False
+
+    def start(self):
+        if process_rss() is None:
+            print("Warning: resident memory can only be read on Linux; use MEMORY_PROFILE=full "
+                  "for the Python allocations")
+        if self.mode == "full":
+            import tracemalloc
+
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(TRACE_FRAMES)
+                self._tracing = True
+        # The kernel's peak only means something per stage if it can be reset
+        self._exact_peaks = _peak_rss() is not None and _reset_peak_rss()
+        import threading
+
+        self.started = time.perf_counter()
+        self.enter(ROOT)
+        self._sampler = threading.Thread(target=self._sample, name="memprofile", daemon=True)
+        self._sampler.start()
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            rss = process_rss()
+            children = sum(process_rss(child) or 0 for child in descendants(self.pid))
+            with self._lock:
+                if self.stack:
+                    stats = self.stages[self.stack[-1][0]]
+                    stats["rss_peak"] = max(stats["rss_peak"], rss or 0)
+                    stats["children_peak"] = max(stats["children_peak"], children)
+
+    def _boundary(self):
+        """Give the peaks since the last boundary to the current stage and start over"""
+
+        rss = process_rss()
+        if self.stack:
+            stats = self.stages[self.stack[-1][0]]
+            peak = _peak_rss() if self._exact_peaks else None
+            stats["rss_peak"] = max(stats["rss_peak"], peak or 0, rss or 0)
+            if self.mode == "full":
+                import tracemalloc
+
+                stats["python_peak"] = max(stats["python_peak"], tracemalloc.get_traced_memory()[1])
+        if self._exact_peaks:
+            _reset_peak_rss()
+        if self.mode == "full":
+            import tracemalloc
+
+            tracemalloc.reset_peak()
+        return rss
+
+    def _open(self, name, marked, rss):
+        path = name if not self.stack or self.stack[-1][0] == ROOT else f"{self.stack[-1][0]}/{name}"
+        stats = self.stages.setdefault(path, _new_stats())
+        stats["calls"] += 1
+        if stats["rss_start"] is None:
+            stats["rss_start"] = rss
+        self.stack.append([path, marked, time.perf_counter(), 0.0])
+
+    def _close(self, rss):
+        path, _, started, nested = self.stack.pop()
+        elapsed = time.perf_counter() - started
+        stats = self.stages[path]
+        stats["seconds"] += elapsed - nested
+        stats["rss_end"] = rss
+        if self.stack:
+            self.stack[-1][3] += elapsed
+        return stats
+
+    def _snapshot(self, stats):
+        """What a stage leaves behind, by the line that allocated it"""
+
+        import tracemalloc
+
+        stats["python_end"] = tracemalloc.get_traced_memory()[0]
+        snapshot = tracemalloc.take_snapshot().filter_traces(
+            [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__)])
+        stats["top"] = [(str(stat.traceback[0]), stat.size) for stat in snapshot.statistics("lineno")[:TOP_LINES]]
+
+    def enter(self, name, marked=False):
+        with self._lock:
+            self._open(name, marked, self._boundary())
+
+    def exit(self):
+        with self._lock:
+            stats = self._close(self._boundary())
+        if self.mode == "full":
+            self._snapshot(stats)
+
+    def mark(self, name):
+        """End the stage started by the last mark at this level and start another"""
+
+        if not self.stack[-1][1]:
+            self.enter(name, marked=True)
+            return
+        # One boundary, so nothing in between is charged to the enclosing stage
+        with self._lock:
+            rss = self._boundary()
+            stats = self._close(rss)
+            self._open(name, True, rss)
+        if self.mode == "full":
+            self._snapshot(stats)
+
+    def close_to(self, depth):
+        """End every stage above depth (marks left open by a stage or job)"""
+
+        while len(self.stack) > depth:
+            self.exit()
+
+    def stop(self):
+        self.close_to(0)
+        self._stop.set()
+        self._sampler.join()
+        if self._tracing:
+            import tracemalloc
+
+            tracemalloc.stop()
+        self.seconds = time.perf_counter() - self.started
+
+    def report(self):
+        """The job's report as a dictionary"""
+
+        from datetime import datetime
+
+        stages = [dict(stats, stage=path) for path, stats in self.stages.items()]
+        peak = max(stages, key=lambda s: s["rss_peak"] + s["children_peak"])
+        return {
+            "job": self.name,
+            "mode": self.mode,
+            "finished": datetime.now().isoformat(timespec="seconds"),
+            "seconds": round(self.seconds, 3),
+            "peak_rss": peak["rss_peak"],
+            "peak_children": peak["children_peak"],
+            "peak_stage": peak["stage"],
+            "exact_peaks": self._exact_peaks,
+            "stages": stages,
+        }
+
+    def save(self):
+        """Write the report to report_dir/<job>.json and return its path"""
+
+        import json
+
+        self.report_dir.mkdir(parents=True, exist_ok=True)
+        path = self.report_dir / f"{self.name}.json"
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.report(), f, indent=2)
+        return path
+
+
+def _mb(size):
+    return "-" if size is None else f"{size / 2 ** 20:,.1f}"
+
+
+def print_report(report):
+    """Print a job's stage table"""
+
+    print(f"Memory profile of {report['job']} ({report['mode']}, {report['seconds']:.1f} s): "
+          f"peak {_mb(report['peak_rss'] + report['peak_children'])} MB in {report['peak_stage']}")
+    python = report["mode"] == "full"
+    print(f"  {'Stage (MB)':<32} {'Calls':>5} {'Seconds':>8} {'Start':>8} {'Peak':>8} {'End':>8} {'Children':>9}"
+          + (f" {'Python':>8}" if python else ""))
+    for stats in report["stages"]:
+        if not stats["calls"]:
+            continue
+        print(f"  {stats['stage'][:32]:<32} {stats['calls']:>5} {stats['seconds']:>8.2f} "
+              f"{_mb(stats['rss_start']):>8} {_mb(stats['rss_peak']):>8} {_mb(stats['rss_end']):>8} "
+              f"{_mb(stats['children_peak']):>9}" + (f" {_mb(stats['python_peak']):>8}" if python else ""))
+    if python:
+        peak = max(report["stages"], key=lambda s: (s["python_peak"], s["stage"] != ROOT))
+        if peak["top"]:
+            print(f"  Largest Python allocations left by {peak['stage']}:")
+            for line, size in peak["top"]:
+                print(f"    {_mb(size):>8} MB  {line}")
+
+
+def _current():
+    """The running profiler of this process and thread, or None"""
+
+    profiler = _active
+    if profiler is None:
+        return None
+
+    import threading
+
+    if profiler.pid != os.getpid() or profiler.thread_id != threading.get_ident():
+        return None
+    return profiler
+
+
+@contextmanager
+def profiling(name, mode="rss", report_dir=DEFAULT_DIR, interval=SAMPLE_INTERVAL):
+    """
+    Profile a block as one job, without printing or saving anything
+
+    Yields:
+        MemoryProfiler: Stopped, with its report ready, when the block ends
+    """
+
+    global _active
+
+    profiler = MemoryProfiler(name, mode, report_dir, interval)
+    profiler.start()
+    _active = profiler
+    try:
+        yield profiler
+    finally:
+        _active = None
+        profiler.stop()
+
+
+@contextmanager
+def job(name, report_dir=None, config=None):
+    """
+    Profile a job (a book split, a chapter conversion) if profiling is on
+
+    Inside another job it is just a stage of that job.
+
+    Args:
+        name (str): Job name, also the report's file name
+        report_dir (str): Where the report goes unless MEMORY_PROFILE_DIR is set
+            (default: audio_output/.memory)
+        config (dict): Settings from config.txt (default: read it)
+    """
+
+    if _current() is not None:
+        with stage(name):
+            yield
+        return
+
+    if config is None:
+        from tts_config import load_config
+
+        config = load_config()
+    mode = profile_mode(config)
+    if mode is None:
+        yield
+        return
+
+    from tts_config import get_float
+
+    profiler = None
+    try:
+        with profiling(name, mode, config.get("MEMORY_PROFILE_DIR") or report_dir or DEFAULT_DIR,
+                       get_float(config, "MEMORY_PROFILE_INTERVAL", SAMPLE_INTERVAL)) as profiler:
+            yield
+    finally:
+        # Failed jobs are reported too: running out of memory is one way to fail
+        if profiler is not None:
+            print_report(profiler.report())
+            try:
+                print(f"Memory report: {profiler.save()}")
+            except OSError as e:
+                print(f"Warning: could not write the memory report ({e})")
+
+
+@contextmanager
+def stage(name):
+    """Run a block as a stage of the current job (nothing if none is profiled)"""
+
+    profiler = _current()
+    if profiler is None:
+        yield
+        return
+    profiler.enter(name)
+    depth = len(profiler.stack)
+    try:
+        yield
+    finally:
+        profiler.close_to(depth - 1)
+
+
+def mark(name):
+    """Start the next stage of a function, ending the one its last mark started"""
+
+    profiler = _current()
+    if profiler is not None:
+        profiler.mark(name)
+
+
+def profiled(name):
+    """Decorator: every call of the function is a stage"""
+
+    def decorate(function):
+        import functools
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def main():
+    """Main function - print saved reports"""
+
+    import json
+
+    if len(sys.argv) < 2:
+        print(__doc__.split("Usage:")[1].strip())
+        return False
+    for report_file in sys.argv[1:]:
+        with open(report_file, "r", encoding="utf-8") as f:
+            print_report(json.load(f))
+    return True
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
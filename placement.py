@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+"""
+Worker Placement
+Keeps render workers on their own CPUs and at a chosen CPU and I/O priority
+
+On a shared machine, workers that float across every core compete with the
+other services for cache and with each other. Each worker slot is given
+its own set of CPUs (CPUS_PER_WORKER of the CPUs in CPU_AFFINITY), and
+with NUMA=on a set never spans two NUMA nodes, so a worker's memory,
+allocated on the node it runs on, stays local. WORKER_PRIORITY sets the
+nice level and the I/O scheduling class (ionice) of the workers; jobs can
+ask for another priority, e.g. per user in the uploads scheduler.
+
+Child processes inherit all three, so placing a converter also places the
+streamer it starts. A scheduler that starts converters hands each one its
+slot's CPUs and priority in the environment (Placement.environment), and
+the converter places itself with apply_inherited before it starts any
+threads. Everything here is Linux-only; elsewhere placement is skipped
+with a warning.
+
+Usage:
+  python placement.py [workers]    # show the CPU sets workers would get
+"""
+
+import ctypes
+import os
+import platform
+import sys
+from pathlib import Path
+
+NODE_DIR = Path("/sys/devices/system/node")
+
+IOPRIO_CLASS_BE = 2
+IOPRIO_CLASS_IDLE = 3
+IOPRIO_WHO_PROCESS = 1
+# ioprio_set has no wrapper in the C library or in os
+IOPRIO_SET_SYSCALL = {"x86_64": 251, "i386": 289, "i686": 289, "aarch64": 30, "armv7l": 314, "ppc64le": 273}
+
+PRIORITIES = {
+    # name: (nice level, I/O class, I/O level); None leaves it as it is
+    "high": (0, IOPRIO_CLASS_BE, 0),
+    "normal": (None, None, None),
+    "low": (10, IOPRIO_CLASS_BE, 7),
+    "idle": (19, IOPRIO_CLASS_IDLE, 0),
+}
+
+CPUS_ENV_VAR = "AUDIOBOOK_WORKER_CPUS"
+PRIORITY_ENV_VAR = "AUDIOBOOK_WORKER_PRIORITY"
+
+_warned = set()
+
+
+def _warn_once(message):
+    if message not in _warned:
+        _warned.add(message)
+        print(f"Warning: {message}")
+
+
+def parse_cpu_list(text):
+    """Parse a Linux CPU list such as 0-3,8,10-11 into a sorted list"""
+
+    cpus = set()
+    for part in text.replace(" ", "").split(","):
+        if not part:
+            continue
+        first, _, last = part.partition("-")
+        cpus.update(range(int(first), int(last or first) + 1))
+    return sorted(cpus)
+
+
+def format_cpu_list(cpus):
+    """Inverse of parse_cpu_list: [0, 1, 2, 3, 8] -> 0-3,8"""
+
+    ranges = []
+    for cpu in sorted(cpus):
+        if ranges and cpu == ranges[-1][1] + 1:
+            ranges[-1][1] = cpu
+        else:
+            ranges.append([cpu, cpu])
+    return ",".join(f"{a}-{b}" if b > a else f"{a}" for a, b in ranges)
+
+
+def available_cpus():
+    """CPUs this process may run on"""
+
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def numa_nodes():
+    """CPUs of each NUMA node, [[0, 1, ...], [16, 17, ...]] (one group if unknown)"""
+
+    nodes = []
+    for cpulist in sorted(NODE_DIR.glob("node[0-9]*/cpulist"), key=lambda p: int(p.parent.name[4:])):
+        try:
+            cpus = parse_cpu_list(cpulist.read_text().strip())
+        except (OSError, ValueError):
+            continue
+        if cpus:
+            nodes.append(cpus)
+    return nodes
+
+
+def plan_cpu_sets(workers, cpus=None, per_worker=None, numa=True):
+    """
+    Divide CPUs between worker slots
+
+    Args:
+        workers (int): Number of worker slots
+        cpus (list): CPUs to use (default: all this process may use)
+        per_worker (int): CPUs per slot (default: an equal share)
+        numa (bool): Keep every slot on a single NUMA node
+
+    Returns:
+        list: One sorted list of CPUs per slot; slots share sets when
+            there are more workers than sets
+    """
+
+    allowed = sorted(cpus) if cpus else available_cpus()
+    workers = max(int(workers), 1)
+
+    groups = [allowed]
+    if numa:
+        members = set(allowed)
+        groups = [[cpu for cpu in node if cpu in members] for node in numa_nodes()] or groups
+        groups = [group for group in groups if group] or [allowed]
+
+    if per_worker:
+        per_worker = max(int(per_worker), 1)
+    else:
+        # The largest equal share that gives every worker a set of its own within a node
+        per_worker = max(len(allowed) // workers, 1)
+        while per_worker > 1 and sum(len(group) // per_worker for group in groups) < workers:
+            per_worker -= 1
+
+    sets = []
+    for group in groups:
+        # Only whole sets, so no slot straddles two nodes
+        sets.extend(group[i:i + per_worker] for i in range(0, len(group) - per_worker + 1, per_worker))
+    if not sets:
+        sets = [allowed]
+    return [sets[slot % len(sets)] for slot in range(workers)]
+
+
+def set_io_priority(pid, io_class, level):
+    """ioprio_set(2) for one process (0: this one)"""
+
+    number = IOPRIO_SET_SYSCALL.get(platform.machine())
+    if number is None or not sys.platform.startswith("linux"):
+        raise OSError(f"I/O priorities are not supported on {platform.system()} {platform.machine()}")
+    libc = ctypes.CDLL(None, use_errno=True)
+    if libc.syscall(number, IOPRIO_WHO_PROCESS, pid, (io_class << 13) | level) != 0:
+        error = ctypes.get_errno()
+        raise OSError(error, os.strerror(error))
+
+
+def place(pid, cpus, priority):
+    """Pin a process to cpus (None: leave it where it is) and set its priority"""
+
+    if cpus:
+        try:
+            os.sched_setaffinity(pid, cpus)
+        except (AttributeError, OSError) as e:
+            _warn_once(f"could not pin workers to CPUs {format_cpu_list(cpus)}: {e}")
+
+    nice, io_class, io_level = PRIORITIES[priority]
+    if nice is not None:
+        try:
+            os.setpriority(os.PRIO_PROCESS, pid, nice)
+        except (AttributeError, OSError) as e:
+            _warn_once(f"could not set nice level {nice}: {e}")
+    if io_class is not None:
+        try:
+            set_io_priority(pid, io_class, io_level)
+        except OSError as e:
+            _warn_once(f"could not set I/O priority: {e}")
+
+
+def apply_inherited():
+    """
+    Place this process as its parent asked in the environment (Placement.environment)
+
+    Does nothing in a process not started that way. Call it first thing,
+    before any threads start.
+    """
+
+    priority = os.environ.pop(PRIORITY_ENV_VAR, None)
+    cpus = os.environ.pop(CPUS_ENV_VAR, None)
+    if priority is None:
+        return
+    if priority not in PRIORITIES:
+        _warn_once(f"unknown worker priority {priority!r}, using normal")
+        priority = "normal"
+    try:
+        cpus = parse_cpu_list(cpus) if cpus else None
+    except ValueError:
+        _warn_once(f"ignoring invalid worker CPUs {cpus!r}")
+        cpus = None
+    place(0, cpus, priority)
+
+
+class Placement:
+    """CPU sets and priority for a pool of workers"""
+
+    def __init__(self, workers=1, cpus=None, per_worker=None, numa=True, priority="normal"):
+        """
+        Args:
+            workers (int): Worker slots
+            cpus (list): CPUs the workers may use (default: all)
+            per_worker (int): CPUs per slot (default: an equal share)
+            numa (bool): Keep every slot on one NUMA node
+            priority (str): Default priority of the workers (see PRIORITIES)
+        """
+
+        if priority not in PRIORITIES:
+            raise ValueError(f"Unknown priority {priority!r} (choose from: {', '.join(PRIORITIES)})")
+        self.priority = priority
+        self.pinned = bool(cpus or per_worker)
+        self.cpu_sets = plan_cpu_sets(workers, cpus, per_worker, numa) if self.pinned else None
+
+    @classmethod
+    def from_config(cls, config, workers=1):
+        """Placement from CPU_AFFINITY, CPUS_PER_WORKER, NUMA and WORKER_PRIORITY"""
+
+        from tts_config import get_bool, get_float
+
+        cpus = None
+        if config.get("CPU_AFFINITY"):
+            try:
+                cpus = parse_cpu_list(config["CPU_AFFINITY"])
+            except ValueError:
+                print(f"Warning: ignoring invalid CPU_AFFINITY {config['CPU_AFFINITY']!r} in config")
+        per_worker = get_float(config, "CPUS_PER_WORKER")
+        priority = (config.get("WORKER_PRIORITY") or "normal").strip().lower()
+        if priority not in PRIORITIES:
+            print(f"Warning: unknown WORKER_PRIORITY {priority!r} in config, using normal")
+            priority = "normal"
+        return cls(workers, cpus, int(per_worker) if per_worker else None,
+                   get_bool(config, "NUMA", True), priority)
+
+    def cpus(self, slot):
+        """CPUs of a worker slot, or None if workers are not pinned"""
+
+        return self.cpu_sets[slot % len(self.cpu_sets)] if self.cpu_sets else None
+
+    def apply(self, slot=0, pid=0, priority=None):
+        """
+        Pin a process to a slot's CPUs and set its priority
+
+        Args:
+            slot (int): Worker slot
+            pid (int): Process to place (0: this one); do it before the
+                process starts threads, since affinity is per thread
+            priority (str): Overrides the default priority
+        """
+
+        place(pid, self.cpus(slot), priority or self.priority)
+
+    def environment(self, slot=0, priority=None):
+        """Environment variables telling a worker process to place itself in a slot (see apply_inherited)"""
+
+        env = {PRIORITY_ENV_VAR: priority or self.priority}
+        cpus = self.cpus(slot)
+        if cpus:
+            env[CPUS_ENV_VAR] = format_cpu_list(cpus)
+        return env
+
+    def describe(self):
+        layout = "unpinned" if not self.cpu_sets else \
+            ", ".join(f"{slot}: {format_cpu_list(cpus)}" for slot, cpus in enumerate(self.cpu_sets))
+        return f"{layout} ({self.priority} priority)"
+
+
+def main():
+    """Main function - show the CPU sets from config.txt"""
+
+    from tts_config import load_config
+
+    workers = int(sys.argv[1]) if len(sys.argv) > 1 else 1
+    nodes = numa_nodes()
+    print(f"CPUs available: {format_cpu_list(available_cpus())}")
+    print(f"NUMA nodes: {', '.join(format_cpu_list(node) for node in nodes) if nodes else 'unknown'}")
+    placement = Placement.from_config(load_config(), workers)
+    print(f"Workers: {placement.describe()}")
+    return True
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
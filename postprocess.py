@@ -0,0 +1,418 @@
+#!/usr/bin/env python3
+"""
+Streaming Audio Post-Processing
+Trims silence, evens out the pauses between sentences and normalizes
+loudness in one block-by-block pass over a finished render, as it is
+copied to the final output
+"""
+
+import os
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+from wav_io import SAMPLE_FORMATS, WavWriter, iter_wav_blocks, read_wav_info
+
+# Loudness is measured on 400 ms blocks built from 100 ms sub-blocks and kept
+# as a histogram, so the running estimate needs constant memory
+HIST_MIN_DB = -70.0
+HIST_MAX_DB = 0.0
+HIST_STEP_DB = 0.1
+
+
+def _db(power):
+    return 10.0 * np.log10(np.maximum(power, 1e-12))
+
+
+class SilenceTrimmer:
+    """
+    Drops leading and trailing silence and sets every long pause to a fixed gap
+
+    Pauses shorter than min_pause_ms (between words, at commas) are kept as
+    they are; longer ones are treated as sentence breaks and resized to
+    gap_ms, keeping the decay and attack at either side of the pause.
+
+    time_map collects (input frame, output frame) pairs wherever the shift
+    between input and output changes, so positions in the input (e.g. a
+    timestamp index) can be moved to the output by interpolation.
+    """
+
+    def __init__(self, sample_rate, channels=1, threshold_db=-50.0, gap_ms=400, min_pause_ms=250, frame_ms=10):
+        self.channels = channels
+        self.frame = max(int(sample_rate * frame_ms / 1000), 1)
+        self.threshold = 10.0 ** (threshold_db / 10.0)
+        self.gap = int(sample_rate * gap_ms / 1000)
+        self.min_pause = int(sample_rate * min_pause_ms / 1000)
+
+        self._remainder = np.zeros((0, channels), dtype=np.float32)
+        self._started = False
+        # A pending pause is stored as its head, tail and length so that
+        # minutes of silence still only hold about one gap of samples
+        self._head_cap = max(self.gap, self.min_pause)
+        self._pause_head = np.zeros((0, channels), dtype=np.float32)
+        self._pause_tail = np.zeros((0, channels), dtype=np.float32)
+        self._pause_len = 0
+
+        self.time_map = []
+        self._in_pos = 0        # input frame of the first sample of _remainder
+        self._out_pos = 0
+        self._last_end = None   # (input, output) frame where the last speech ended
+
+    def _hold(self, silence):
+        if len(self._pause_head) < self._head_cap:
+            self._pause_head = np.concatenate([self._pause_head, silence[:self._head_cap - len(self._pause_head)]])
+        tail = np.concatenate([self._pause_tail, silence])
+        self._pause_tail = tail[max(len(tail) - self.gap, 0):]
+        self._pause_len += len(silence)
+
+    def _release(self):
+        """Return the pending pause, resized to the sentence gap if it is long"""
+
+        n = self._pause_len
+        if n < self.min_pause:
+            pause = self._pause_head
+        elif n < self.gap:
+            # Stretch a short sentence break by inserting silence in the middle
+            pad = np.zeros((self.gap - n, self.channels), dtype=np.float32)
+            pause = np.concatenate([self._pause_head[:n // 2], pad, self._pause_head[n // 2:]])
+        else:
+            head = self.gap // 2
+            pause = np.concatenate([self._pause_head[:head], self._pause_tail[head:]])
+        self._pause_head = self._pause_head[:0]
+        self._pause_tail = self._pause_tail[:0]
+        self._pause_len = 0
+        return pause
+
+    def process(self, block):
+        x = np.concatenate([self._remainder, block])
+        usable = len(x) - len(x) % self.frame
+        self._remainder = x[usable:]
+        x = x[:usable]
+        if not usable:
+            return x
+        base = self._in_pos
+        self._in_pos += usable
+
+        # Classify every frame at once, then walk the runs of speech/silence
+        frames = x.reshape(-1, self.frame, self.channels)
+        voiced = (frames ** 2).mean(axis=(1, 2)) > self.threshold
+        edges = np.flatnonzero(np.diff(voiced.astype(np.int8))) + 1
+        starts = np.concatenate([[0], edges])
+        ends = np.concatenate([edges, [len(voiced)]])
+
+        out = []
+        for s, e in zip(starts, ends):
+            segment = x[s * self.frame:e * self.frame]
+            if voiced[s]:
+                pause = self._release()
+                if self._started:
+                    out.append(pause)
+                    self._out_pos += len(pause)
+                self._started = True
+                self._mark(base + s * self.frame)
+                out.append(segment)
+                self._out_pos += len(segment)
+                self._last_end = (base + e * self.frame, self._out_pos)
+            else:
+                self._hold(segment)
+        if not out:
+            return x[:0]
+        return np.concatenate(out)
+
+    def _mark(self, input_pos):
+        # Only pauses that changed length move the input/output shift
+        last = self._last_end
+        if last is None or input_pos - self._out_pos != last[0] - last[1]:
+            if last is not None:
+                self.time_map.append(last)
+            self.time_map.append((input_pos, self._out_pos))
+
+    def flush(self):
+        # Whatever is pending at the end is trailing silence
+        if self._last_end is not None:
+            self.time_map.append(self._last_end)
+        self._release()
+        self._remainder = self._remainder[:0]
+        return np.zeros((0, self.channels), dtype=np.float32)
+
+
+class LoudnessNormalizer:
+    """
+    Applies a smoothly varying gain that steers towards a target loudness
+
+    The integrated loudness (BS.1770-style gated mean power, without the
+    K-weighting filter) is estimated from everything seen so far. The first
+    warmup_s seconds are held back so the opening gain is already sensible.
+    The gain ramps from where the last block ended; where the ramp would
+    push a peak over the ceiling, a smooth limiter (attack_ms) pulls it down.
+    """
+
+    def __init__(self, sample_rate, channels=1, target_db=-20.0, max_gain_db=20.0, ceiling_db=-1.0, warmup_s=3.0,
+                 attack_ms=5.0):
+        self.channels = channels
+        self.attack = max(int(sample_rate * attack_ms / 1000), 1)
+        self.sub_block = int(sample_rate * 0.1)
+        self.target_db = target_db
+        self.max_gain_db = max_gain_db
+        self.ceiling = 10.0 ** (ceiling_db / 20.0)
+        self.warmup = int(sample_rate * warmup_s)
+
+        bins = int(round((HIST_MAX_DB - HIST_MIN_DB) / HIST_STEP_DB))
+        self._hist = np.zeros(bins, dtype=np.int64)
+        self._hist_power = np.zeros(bins, dtype=np.float64)
+        self._recent = np.zeros(0, dtype=np.float64)    # last three sub-block powers
+        self._measure = np.zeros((0, channels), dtype=np.float32)
+        self._held = []
+        self._held_len = 0
+        self._gain = None
+
+    def _measure_block(self, block):
+        x = np.concatenate([self._measure, block])
+        usable = len(x) - len(x) % self.sub_block
+        self._measure = x[usable:]
+        if not usable:
+            return
+        powers = (x[:usable].reshape(-1, self.sub_block, self.channels) ** 2).mean(axis=(1, 2))
+        powers = np.concatenate([self._recent, powers])
+        if len(powers) >= 4:
+            # 400 ms windows with 75% overlap
+            windows = np.convolve(powers, np.full(4, 0.25), mode="valid")
+            loud = _db(windows) - 0.691
+            keep = loud > HIST_MIN_DB
+            idx = np.clip(((loud[keep] - HIST_MIN_DB) / HIST_STEP_DB).astype(int), 0, len(self._hist) - 1)
+            np.add.at(self._hist, idx, 1)
+            np.add.at(self._hist_power, idx, windows[keep])
+        self._recent = powers[-3:]
+
+    def integrated_loudness(self):
+        """Return the running integrated loudness estimate, or None if silent so far"""
+
+        if not self._hist.any():
+            return None
+        mean = self._hist_power.sum() / self._hist.sum()
+        relative_gate = _db(mean) - 0.691 - 10.0
+        first = max(int((relative_gate - HIST_MIN_DB) / HIST_STEP_DB), 0)
+        count = self._hist[first:].sum()
+        if not count:
+            return None
+        return float(_db(self._hist_power[first:].sum() / count) - 0.691)
+
+    def _target_gain(self):
+        loudness = self.integrated_loudness()
+        if loudness is None:
+            return 1.0 if self._gain is None else self._gain
+        gain_db = min(self.target_db - loudness, self.max_gain_db)
+        return 10.0 ** (gain_db / 20.0)
+
+    def _apply(self, x):
+        if not len(x):
+            return x
+        new_gain = self._target_gain()
+        old_gain = new_gain if self._gain is None else self._gain
+        peak = float(np.abs(x).max())
+        if peak * new_gain > self.ceiling:
+            new_gain = self.ceiling / peak
+        # Ramp from the previous block's gain so the gain never steps
+        gain = np.linspace(old_gain, new_gain, len(x), dtype=np.float32)
+        level = np.abs(x).max(axis=1) * gain
+        if level.max() > self.ceiling:
+            gain *= self._limiter(self.ceiling / np.maximum(level, self.ceiling))
+        self._gain = float(gain[-1])
+        return x * gain[:, None]
+
+    def _limiter(self, reduction):
+        # A minimum filter then a moving average of the same width: smooth,
+        # and never above the reduction any sample needs
+        from numpy.lib.stride_tricks import sliding_window_view
+
+        width = 2 * self.attack + 1
+        floor = sliding_window_view(np.pad(reduction, self.attack, mode="edge"), width).min(axis=1)
+        return np.convolve(np.pad(floor, self.attack, mode="edge"), np.full(width, 1.0 / width), mode="valid")
+
+    def process(self, block):
+        self._measure_block(block)
+        if self._held is not None:
+            self._held.append(block)
+            self._held_len += len(block)
+            if self._held_len < self.warmup:
+                return block[:0]
+            block = np.concatenate(self._held)
+            self._held = None
+        return self._apply(block)
+
+    def flush(self):
+        if self._held is None:
+            return np.zeros((0, self.channels), dtype=np.float32)
+        block = np.concatenate(self._held) if self._held else np.zeros((0, self.channels), dtype=np.float32)
+        self._held = None
+        return self._apply(block)
+
+
+class PostProcessor:
+    """Runs audio blocks through a chain of streaming stages"""
+
+    def __init__(self, stages):
+        self.stages = list(stages)
+
+    def process(self, block):
+        for stage in self.stages:
+            block = stage.process(block)
+        return block
+
+    def time_map(self):
+        """(input frame, output frame) pairs of a stage that moves audio in time, or None"""
+
+        for stage in self.stages:
+            if hasattr(stage, "time_map"):
+                return stage.time_map
+        return None
+
+    def flush(self):
+        out = []
+        for i, stage in enumerate(self.stages):
+            # A stage's tail still has to pass through the stages after it
+            block = stage.flush()
+            for later in self.stages[i + 1:]:
+                block = later.process(block)
+            out.append(block)
+        return np.concatenate(out)
+
+
+def build_post_processor(config, sample_rate, channels=1):
+    """
+    Build the post-processing chain described by config.txt
+
+    Args:
+        config (dict): Settings from tts_config.load_config
+        sample_rate (int): Sample rate of the audio
+        channels (int): Number of channels
+
+    Returns:
+        PostProcessor, or None if POSTPROCESS is off
+    """
+
+    from tts_config import get_bool, get_float
+
+    if not get_bool(config, "POSTPROCESS"):
+        return None
+
+    stages = [
+        SilenceTrimmer(sample_rate, channels,
+                       threshold_db=get_float(config, "SILENCE_THRESHOLD_DB", -50.0),
+                       gap_ms=get_float(config, "SENTENCE_GAP_MS", 400)),
+    ]
+    target = get_float(config, "TARGET_LOUDNESS")
+    if target is not None:
+        stages.append(LoudnessNormalizer(sample_rate, channels, target_db=target))
+    return PostProcessor(stages)
+
+
+def output_settings(config, info):
+    """
+    Return (sample_format, sample_rate) for final outputs from config.txt
+
+    OUTPUT_FORMAT is int16, float32 or mulaw and OUTPUT_SAMPLE_RATE a rate
+    in Hz such as 24000, 22050 or 16000; empty settings keep the source format.
+    """
+
+    from tts_config import get_float
+
+    sample_format = config.get("OUTPUT_FORMAT", "").strip().lower()
+    if not sample_format:
+        source = (info.format_tag, info.bits_per_sample)
+        sample_format = next((name for name, layout in SAMPLE_FORMATS.items() if layout == source), "int16")
+    elif sample_format not in SAMPLE_FORMATS:
+        raise ValueError(f"Unsupported OUTPUT_FORMAT '{sample_format}' (choose from: {', '.join(SAMPLE_FORMATS)})")
+
+    sample_rate = int(get_float(config, "OUTPUT_SAMPLE_RATE", info.sample_rate))
+    return sample_format, sample_rate
+
+
+def needs_output_stage(config, info):
+    """True if a file with this header must be rewritten to match config.txt"""
+
+    from tts_config import get_bool
+
+    if get_bool(config, "POSTPROCESS"):
+        return True
+    sample_format, sample_rate = output_settings(config, info)
+    return sample_rate != info.sample_rate or SAMPLE_FORMATS[sample_format] != (info.format_tag, info.bits_per_sample)
+
+
+def postprocess_file(input_file, output_file=None, config=None, index=None):
+    """
+    Write the final version of a render block by block
+
+    Runs the post-processing chain (if POSTPROCESS is on) and converts to
+    the OUTPUT_FORMAT and OUTPUT_SAMPLE_RATE from config.txt in the same
+    streaming pass.
+
+    Args:
+        input_file (str): WAV file to process
+        output_file (str): Destination (default: replace input_file)
+        config (dict): Settings (default: read config.txt)
+        index (TimestampIndex): Sentence timestamps of input_file, moved
+            to match the written file
+
+    Returns:
+        bool: True if the file was rewritten
+    """
+
+    from tts_config import load_config
+
+    if config is None:
+        config = load_config()
+
+    info = read_wav_info(input_file)
+    replace = output_file is None or Path(output_file) == Path(input_file)
+    if replace and not needs_output_stage(config, info):
+        return False
+
+    processor = build_post_processor(config, info.sample_rate, info.channels)
+    sample_format, sample_rate = output_settings(config, info)
+    target = Path(input_file).with_suffix(".post.wav") if replace else Path(output_file)
+
+    with WavWriter(target, info.sample_rate, info.channels, sample_format, output_rate=sample_rate) as writer:
+        for block in iter_wav_blocks(input_file):
+            writer.write(processor.process(block) if processor else block)
+        if processor:
+            writer.write(processor.flush())
+
+    if index is not None:
+        index.remap(processor.time_map() if processor else None, info.sample_rate, sample_rate)
+    if replace:
+        os.replace(target, input_file)
+    return True
+
+
+def main():
+    """Main function with command line interface"""
+
+    if len(sys.argv) < 2:
+        print("Streaming Audio Post-Processing")
+        print("=" * 40)
+        print("Usage:")
+        print("  python postprocess.py <input.wav> [output.wav]")
+        print()
+        print("Settings (SENTENCE_GAP_MS, TARGET_LOUDNESS, OUTPUT_FORMAT,")
+        print("OUTPUT_SAMPLE_RATE, ...) are read from config.txt.")
+        return False
+
+    input_file = sys.argv[1]
+    output_file = sys.argv[2] if len(sys.argv) > 2 else None
+
+    from tts_config import load_config
+
+    config = load_config()
+    config["POSTPROCESS"] = "on"
+    start_time = time.time()
+    postprocess_file(input_file, output_file, config)
+    print(f"Post-processed {input_file} in {time.time() - start_time:.1f} seconds")
+    return True
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
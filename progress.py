@@ -0,0 +1,330 @@
+#!/usr/bin/env python3
+"""
+Live Progress for Streamer Runs
+Reads the streamer's output while it runs, shows a progress bar and keeps
+only the most recent log lines
+
+The streamer is started with its output on a pipe that is read line by
+line, so progress is visible during a multi-hour render and memory stays
+flat: only the last LOG_LINES lines are kept, in a ring buffer that is
+printed if the run fails. Lines that report progress ("chunk 3/17",
+"42%") drive the progress bar; a summary of every run is appended to
+audio_output/.metrics.jsonl (or the file named by AUDIOBOOK_METRICS_FILE
+in the environment, which the uploads scheduler sets for its workers).
+
+A Watchdog can be attached to a run: if the streamer reports no new
+progress and its output file stops growing for STALL_TIMEOUT seconds, the
+process is killed so one hung chapter cannot block the rest of a batch.
+"""
+
+import json
+import os
+import re
+import subprocess
+import sys
+import threading
+import time
+from collections import deque
+from pathlib import Path
+
+LOG_LINES = 200
+METRICS_FILE = "audio_output/.metrics.jsonl"
+METRICS_ENV_VAR = "AUDIOBOOK_METRICS_FILE"
+KILL_GRACE = 5.0
+
+_FRACTION = re.compile(r'\b(\d+)\s*(?:/|of)\s*(\d+)\b')
+_PERCENT = re.compile(r'(\d{1,3}(?:\.\d+)?)\s*%')
+
+
+def parse_progress(line):
+    """
+    Find a progress report in a log line
+
+    Returns:
+        tuple: (fraction done 0..1, done, total) - done and total are None
+            for percentages; None if the line reports no progress
+    """
+
+    match = _FRACTION.search(line)
+    if match:
+        done, total = int(match.group(1)), int(match.group(2))
+        if 0 < total and done <= total:
+            return done / total, done, total
+    match = _PERCENT.search(line)
+    if match and float(match.group(1)) <= 100:
+        return float(match.group(1)) / 100, None, None
+    return None
+
+
+class ProgressBar:
+    """A one-line progress bar, or occasional progress lines when output is not a terminal"""
+
+    def __init__(self, label="", stream=None, width=30, min_interval=0.2):
+        self.label = label
+        self.stream = stream or sys.stdout
+        self.width = width
+        self.min_interval = min_interval
+        self.interactive = hasattr(self.stream, "isatty") and self.stream.isatty()
+        self._last_draw = 0.0
+        self._last_decile = -1
+        self._drawn = False
+
+    def update(self, fraction, detail="", force=False):
+        now = time.monotonic()
+        if self.interactive:
+            if not force and now - self._last_draw < self.min_interval:
+                return
+            filled = int(self.width * fraction) if fraction is not None else 0
+            bar = "#" * filled + "-" * (self.width - filled)
+            percent = f"{fraction * 100:5.1f}%" if fraction is not None else "  ... "
+            self.stream.write(f"\r{self.label} [{bar}] {percent} {detail}".ljust(79)[:79])
+            self.stream.flush()
+            self._drawn = True
+        elif fraction is not None and int(fraction * 10) > self._last_decile:
+            self._last_decile = int(fraction * 10)
+            print(f"{self.label} {fraction * 100:.0f}% {detail}".rstrip(), file=self.stream)
+        self._last_draw = now
+
+    def close(self):
+        if self._drawn:
+            self.stream.write("\n")
+            self.stream.flush()
+            self._drawn = False
+
+
+class RunMetrics:
+    """Timing and progress figures for one streamer run"""
+
+    def __init__(self, name, text_bytes=0):
+        self.name = name
+        self.text_bytes = text_bytes
+        self.started = time.monotonic()
+        self.lines = 0
+        self.fraction = None
+        self.done = None
+        self.total = None
+        self.last_progress = None
+        self.returncode = None
+        self.attempt = 1
+        self.stalled = False
+
+    def progress(self, fraction, done=None, total=None):
+        self.fraction = fraction
+        self.done, self.total = done, total
+        self.last_progress = time.monotonic()
+
+    @property
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+    def eta(self):
+        """Seconds left at the current rate, or None before any progress"""
+
+        if not self.fraction:
+            return None
+        return self.elapsed * (1 - self.fraction) / self.fraction
+
+    def detail(self):
+        parts = []
+        if self.done is not None:
+            parts.append(f"{self.done}/{self.total}")
+        parts.append(f"{self.elapsed:.0f}s")
+        eta = self.eta()
+        if eta is not None:
+            parts.append(f"ETA {eta:.0f}s")
+        return " ".join(parts)
+
+    def as_dict(self):
+        return {
+            "name": self.name,
+            "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "seconds": round(self.elapsed, 2),
+            "text_bytes": self.text_bytes,
+            "bytes_per_second": round(self.text_bytes / self.elapsed, 1) if self.elapsed > 0 else None,
+            "log_lines": self.lines,
+            "progress": self.fraction,
+            "returncode": self.returncode,
+            "attempt": self.attempt,
+            "stalled": self.stalled,
+        }
+
+    def save(self, metrics_file=None):
+        """Append this run to the metrics log (one JSON object per line)"""
+
+        metrics_file = metrics_file or os.environ.get(METRICS_ENV_VAR) or METRICS_FILE
+        Path(metrics_file).parent.mkdir(parents=True, exist_ok=True)
+        with open(metrics_file, "a", encoding="utf-8") as f:
+            f.write(json.dumps(self.as_dict()) + "\n")
+
+
+class Watchdog:
+    """Kills a process that has made no forward progress for stall_timeout seconds"""
+
+    def __init__(self, stall_timeout, watch_file=None, poll_interval=1.0):
+        """
+        Args:
+            stall_timeout (float): Seconds without progress before the process is killed
+            watch_file (Path): Output file whose growth also counts as progress
+            poll_interval (float): Seconds between checks
+        """
+
+        self.stall_timeout = stall_timeout
+        self.watch_file = watch_file
+        self.poll_interval = min(poll_interval, stall_timeout / 4)
+        self.last_activity = time.monotonic()
+        self.stalled = False
+        self._size = None
+        self._stop = threading.Event()
+
+    def touch(self):
+        """Record forward progress"""
+
+        self.last_activity = time.monotonic()
+
+    def idle(self):
+        return time.monotonic() - self.last_activity
+
+    def _check_output(self):
+        try:
+            size = os.path.getsize(self.watch_file)
+        except OSError:
+            return
+        if size != self._size:
+            self._size = size
+            self.touch()
+
+    def watch(self, process):
+        """Poll until the process exits or stop() is called; kill it if it stalls"""
+
+        while not self._stop.wait(self.poll_interval):
+            if process.poll() is not None:
+                return
+            if self.watch_file is not None:
+                self._check_output()
+            if self.idle() > self.stall_timeout:
+                self.stalled = True
+                process.terminate()
+                try:
+                    process.wait(KILL_GRACE)
+                except subprocess.TimeoutExpired:
+                    process.kill()
+                return
+
+    def stop(self):
+        self._stop.set()
+
+
+def _feed(pipe, text):
+    # Written from a thread so a child that logs before reading all of its
+    # input cannot deadlock against us
+    try:
+        pipe.write(text)
+    except BrokenPipeError:
+        pass
+    finally:
+        try:
+            pipe.close()
+        except BrokenPipeError:
+            pass
+
+
+def run_streaming(command, text, on_line=None, log_lines=LOG_LINES, cwd=None, watchdog=None):
+    """
+    Run a command with text on its stdin, handing each output line to on_line
+
+    stdout and stderr are read together as lines arrive; only the last
+    log_lines of them are kept. A Watchdog, if given, may kill the process
+    while it runs (watchdog.stalled tells afterwards).
+
+    Returns:
+        tuple: (return code, deque of the last log lines)
+    """
+
+    env = dict(os.environ, PYTHONUNBUFFERED="1")
+    process = subprocess.Popen(
+        command,
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        text=True,
+        encoding="utf-8",
+        errors="replace",
+        cwd=cwd,
+        env=env,
+    )
+    feeder = threading.Thread(target=_feed, args=(process.stdin, text), daemon=True)
+    feeder.start()
+    watcher = None
+    if watchdog is not None:
+        watcher = threading.Thread(target=watchdog.watch, args=(process,), daemon=True)
+        watcher.start()
+
+    log = deque(maxlen=log_lines)
+    try:
+        for line in process.stdout:
+            line = line.rstrip()
+            if not line:
+                continue
+            log.append(line)
+            if on_line is not None:
+                on_line(line)
+    finally:
+        process.stdout.close()
+        returncode = process.wait()
+        feeder.join()
+        if watcher is not None:
+            watchdog.stop()
+            watcher.join()
+    return returncode, log
+
+
+def run_with_progress(command, text, name, cwd=None, show=True, stall_timeout=None, watch_file=None):
+    """
+    Run the streamer with a live progress bar and record its metrics
+
+    Args:
+        stall_timeout (float): Kill the run after this many seconds without
+            progress (None: wait forever)
+        watch_file (Path): Output file whose growth counts as progress
+
+    Returns:
+        tuple: (return code, deque of the last log lines, RunMetrics)
+    """
+
+    metrics = RunMetrics(name, len(text.encode("utf-8")))
+    bar = ProgressBar(name[:24]) if show else None
+    watchdog = Watchdog(stall_timeout, watch_file) if stall_timeout else None
+
+    def on_line(line):
+        metrics.lines += 1
+        progress = parse_progress(line)
+        if progress is not None:
+            if watchdog is not None and (metrics.fraction is None or progress[0] > metrics.fraction):
+                watchdog.touch()
+            metrics.progress(*progress)
+        elif watchdog is not None and metrics.fraction is None:
+            # Until the first progress report (model loading), any line counts
+            watchdog.touch()
+        if bar is not None:
+            bar.update(metrics.fraction, metrics.detail())
+
+    try:
+        returncode, log = run_streaming(command, text, on_line, cwd=cwd, watchdog=watchdog)
+    finally:
+        if bar is not None:
+            bar.update(metrics.fraction, metrics.detail(), force=True)
+            bar.close()
+    metrics.returncode = returncode
+    if watchdog is not None and watchdog.stalled:
+        metrics.stalled = True
+        log.append(f"[watchdog] no progress for {stall_timeout:g} seconds - process killed")
+    return returncode, log, metrics
+
+
+def print_log(log, stream=None):
+    """Print the kept log lines, e.g. after a failed run"""
+
+    stream = stream or sys.stdout
+    print(f"Last {len(log)} log lines:", file=stream)
+    for line in log:
+        print(f"  {line}", file=stream)
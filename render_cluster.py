@@ -0,0 +1,612 @@
+#!/usr/bin/env python3
+"""
+Kokoro TTS Render Cluster
+Shares a batch of chapters between worker processes on several machines
+
+A coordinator hands out chapters as leases, either over plain TCP or
+through lease files on a shared filesystem. Workers render the chapter,
+send heartbeats while they work and upload the result into the
+coordinator's audio_output folder. A lease that is not renewed in time
+expires and the chapter is given to another worker.
+
+Usage:
+  python render_cluster.py coordinator [--input text_input] [--port 8765]
+  python render_cluster.py worker --host <coordinator> [--port 8765]
+  python render_cluster.py coordinator --shared /mnt/render
+  python render_cluster.py worker --shared /mnt/render
+"""
+
+import argparse
+import glob
+import json
+import os
+import re
+import shutil
+import socket
+import socketserver
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from pathlib import Path
+
+DEFAULT_PORT = 8765
+LEASE_SECONDS = 60
+HEARTBEAT_SECONDS = 10
+MAX_ATTEMPTS = 3
+
+
+def send_message(stream, message):
+    """Write one JSON message as a line"""
+
+    stream.write(json.dumps(message).encode("utf-8") + b"\n")
+    stream.flush()
+
+
+def read_message(stream):
+    """Read one JSON message line, or None if the connection closed"""
+
+    line = stream.readline()
+    if not line:
+        return None
+    return json.loads(line.decode("utf-8"))
+
+
+def copy_exactly(src, dst, size, chunk_size=1 << 20):
+    """Copy exactly size bytes between file objects without holding them in memory"""
+
+    remaining = size
+    while remaining:
+        chunk = src.read(min(chunk_size, remaining))
+        if not chunk:
+            raise ConnectionError("Connection closed during upload")
+        dst.write(chunk)
+        remaining -= len(chunk)
+
+
+class WorkQueue:
+    """
+    Chapters waiting, leased and finished, shared by the coordinator threads
+    """
+
+    def __init__(self, input_files, lease_seconds=LEASE_SECONDS, max_attempts=MAX_ATTEMPTS):
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.units = {Path(f).stem: Path(f) for f in input_files}
+        self.pending = list(self.units)
+        self.leases = {}        # unit -> (worker, expires)
+        self.attempts = {unit: 0 for unit in self.units}
+        self.done = set()
+        self.failed = set()
+        self.lock = threading.Lock()
+        self.finished = threading.Event()
+        self._check_finished()
+
+    def _check_finished(self):
+        if len(self.done) + len(self.failed) == len(self.units):
+            self.finished.set()
+
+    def lease(self, worker):
+        """Give the next chapter to a worker, or None if nothing is waiting"""
+
+        with self.lock:
+            self.expire_leases()
+            if not self.pending:
+                return None
+            unit = self.pending.pop(0)
+            self.leases[unit] = (worker, time.time() + self.lease_seconds)
+            self.attempts[unit] += 1
+            print(f"Leased {unit} to {worker} (attempt {self.attempts[unit]})")
+            return unit
+
+    def heartbeat(self, worker, unit):
+        """Extend a lease; returns False if the worker no longer holds it"""
+
+        with self.lock:
+            holder = self.leases.get(unit)
+            if holder is None or holder[0] != worker:
+                return False
+            self.leases[unit] = (worker, time.time() + self.lease_seconds)
+            return True
+
+    def complete(self, worker, unit):
+        with self.lock:
+            holder = self.leases.pop(unit, None)
+            if unit in self.done:
+                return
+            self.done.add(unit)
+            if unit in self.pending:
+                self.pending.remove(unit)
+            owner = holder[0] if holder else worker
+            print(f"Completed {unit} by {owner} ({len(self.done)}/{len(self.units)})")
+            self._check_finished()
+
+    def fail(self, worker, unit, error=""):
+        with self.lock:
+            holder = self.leases.get(unit)
+            if holder is None or holder[0] != worker:
+                return
+            del self.leases[unit]
+            print(f"Worker {worker} failed {unit}: {error}")
+            self._requeue(unit)
+
+    def _requeue(self, unit):
+        if self.attempts[unit] >= self.max_attempts:
+            print(f"Giving up on {unit} after {self.attempts[unit]} attempts")
+            self.failed.add(unit)
+            self._check_finished()
+        else:
+            self.pending.append(unit)
+
+    def expire_leases(self):
+        """Return expired leases to the queue (call with the lock held)"""
+
+        now = time.time()
+        for unit, (worker, expires) in list(self.leases.items()):
+            if expires < now:
+                del self.leases[unit]
+                print(f"Lease on {unit} held by {worker} expired - reassigning")
+                self._requeue(unit)
+
+
+class CoordinatorHandler(socketserver.StreamRequestHandler):
+    """Handles one worker connection (one request per line)"""
+
+    def handle(self):
+        queue = self.server.queue
+        while True:
+            message = read_message(self.rfile)
+            if message is None:
+                return
+            op = message.get("op")
+            worker = message.get("worker", "?")
+
+            if op == "lease":
+                unit = queue.lease(worker)
+                if unit is None:
+                    send_message(self.wfile, {"unit": None, "done": queue.finished.is_set()})
+                    continue
+                path = queue.units[unit]
+                with open(path, "r", encoding="utf-8") as f:
+                    text = f.read()
+                send_message(self.wfile, {
+                    "unit": unit,
+                    "name": path.name,
+                    "text": text,
+                    "voice": self.server.voice,
+                    "speed": self.server.speed,
+                    "lease_seconds": queue.lease_seconds,
+                })
+            elif op == "heartbeat":
+                send_message(self.wfile, {"ok": queue.heartbeat(worker, message["unit"])})
+            elif op == "upload":
+                ok = self.receive_upload(message)
+                send_message(self.wfile, {"ok": ok})
+            elif op == "complete":
+                queue.complete(worker, message["unit"])
+                send_message(self.wfile, {"ok": True})
+            elif op == "fail":
+                queue.fail(worker, message["unit"], message.get("error", ""))
+                send_message(self.wfile, {"ok": True})
+            else:
+                send_message(self.wfile, {"error": f"unknown op {op!r}"})
+
+    def receive_upload(self, message):
+        """Store an uploaded output file in audio_output (atomically)"""
+
+        filename = Path(message["filename"]).name
+        target = self.server.output_dir / filename
+        partial = target.with_name(target.name + f".{uuid.uuid4().hex[:8]}.part")
+        with open(partial, "wb") as f:
+            copy_exactly(self.rfile, f, message["size"])
+        os.replace(partial, target)
+        print(f"Received {filename} ({message['size']:,} bytes) from {message.get('worker', '?')}")
+        return True
+
+
+class CoordinatorServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+def run_coordinator(input_dir="text_input", host="0.0.0.0", port=DEFAULT_PORT, output_dir="audio_output",
+                    voice="af_bella", speed=1.0, lease_seconds=LEASE_SECONDS):
+    """
+    Serve the chapters in input_dir to TCP workers until all are rendered
+
+    Returns:
+        bool: True if every chapter was rendered
+    """
+
+    input_files = sorted(Path(input_dir).glob("*.txt"))
+    if not input_files:
+        print(f"No .txt files found in {input_dir}")
+        return False
+
+    Path(output_dir).mkdir(exist_ok=True)
+    queue = WorkQueue(input_files, lease_seconds)
+    server = CoordinatorServer((host, port), CoordinatorHandler)
+    server.queue = queue
+    server.output_dir = Path(output_dir)
+    server.voice = voice
+    server.speed = speed
+
+    print(f"Coordinator listening on {host}:{server.server_address[1]} with {len(input_files)} chapters")
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        while not queue.finished.wait(1.0):
+            with queue.lock:
+                queue.expire_leases()
+        # Give idle workers a moment to hear that the batch is done
+        time.sleep(2.0)
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    print(f"Rendered {len(queue.done)} chapters, {len(queue.failed)} failed")
+    return not queue.failed
+
+
+def render_text(text, name, voice, speed, work_dir):
+    """
+    Render one chapter locally and return the files it produced
+
+    The audio goes to work_dir/audio_output so the worker's own
+    audio_output never collides with files from other jobs; the settings
+    come from the worker's config.txt, as in a local run.
+    """
+
+    import text_to_audio_batch
+
+    input_file = Path(work_dir) / name
+    input_file.write_text(text, encoding="utf-8")
+    output_dir = Path(work_dir) / "audio_output"
+    if not text_to_audio_batch.convert_text_to_audio(str(input_file), voice, speed, str(output_dir)):
+        return None
+    return chapter_outputs(output_dir, input_file.stem)
+
+
+def chapter_outputs(folder, unit):
+    """The output of a chapter and its speed variants (<unit>.wav, <unit>_1.2x.wav, ...)"""
+
+    names = re.compile(re.escape(unit) + r"(_\d+(\.\d+)?x)?\.wav")
+    return sorted(p for p in Path(folder).glob(f"{glob.escape(unit)}*.wav") if names.fullmatch(p.name))
+
+
+class Heartbeat(threading.Thread):
+    """Renews a lease in the background while a chapter renders"""
+
+    def __init__(self, beat, interval=HEARTBEAT_SECONDS):
+        super().__init__(daemon=True)
+        self.beat = beat
+        self.interval = interval
+        self.stop_event = threading.Event()
+        self.lost = False
+
+    def run(self):
+        while not self.stop_event.wait(self.interval):
+            try:
+                if not self.beat():
+                    self.lost = True
+                    print("Lease lost - another worker will render this chapter")
+                    return
+            except (OSError, ValueError) as e:
+                print(f"Heartbeat failed: {e}")
+
+    def stop(self):
+        self.stop_event.set()
+        self.join()
+
+
+def run_tcp_worker(host, port=DEFAULT_PORT, worker_id=None, render=render_text, poll_seconds=5.0):
+    """
+    Lease chapters from a TCP coordinator until the batch is done
+
+    Returns:
+        int: Number of chapters this worker rendered
+    """
+
+    worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+    rendered = 0
+
+    with socket.create_connection((host, port)) as sock:
+        stream = sock.makefile("rwb")
+        lock = threading.Lock()
+
+        def request(message, payload=None):
+            message["worker"] = worker_id
+            with lock:
+                send_message(stream, message)
+                if payload is not None:
+                    shutil.copyfileobj(payload, stream, 1 << 20)
+                    stream.flush()
+                return read_message(stream)
+
+        print(f"Worker {worker_id} connected to {host}:{port}")
+        while True:
+            job = request({"op": "lease"})
+            if job is None:
+                break
+            if job["unit"] is None:
+                if job.get("done"):
+                    break
+                time.sleep(poll_seconds)
+                continue
+
+            unit = job["unit"]
+
+            def beat():
+                reply = request({"op": "heartbeat", "unit": unit})
+                if reply is None:
+                    raise ConnectionError("coordinator closed the connection")
+                return reply["ok"]
+
+            heartbeat = Heartbeat(beat, min(HEARTBEAT_SECONDS, job["lease_seconds"] / 3))
+            heartbeat.start()
+            with tempfile.TemporaryDirectory() as work_dir:
+                try:
+                    outputs = render(job["text"], job["name"], job["voice"], job["speed"], work_dir)
+                finally:
+                    heartbeat.stop()
+
+                if heartbeat.lost:
+                    continue
+                if not outputs:
+                    request({"op": "fail", "unit": unit, "error": "render failed"})
+                    continue
+                for output in outputs:
+                    with open(output, "rb") as f:
+                        request({"op": "upload", "unit": unit, "filename": output.name,
+                                 "size": output.stat().st_size}, payload=f)
+                request({"op": "complete", "unit": unit})
+                rendered += 1
+
+    print(f"Worker {worker_id} finished after rendering {rendered} chapters")
+    return rendered
+
+
+class SharedDirectory:
+    """
+    Lease files on a shared filesystem, for clusters without a network port
+
+    Layout under the shared root:
+        queue/    chapter texts waiting to be rendered
+        leases/   <chapter>.lease, kept fresh by the worker's heartbeat
+        results/  finished audio, collected by the coordinator
+        failed/   attempt counters for chapters that keep failing
+    """
+
+    def __init__(self, root, lease_seconds=LEASE_SECONDS):
+        self.root = Path(root)
+        self.lease_seconds = lease_seconds
+        self.queue = self.root / "queue"
+        self.leases = self.root / "leases"
+        self.results = self.root / "results"
+        self.failed = self.root / "failed"
+        for folder in (self.queue, self.leases, self.results, self.failed):
+            folder.mkdir(parents=True, exist_ok=True)
+
+    def lease_path(self, unit):
+        return self.leases / f"{unit}.lease"
+
+    def expired(self, path):
+        """True if a lease file exists and has not been renewed in time"""
+
+        try:
+            return time.time() - path.stat().st_mtime > self.lease_seconds
+        except FileNotFoundError:
+            return False
+
+    def try_lease(self, unit, worker):
+        """Atomically claim a chapter; stale leases may be taken over"""
+
+        path = self.lease_path(unit)
+        if self.expired(path):
+            # One rename moves the lease aside, so only one worker gets it;
+            # what was moved is checked again, as it may have been renewed
+            # or claimed afresh since it was found stale
+            moved = path.with_name(f"{path.name}.{uuid.uuid4().hex[:8]}.stale")
+            try:
+                os.rename(path, moved)
+            except FileNotFoundError:
+                pass
+            else:
+                if not self.expired(moved):
+                    try:
+                        os.link(moved, path)
+                    except FileExistsError:
+                        pass
+                    moved.unlink()
+                    return False
+                moved.unlink()
+                print(f"Lease on {unit} expired - taking it over")
+
+        try:
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            return False
+        with os.fdopen(fd, "w") as f:
+            json.dump({"worker": worker, "leased": time.time()}, f)
+        return True
+
+    def holds_lease(self, unit, worker):
+        try:
+            return json.loads(self.lease_path(unit).read_text()).get("worker") == worker
+        except (FileNotFoundError, ValueError):
+            return False
+
+    def heartbeat(self, unit, worker):
+        if not self.holds_lease(unit, worker):
+            return False
+        os.utime(self.lease_path(unit))
+        return True
+
+    def release(self, unit):
+        try:
+            self.lease_path(unit).unlink()
+        except FileNotFoundError:
+            pass
+
+    def record_failure(self, unit):
+        counter = self.failed / f"{unit}.count"
+        count = int(counter.read_text()) + 1 if counter.exists() else 1
+        counter.write_text(str(count))
+        return count
+
+
+def run_shared_coordinator(shared_dir, input_dir="text_input", output_dir="audio_output", voice="af_bella",
+                           speed=1.0, lease_seconds=LEASE_SECONDS, poll_seconds=2.0):
+    """
+    Seed a shared directory with chapters and collect the results
+
+    Returns:
+        bool: True if every chapter was rendered
+    """
+
+    shared = SharedDirectory(shared_dir, lease_seconds)
+    input_files = sorted(Path(input_dir).glob("*.txt"))
+    if not input_files:
+        print(f"No .txt files found in {input_dir}")
+        return False
+
+    (shared.root / "settings.json").write_text(json.dumps({"voice": voice, "speed": speed,
+                                                           "lease_seconds": lease_seconds}))
+    for f in input_files:
+        # A reused directory may still hold this chapter's attempt count,
+        # give-up marker or finished audio from an earlier run
+        unit = f.stem
+        for stale in [shared.failed / f"{unit}.count", shared.failed / f"{unit}.giveup",
+                      shared.results / f"{unit}.done", *chapter_outputs(shared.results, unit)]:
+            stale.unlink(missing_ok=True)
+        shutil.copyfile(f, shared.queue / f.name)
+    Path(output_dir).mkdir(exist_ok=True)
+    remaining = {f.stem for f in input_files}
+    print(f"Shared queue {shared.queue} seeded with {len(input_files)} chapters")
+
+    while remaining:
+        for done_marker in shared.results.glob("*.done"):
+            unit = done_marker.stem
+            for output in chapter_outputs(shared.results, unit):
+                shutil.move(str(output), Path(output_dir) / output.name)
+            done_marker.unlink()
+            (shared.queue / f"{unit}.txt").unlink(missing_ok=True)
+            shared.release(unit)
+            remaining.discard(unit)
+            print(f"Collected {unit} ({len(input_files) - len(remaining)}/{len(input_files)})")
+
+        for unit in list(remaining):
+            if not (shared.queue / f"{unit}.txt").exists():
+                print(f"Giving up on {unit}")
+                remaining.discard(unit)
+        if remaining:
+            time.sleep(poll_seconds)
+
+    return not any((shared.failed / f"{f.stem}.giveup").exists() for f in input_files)
+
+
+def run_shared_worker(shared_dir, worker_id=None, render=render_text, poll_seconds=5.0):
+    """
+    Render chapters from a shared directory until its queue is empty
+
+    Returns:
+        int: Number of chapters this worker rendered
+    """
+
+    worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+    settings_file = Path(shared_dir) / "settings.json"
+    settings = json.loads(settings_file.read_text()) if settings_file.exists() else {}
+    shared = SharedDirectory(shared_dir, settings.get("lease_seconds", LEASE_SECONDS))
+    voice = settings.get("voice", "af_bella")
+    speed = settings.get("speed", 1.0)
+    rendered = 0
+
+    print(f"Worker {worker_id} watching {shared.queue}")
+    while True:
+        waiting = sorted(shared.queue.glob("*.txt"))
+        if not waiting:
+            break
+
+        claimed = None
+        for chapter in waiting:
+            if (shared.results / f"{chapter.stem}.done").exists():
+                continue
+            if chapter.exists() and shared.try_lease(chapter.stem, worker_id):
+                claimed = chapter
+                break
+        if claimed is None:
+            time.sleep(poll_seconds)
+            continue
+
+        unit = claimed.stem
+        print(f"Worker {worker_id} rendering {unit}")
+        heartbeat = Heartbeat(lambda: shared.heartbeat(unit, worker_id),
+                              min(HEARTBEAT_SECONDS, shared.lease_seconds / 3))
+        heartbeat.start()
+        with tempfile.TemporaryDirectory() as work_dir:
+            try:
+                text = claimed.read_text(encoding="utf-8")
+                outputs = render(text, claimed.name, voice, speed, work_dir)
+            except FileNotFoundError:
+                outputs = None
+            finally:
+                heartbeat.stop()
+
+            if heartbeat.lost:
+                continue
+            if not outputs:
+                if shared.record_failure(unit) >= MAX_ATTEMPTS:
+                    print(f"Giving up on {unit} after {MAX_ATTEMPTS} attempts")
+                    claimed.unlink(missing_ok=True)
+                    (shared.failed / f"{unit}.giveup").touch()
+                shared.release(unit)
+                continue
+
+            for output in outputs:
+                partial = shared.results / f"{output.name}.part"
+                shutil.copyfile(output, partial)
+                os.replace(partial, shared.results / output.name)
+            (shared.results / f"{unit}.done").touch()
+            rendered += 1
+
+    print(f"Worker {worker_id} finished after rendering {rendered} chapters")
+    return rendered
+
+
+def main():
+    """Main function with command line interface"""
+
+    parser = argparse.ArgumentParser(description="Share a batch of chapters between render workers")
+    parser.add_argument("role", choices=["coordinator", "worker"])
+    parser.add_argument("--host", default="127.0.0.1", help="Coordinator address (worker)")
+    parser.add_argument("--bind", default="0.0.0.0", help="Address to listen on (coordinator)")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--shared", help="Use lease files in this shared directory instead of TCP")
+    parser.add_argument("--input", default="text_input", help="Folder of chapter .txt files (coordinator)")
+    parser.add_argument("--output", default="audio_output", help="Where results are collected (coordinator)")
+    parser.add_argument("--lease", type=float, default=LEASE_SECONDS, help="Lease length in seconds")
+    parser.add_argument("--worker-id", help="Name reported by this worker")
+    args = parser.parse_args()
+
+    from tts_config import load_config, get_float
+
+    config = load_config()
+    voice = config["VOICE"]
+    speed = get_float(config, "SPEED", 1.0)
+
+    if args.role == "coordinator":
+        if args.shared:
+            return run_shared_coordinator(args.shared, args.input, args.output, voice, speed, args.lease)
+        return run_coordinator(args.input, args.bind, args.port, args.output, voice, speed, args.lease)
+
+    if args.shared:
+        run_shared_worker(args.shared, args.worker_id)
+    else:
+        run_tcp_worker(args.host, args.port, args.worker_id)
+    return True
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
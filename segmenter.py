@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+"""
+Sentence Segmenter and Chunk Packer
+Cuts text into sentences and packs them into chunks that fit the TTS model
+
+Kokoro reads at most MAX_TOKENS phoneme tokens per call; longer input is
+cut off. Sentences are found with a few precompiled patterns that know
+about abbreviations ("Dr.", "e.g."), initials, ellipses, closing quotes and
+footnote markers ("end.12 Next", "end.[3] Next"), and are then packed
+greedily into chunks that stay under the limit, so a chapter becomes a few
+full-length calls instead of hundreds of tiny ones or one truncated one.
+
+Chunks remember which sentences they hold, so the render cache, resuming
+and parallel rendering can all work on the same units. Converters hand
+them to the engine through incremental.synthesize_chunks, which batches
+them for the streamer so the model is not loaded again for every chunk.
+"""
+
+import re
+import sys
+import time
+from collections import namedtuple
+
+MAX_TOKENS = 510
+
+ABBREVIATIONS = {
+    "mr", "mrs", "ms", "dr", "prof", "sr", "jr", "st", "mt", "rev", "gen", "col",
+    "capt", "lt", "sgt", "gov", "sen", "rep", "hon", "messrs",
+    "vs", "etc", "e.g", "i.e", "cf", "al", "viz", "ca", "approx",
+    "fig", "figs", "no", "nos", "vol", "vols", "ch", "chap", "p", "pp", "ed", "eds",
+    "inc", "ltd", "co", "corp", "dept", "univ",
+    "jan", "feb", "mar", "apr", "jun", "jul", "aug", "sep", "sept", "oct", "nov", "dec",
+}
+
+Chunk = namedtuple("Chunk", "text first last")   # sentences[first:last]
+
+_PARAGRAPH = re.compile(r'\n\s*\n')
+_BOUNDARY = re.compile(r'''
+    (?P<end>\.\.\.|…|[.!?]+)                         # terminal punctuation or ellipsis
+    (?P<close>["'”’)\]]*)                       # closing quotes and brackets
+    (?P<note>\[\d{1,3}\]|\d{1,3}|[¹²³⁰⁴⁵⁶⁷⁸⁹]+|\*+|†|‡)?  # footnote marker
+    ["'”’)\]]*
+    \s+
+''', re.VERBOSE)
+_DOTTED = re.compile(r'(?:[A-Za-z]\.)+[A-Za-z]?$')
+_CLAUSE = re.compile(r'(?<=[,;:—])\s+|\s+(?=—)')
+_SPACES = re.compile(r'\s+')
+
+
+def _is_boundary(text, match):
+    end = match.end()
+    if end >= len(text):
+        return True
+    following = text[end]
+    if following.islower():
+        return False
+
+    punctuation = match.group("end")
+    if punctuation != ".":
+        return True
+
+    # The word the period belongs to
+    word_start = text.rfind(" ", 0, match.start()) + 1
+    word = text[word_start:match.start()].lstrip("\"'(“‘[").rstrip(".")
+    if word.lower() in ABBREVIATIONS:
+        return False
+    if len(word) == 1 and word.isupper():
+        return False        # an initial, as in "J. R. Tolkien"
+    if _DOTTED.match(word):
+        return False        # "U.S.", "a.m."
+    note = match.group("note")
+    if note and note.isdigit() and word[-1:].isdigit():
+        return False        # a decimal number such as "2.0"
+    return True
+
+
+def sentence_spans(text, strip_notes=True):
+    """
+    Split text into sentences and say where each one is in the text
+
+    Returns:
+        list: (sentence, start, end) with text[start:end] the sentence as
+            written; the same sentences as split_sentences returns
+    """
+
+    # Paragraphs are the stretches between the breaks
+    edges = [0]
+    for match in _PARAGRAPH.finditer(text):
+        edges += [match.start(), match.end()]
+    edges.append(len(text))
+
+    spans = []
+    for offset, stop in zip(edges[::2], edges[1::2]):
+        paragraph = text[offset:stop]
+        start = 0
+        for match in _BOUNDARY.finditer(paragraph):
+            if not _is_boundary(paragraph, match):
+                continue
+            if strip_notes and match.group("note"):
+                sentence = paragraph[start:match.start("note")] + paragraph[match.end("note"):match.end()]
+            else:
+                sentence = paragraph[start:match.end()]
+            spans.append((sentence, offset + start, offset + match.end()))
+            start = match.end()
+        spans.append((paragraph[start:], offset + start, offset + len(paragraph)))
+
+    result = []
+    for sentence, start, end in spans:
+        collapsed = _SPACES.sub(" ", sentence).strip()
+        if collapsed:
+            # Leading and trailing whitespace is not part of the sentence
+            raw = text[start:end]
+            start += len(raw) - len(raw.lstrip())
+            end -= len(raw) - len(raw.rstrip())
+            result.append((collapsed, start, end))
+    return result
+
+
+def split_sentences(text, strip_notes=True):
+    """
+    Split text into sentences (paragraph breaks always end a sentence)
+
+    Args:
+        text (str): The text
+        strip_notes (bool): Drop footnote markers after sentence ends,
+            so they are not read aloud
+
+    Returns:
+        list: The sentences, with runs of whitespace collapsed
+    """
+
+    return [sentence for sentence, _, _ in sentence_spans(text, strip_notes)]
+
+
+def estimate_tokens(text):
+    """
+    Estimate how many phoneme tokens the model needs for text
+
+    English averages a little under one phoneme per letter, and spaces and
+    punctuation are tokens of their own, so the character count is a safe
+    upper bound without running the phonemizer.
+    """
+
+    return len(text)
+
+
+def split_long(sentence, max_tokens=MAX_TOKENS, count_tokens=estimate_tokens):
+    """Break a sentence that is too long for one call at clause breaks, then between words"""
+
+    pieces = []
+    current = ""
+    for part in _CLAUSE.split(sentence):
+        for word in ([part] if count_tokens(part) <= max_tokens else part.split(" ")):
+            candidate = f"{current} {word}" if current else word
+            if count_tokens(candidate) <= max_tokens or not current:
+                current = candidate
+            else:
+                pieces.append(current)
+                current = word
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def pack_chunks(sentences, max_tokens=MAX_TOKENS, count_tokens=estimate_tokens):
+    """
+    Pack consecutive sentences into chunks of at most max_tokens
+
+    A sentence is never split unless it is too long on its own; its pieces
+    then become separate chunks that all cover that one sentence.
+
+    Returns:
+        list: Chunk(text, first, last) covering sentences[first:last]
+    """
+
+    chunks = []
+    current = []
+    tokens = 0
+    first = 0
+    for index, sentence in enumerate(sentences):
+        size = count_tokens(sentence)
+        # One token for the space joining it to the previous sentence
+        if current and tokens + 1 + size > max_tokens:
+            chunks.append(Chunk(" ".join(current), first, index))
+            current, tokens = [], 0
+        if size > max_tokens:
+            chunks.extend(Chunk(piece, index, index + 1) for piece in split_long(sentence, max_tokens, count_tokens))
+            first = index + 1
+            continue
+        if not current:
+            first = index
+            tokens = size
+        else:
+            tokens += 1 + size
+        current.append(sentence)
+    if current:
+        chunks.append(Chunk(" ".join(current), first, len(sentences)))
+    return chunks
+
+
+def segment(text, max_tokens=MAX_TOKENS):
+    """Split text into sentences and pack them; returns (sentences, chunks)"""
+
+    sentences = split_sentences(text)
+    return sentences, pack_chunks(sentences, max_tokens)
+
+
+def main():
+    """Main function - show how a text file would be chunked"""
+
+    if len(sys.argv) < 2:
+        print("Usage: python segmenter.py <input_file> [max_tokens]")
+        return False
+
+    with open(sys.argv[1], "r", encoding="utf-8") as f:
+        text = f.read()
+    max_tokens = int(sys.argv[2]) if len(sys.argv) > 2 else MAX_TOKENS
+
+    start = time.perf_counter()
+    sentences, chunks = segment(text, max_tokens)
+    elapsed = time.perf_counter() - start
+
+    sizes = [estimate_tokens(chunk.text) for chunk in chunks]
+    print(f"{len(text.split()):,} words -> {len(sentences):,} sentences -> {len(chunks):,} chunks "
+          f"in {elapsed * 1000:.1f} ms")
+    if sizes:
+        print(f"Chunk size: {min(sizes)}-{max(sizes)} tokens, average {sum(sizes) / len(sizes):.0f} "
+              f"(limit {max_tokens})")
+    return True
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
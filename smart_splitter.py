@@ -6,6 +6,7 @@ Handles messy PDFs and detects chapters automatically
 
 import re
 import os
+import sys
 from pathlib import Path
 from collections import Counter
 
@@ -14,7 +15,10 @@ def analyze_document_structure(input_file):
     Analyze a document to find chapter patterns and structure
     """
     
+    from memprofile import mark
+    
     # Read the file
+    mark("read")
     try:
         encodings = ['utf-8-sig', 'utf-8', 'cp1252', 'latin1']
         content = None
@@ -36,6 +40,7 @@ def analyze_document_structure(input_file):
         print(f"Error reading file: {e}")
         return None
     
+    mark("analyze")
     print(f"Document size: {len(content):,} characters")
     print(f"Document size: {len(content.split()):,} words")
     
@@ -74,30 +79,29 @@ def analyze_document_structure(input_file):
         
         print(f"Page breaks (\\f): {page_breaks}")
         print(f"Triple newlines: {double_newlines}")
-        
-        # Look for common book patterns
-        common_patterns = [
-            r'\n\s*\d+\s*\n',      # Numbers on their own line
-            r'\n\s*[A-Z][A-Z\s]+\n',  # All caps headers
-            r'\n\s*[A-Z][a-z]+\s+[A-Z][a-z]+\n',  # Title case headers
-        ]
-        
-        for pattern in common_patterns:
-            matches = re.findall(pattern, content)
-            if len(matches) > 5:  # Only if we find several
-                print(f"Found potential headers with pattern '{pattern}': {len(matches)} matches")
-                print(f"  Examples: {matches[:3]}")
+        # Headings are detected by line statistics when splitting
     
-    return content, all_matches
+    return content, all_matches, encoding
 
-def smart_split_document(content, output_folder="smart_chapters"):
+def smart_split_document(content, output_folder="smart_chapters", manifest_file=None, source=None, encoding=None):
     """
     Intelligently split document into chapters
+    
+    Args:
+        content (str): The document text
+        output_folder (str): Folder to save chapter files
+        manifest_file (str): Write a split manifest here instead of chapter files
+        source (str): The file content was read from (needed for a manifest)
+        encoding (str): Encoding content was read with (needed for a manifest)
     """
     
+    from memprofile import mark
+    
     # Create output folder
-    Path(output_folder).mkdir(exist_ok=True)
+    if manifest_file is None:
+        Path(output_folder).mkdir(exist_ok=True)
     
+    mark("strategies")
     print("\n" + "="*60)
     print("SMART SPLITTING OPTIONS")
     print("="*60)
@@ -123,7 +127,23 @@ def smart_split_document(content, output_folder="smart_chapters"):
             strategies.append(("Chapter Pattern", pattern, chapters))
             print(f"Strategy: Chapter Pattern '{pattern}' - Found {len(chapters)//2} chapters")
     
-    # Strategy 2: Page-based splitting (if document is very long)
+    # Strategy 2: Headings found by line statistics (no "Chapter N" text needed)
+    if not strategies:
+        # Score every line as a possible heading (length, capitals, digits,
+        # blank lines around it, repetition across the document); only
+        # needed, and NumPy only imported, when no pattern matched
+        from heading_detector import heading_spans
+        
+        spans = heading_spans(content)
+        if spans:
+            sections = [content[start:end] for _, start, end in spans]
+            strategies.append(("Detected Headings", spans, sections))
+            print(f"Strategy: Detected Headings - Found {len(spans)} chapters")
+            print(f"  Examples: {[title for title, _, _ in spans[:5]]}")
+        else:
+            print("No lines look like chapter headings")
+    
+    # Strategy 3: Page-based splitting (if document is very long)
     if len(content) > 100000:  # More than 100k characters
         # Split by approximate page length (assuming 2000 chars per page)
         page_size = 2000
@@ -131,7 +151,7 @@ def smart_split_document(content, output_folder="smart_chapters"):
         strategies.append(("Page-based", f"{page_size} chars", pages))
         print(f"Strategy: Page-based - Would create {len(pages)} files")
     
-    # Strategy 3: Paragraph-based splitting (for very long documents)
+    # Strategy 4: Paragraph-based splitting (for very long documents)
     if len(content) > 200000:  # More than 200k characters
         paragraphs = content.split('\n\n')
         # Group paragraphs into chunks of ~10 paragraphs
@@ -148,7 +168,7 @@ def smart_split_document(content, output_folder="smart_chapters"):
         print("No suitable splitting strategy found!")
         return False
     
-    # Prefer chapter-based splitting
+    # Prefer chapter-based splitting, then detected headings
     best_strategy = strategies[0]
     for strategy in strategies:
         if "Chapter" in strategy[0]:
@@ -156,30 +176,43 @@ def smart_split_document(content, output_folder="smart_chapters"):
             break
     
     print(f"\nUsing strategy: {best_strategy[0]}")
+    mark("write")
+    
+    if manifest_file is not None:
+        from split_manifest import build_manifest, write_manifest
+        
+        spans = strategy_spans(content, best_strategy)
+        write_manifest(build_manifest(source, encoding, spans, content), manifest_file)
+        return True
     
     # Execute the splitting
     if best_strategy[0] == "Chapter Pattern":
-        chapters = best_strategy[2]
-        chapter_count = 0
-        
-        for i in range(0, len(chapters), 2):
-            if i + 1 < len(chapters):
-                chapter_title = chapters[i].strip()
-                chapter_content = chapters[i + 1].strip()
-                
-                # Extract chapter number
-                chapter_match = re.search(r'(\d+)', chapter_title)
-                if chapter_match:
-                    chapter_num = chapter_match.group(1)
-                    chapter_count += 1
-                    
-                    filename = f"Chapter_{chapter_num.zfill(2)}.txt"
-                    filepath = Path(output_folder) / filename
-                    
-                    with open(filepath, 'w', encoding='utf-8') as f:
-                        f.write(f"{chapter_title}\n\n{chapter_content}")
-                    
-                    print(f"Created: {filename}")
+        # The same chapters a manifest lists (see strategy_spans)
+        for i, (chapter_title, start, end) in enumerate(pattern_spans(content, best_strategy[1]), 1):
+            chapter_content = content[start + len(chapter_title):end].strip()
+            chapter_title = chapter_title.strip()
+            
+            # Number the file after the chapter (Chapter 7), or its position (Chapter VII)
+            chapter_match = re.search(r'(\d+)', chapter_title)
+            chapter_num = chapter_match.group(1) if chapter_match else str(i)
+            
+            filename = f"Chapter_{chapter_num.zfill(2)}.txt"
+            filepath = Path(output_folder) / filename
+            
+            with open(filepath, 'w', encoding='utf-8') as f:
+                f.write(f"{chapter_title}\n\n{chapter_content}")
+            
+            print(f"Created: {filename}")
+    
+    elif best_strategy[0] == "Detected Headings":
+        for i, (title, start, end) in enumerate(best_strategy[1], 1):
+            filename = f"Chapter_{i:02d}.txt"
+            filepath = Path(output_folder) / filename
+            
+            with open(filepath, 'w', encoding='utf-8') as f:
+                f.write(content[start:end].strip())
+            
+            print(f"Created: {filename} ({title})")
     
     else:
         # Handle other strategies
@@ -196,6 +229,49 @@ def smart_split_document(content, output_folder="smart_chapters"):
     print(f"\nSplit complete! Created files in '{output_folder}' folder.")
     return True
 
+def pattern_spans(content, pattern):
+    """
+    Return (marker, start, end) character spans for the chapters a pattern finds
+    
+    Each chapter runs from its marker to the next one; the title page and
+    front matter before the first marker belong to no chapter.
+    """
+    
+    markers = list(re.finditer(pattern, content))
+    spans = []
+    for i, m in enumerate(markers):
+        end = markers[i + 1].start() if i + 1 < len(markers) else len(content)
+        spans.append((m.group(1), m.start(), end))
+    return spans
+
+def strategy_spans(content, strategy):
+    """
+    Return (title, start, end) character spans for the pieces a strategy produces
+    
+    Mirrors the file-writing code in smart_split_document, but records
+    positions in content instead of copying the text.
+    """
+    
+    name, detail, items = strategy
+    spans = []
+    
+    if name == "Chapter Pattern":
+        spans = pattern_spans(content, detail)
+    elif name == "Detected Headings":
+        spans = list(detail)
+    elif name == "Page-based":
+        page_size = len(items[0])
+        for i, start in enumerate(range(0, len(content), page_size), 1):
+            spans.append((f"Part {i:02d}", start, min(start + page_size, len(content))))
+    else:
+        # Paragraph chunks were joined with the same '\n\n' they were split on
+        start = 0
+        for i, chunk in enumerate(items, 1):
+            spans.append((f"Part {i:02d}", start, start + len(chunk)))
+            start += len(chunk) + 2
+    
+    return spans
+
 def main():
     """Main function"""
     
@@ -225,7 +301,7 @@ def main():
     if not result:
         return
     
-    content, matches = result
+    content, matches, encoding = result
     
     # Auto-analyze and show preview
     print("\n" + "="*60)
@@ -243,7 +319,11 @@ def main():
     print("\n" + "="*60)
     print("AUTO-SPLITTING DOCUMENT")
     print("="*60)
-    smart_split_document(content)
+    # --manifest writes smart_chapters.json instead of chapter copies
+    if "--manifest" in sys.argv:
+        smart_split_document(content, manifest_file="smart_chapters.json", source=input_file, encoding=encoding)
+    else:
+        smart_split_document(content)
 
 if __name__ == "__main__":
     main()
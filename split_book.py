@@ -6,21 +6,27 @@ Splits a book into individual chapters based on "Chapter X" markers
 
 import re
 import os
+import sys
 from pathlib import Path
 
-def split_book_by_chapters(input_file, output_folder="book_chapters"):
+def split_book_by_chapters(input_file, output_folder="book_chapters", manifest_file=None):
     """
     Split a book into individual chapter files
     
     Args:
         input_file (str): Path to the full book file
         output_folder (str): Folder to save chapter files
+        manifest_file (str): Write a split manifest here instead of chapter files
     """
     
+    from memprofile import mark
+    
     # Create output folder
-    Path(output_folder).mkdir(exist_ok=True)
+    if manifest_file is None:
+        Path(output_folder).mkdir(exist_ok=True)
     
     # Read the book file with proper encoding handling
+    mark("read")
     try:
         # Try different encodings
         encodings = ['utf-8-sig', 'utf-8', 'cp1252', 'latin1']
@@ -43,6 +49,8 @@ def split_book_by_chapters(input_file, output_folder="book_chapters"):
         print(f"Error reading file: {e}")
         return False
     
+    mark("split")
+    
     # Split by chapter markers (Chapter 1, Chapter 2, etc.)
     # This regex looks for "Chapter" followed by a number
     chapter_pattern = r'(Chapter \d+)'
@@ -59,14 +67,28 @@ def split_book_by_chapters(input_file, output_folder="book_chapters"):
     chapter_matches = re.findall(chapter_pattern, content)
     print(f"Found chapter markers: {chapter_matches}")
     
+    if manifest_file is not None:
+        from split_manifest import build_manifest, write_manifest
+        
+        # Each chapter runs from its marker to the next one
+        markers = list(re.finditer(chapter_pattern, content))
+        spans = [(m.group(1), m.start(), markers[i + 1].start() if i + 1 < len(markers) else len(content))
+                 for i, m in enumerate(markers)]
+        write_manifest(build_manifest(input_file, encoding, spans, content), manifest_file)
+        return True
+    
     # Split the content into chapters
     chapters = re.split(chapter_pattern, content)
     
     # Remove empty strings and organize into chapter pairs
     chapters = [ch for ch in chapters if ch.strip()]
+    if chapters and not re.fullmatch(chapter_pattern, chapters[0]):
+        # Title page and front matter before the first chapter
+        chapters = chapters[1:]
     print(f"Split into {len(chapters)} parts")
     
     chapter_count = 0
+    mark("write")
     
     # Process chapters (title + content pairs)
     for i in range(0, len(chapters), 2):
@@ -107,7 +129,9 @@ def main():
     print("Splitting 'The Researcher Full.txt' into chapters...")
     print("=" * 50)
     
-    success = split_book_by_chapters(book_file)
+    # --manifest writes book_chapters.json instead of chapter copies
+    manifest_file = "book_chapters.json" if "--manifest" in sys.argv else None
+    success = split_book_by_chapters(book_file, manifest_file=manifest_file)
     
     if success:
         print("\nSuccess! Book successfully split into chapters!")
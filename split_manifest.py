@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+"""
+Split Manifests
+Describes the chapters of a book by byte range instead of copying them into files
+
+A splitter run with a manifest writes one JSON file listing, for every
+chapter, its title, the source path, start/end byte offsets, the encoding,
+a word count and a SHA-256 of its bytes. The converter reads each chapter
+straight out of the source book, so no Chapter_XX.txt copies are needed,
+and the hashes tell it which chapters are already rendered.
+"""
+
+import bisect
+import hashlib
+import json
+import os
+import re
+import sys
+from pathlib import Path
+
+MANIFEST_VERSION = 1
+
+ENCODINGS = ['utf-8-sig', 'utf-8', 'cp1252', 'latin1']
+
+
+def read_book(input_file):
+    """
+    Read a book trying the encodings the splitters support
+
+    Returns:
+        tuple: (content, encoding), or (None, None) if no encoding worked
+    """
+
+    for encoding in ENCODINGS:
+        try:
+            with open(input_file, 'r', encoding=encoding) as f:
+                return f.read(), encoding
+        except UnicodeDecodeError:
+            continue
+    return None, None
+
+
+def detect_encoding(input_file, block_size=1 << 20):
+    """
+    Find the first supported encoding the whole book decodes with, block by block
+
+    Returns:
+        str: The encoding, or None if none worked
+    """
+
+    import codecs
+
+    for encoding in ENCODINGS:
+        decoder = codecs.getincrementaldecoder(encoding)()
+        try:
+            with open(input_file, 'rb') as f:
+                for block in iter(lambda: f.read(block_size), b''):
+                    decoder.decode(block)
+            decoder.decode(b'', final=True)
+            return encoding
+        except UnicodeDecodeError:
+            continue
+    return None
+
+
+def safe_name(title):
+    """Turn a chapter title into a file-name friendly stem"""
+
+    name = re.sub(r'[^\w\s-]', '', title).strip()
+    return re.sub(r'[-\s]+', '_', name) or "Chapter"
+
+
+class OffsetMap:
+    """
+    Converts character positions in a splitter's text into byte offsets in the file
+
+    The splitters read books in text mode, where '\\r\\n' and a lone '\\r'
+    (old Mac files) both become '\\n', so the file is decoded again with
+    newlines untouched to map every character position back to its exact
+    byte offset. A lone '\\r' stays one character; only '\\r\\n' shifts
+    the positions after it.
+    """
+
+    def __init__(self, input_file, encoding):
+        self.encoding = encoding
+        with open(input_file, 'r', encoding=encoding, newline='') as f:
+            self.raw = f.read()
+
+        self.bom = len(b'\xef\xbb\xbf') if encoding == 'utf-8-sig' and self._has_bom(input_file) else 0
+        self.codec = 'utf-8' if encoding == 'utf-8-sig' else encoding
+
+        # Positions (in translated text) just after each collapsed '\r\n'
+        self._crlf = []
+        for k, match in enumerate(re.finditer('\r\n', self.raw)):
+            self._crlf.append(match.start() - k + 1)
+
+        self._last_char = 0
+        self._last_byte = self.bom
+
+    @staticmethod
+    def _has_bom(input_file):
+        with open(input_file, 'rb') as f:
+            return f.read(3) == b'\xef\xbb\xbf'
+
+    def raw_index(self, position):
+        return position + bisect.bisect_right(self._crlf, position)
+
+    def byte_offset(self, position):
+        """Byte offset of a character position (positions must not decrease)"""
+
+        raw_pos = self.raw_index(position)
+        if raw_pos < self._last_char:
+            self._last_char, self._last_byte = 0, self.bom
+        self._last_byte += len(self.raw[self._last_char:raw_pos].encode(self.codec))
+        self._last_char = raw_pos
+        return self._last_byte
+
+
+def build_manifest(input_file, encoding, spans, content=None):
+    """
+    Build a manifest from chapter spans found by a splitter
+
+    Args:
+        input_file (str): The source book
+        encoding (str): Encoding the book was read with
+        spans (list): (title, start, end) character positions in the text
+            the splitter read (text mode, universal newlines)
+        content (str): That text, used for word counts
+
+    Returns:
+        dict: The manifest
+    """
+
+    offsets = OffsetMap(input_file, encoding)
+    chapters = []
+    with open(input_file, 'rb') as f:
+        # Chapters keep the splitter's order (e.g. Table of Contents order)
+        for index, (title, start, end) in enumerate(spans, 1):
+            byte_start = offsets.byte_offset(start)
+            byte_end = offsets.byte_offset(end)
+            f.seek(byte_start)
+            data = f.read(byte_end - byte_start)
+            text = content[start:end] if content is not None else data.decode(offsets.codec, errors='replace')
+            chapters.append({
+                "index": index,
+                "name": f"{index:02d}_{safe_name(title)}",
+                "title": title,
+                "start": byte_start,
+                "end": byte_end,
+                "encoding": offsets.codec,
+                "words": len(text.split()),
+                "sha256": hashlib.sha256(data).hexdigest(),
+            })
+
+    stat = os.stat(input_file)
+    return {
+        "version": MANIFEST_VERSION,
+        "source": str(Path(input_file).resolve()),
+        "source_size": stat.st_size,
+        "chapters": chapters,
+    }
+
+
+def write_manifest(manifest, manifest_file):
+    """Write a manifest and report what it contains"""
+
+    Path(manifest_file).parent.mkdir(parents=True, exist_ok=True)
+    with open(manifest_file, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+
+    for chapter in manifest["chapters"]:
+        print(f"  {chapter['name']}: bytes {chapter['start']:,}-{chapter['end']:,} ({chapter['words']:,} words)")
+    print(f"Wrote manifest with {len(manifest['chapters'])} chapters: {manifest_file}")
+
+
+def load_manifest(manifest_file):
+    """Read a manifest, resolving a relative source path against the manifest's folder"""
+
+    with open(manifest_file, 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+    if manifest.get("version") != MANIFEST_VERSION:
+        raise ValueError(f"Unsupported manifest version: {manifest.get('version')}")
+
+    source = Path(manifest["source"])
+    if not source.is_absolute():
+        source = Path(manifest_file).parent / source
+    manifest["source"] = str(source)
+    return manifest
+
+
+def read_chapter(manifest, chapter, verify=True):
+    """
+    Read one chapter's text straight from the source book
+
+    Args:
+        manifest (dict): Manifest from load_manifest
+        chapter (dict): One entry of manifest["chapters"]
+        verify (bool): Check the bytes against the recorded hash
+
+    Returns:
+        str: The chapter text
+    """
+
+    if "documents" in chapter:
+        # Chapter of an EPUB, stored by the zip members it is made of
+        from epub_reader import read_chapter as read_epub_chapter
+
+        return read_epub_chapter(manifest, chapter, verify)
+
+    with open(manifest["source"], 'rb') as f:
+        f.seek(chapter["start"])
+        data = f.read(chapter["end"] - chapter["start"])
+
+    if verify and hashlib.sha256(data).hexdigest() != chapter["sha256"]:
+        raise ValueError(f"{manifest['source']} changed since it was split - split it again")
+    # Universal newlines, as the splitter read the text
+    return data.decode(chapter["encoding"]).replace('\r\n', '\n').replace('\r', '\n').strip()
+
+
+def main():
+    """Main function - print the chapters listed in a manifest"""
+
+    if len(sys.argv) < 2:
+        print("Usage: python split_manifest.py <manifest.json>")
+        return False
+
+    manifest = load_manifest(sys.argv[1])
+    print(f"Source: {manifest['source']}")
+    for chapter in manifest["chapters"]:
+        print(f"  {chapter['name']:<48} {chapter['words']:>8,} words  {chapter['sha256'][:12]}")
+    return True
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+"""
+Streaming Book Splitter
+Yields chapters while the book is still being read, so conversion can start
+on chapter 1 before the splitter has reached the end of the book
+
+Two ways of finding chapter boundaries are supported:
+    pattern - a regex such as 'Chapter \\d+' (like split_book.py)
+    titles  - section titles standing alone between blank lines
+              (like jaynes_splitter_ultimate.py)
+"""
+
+import queue
+import re
+import sys
+import threading
+import time
+from collections import namedtuple
+from pathlib import Path
+
+from split_manifest import detect_encoding, safe_name
+
+CHAPTER_PATTERN = r'Chapter \d+'
+
+Chapter = namedtuple("Chapter", "index title text")
+
+
+def chapter_name(chapter):
+    """Output name for a chapter, e.g. 03_Chapter_3 (matches split manifests)"""
+
+    return f"{chapter.index:02d}_{safe_name(chapter.title)}"
+
+
+class _ChapterBuilder:
+    """Collects lines of the current chapter and emits it once its end is confirmed"""
+
+    def __init__(self, min_words):
+        self.min_words = min_words
+        self.index = 0
+        self.title = None
+        self.lines = []
+
+    def start(self, title, first_lines):
+        """Close the current chapter and begin a new one; returns the closed chapter or None"""
+
+        finished = self.finish()
+        self.title = title
+        self.lines = list(first_lines)
+        return finished
+
+    def finish(self):
+        # Text before the first boundary (title page, contents) is not a chapter
+        if self.title is None:
+            return None
+        text = "".join(self.lines).strip()
+        self.lines = []
+        if len(text.split()) < self.min_words:
+            print(f"Skipping '{self.title}' - too short ({len(text.split())} words)")
+            return None
+        self.index += 1
+        return Chapter(self.index, self.title, text)
+
+
+def _scan(input_file, encoding, pattern, titles, skip_lines, min_words):
+    builder = _ChapterBuilder(min_words)
+    marker = re.compile(pattern) if titles is None else None
+    seen_titles = set()
+    candidate = None          # standalone title waiting for its following line
+    previous_blank = True
+
+    with open(input_file, 'r', encoding=encoding) as f:
+        for line_number, line in enumerate(f):
+            if line_number < skip_lines:
+                builder.lines.append(line)
+                continue
+
+            if marker is not None:
+                matches = list(marker.finditer(line))
+                if not matches:
+                    builder.lines.append(line)
+                    continue
+                builder.lines.append(line[:matches[0].start()])
+                for i, match in enumerate(matches):
+                    end = matches[i + 1].start() if i + 1 < len(matches) else len(line)
+                    finished = builder.start(match.group(0), [line[match.start():end]])
+                    if finished:
+                        yield finished
+                continue
+
+            stripped = line.strip()
+            if candidate is not None:
+                title, title_line = candidate
+                candidate = None
+                if not stripped:
+                    seen_titles.add(title)
+                    finished = builder.start(title, [title_line, line])
+                    if finished:
+                        yield finished
+                    previous_blank = True
+                    continue
+                builder.lines.append(title_line)
+
+            if previous_blank and stripped in titles and stripped not in seen_titles:
+                candidate = (stripped, line)
+            else:
+                builder.lines.append(line)
+            previous_blank = not stripped
+
+    if candidate is not None:
+        finished = builder.start(candidate[0], [candidate[1]])
+        if finished:
+            yield finished
+    finished = builder.finish()
+    if finished:
+        yield finished
+
+
+def iter_chapters(input_file, pattern=CHAPTER_PATTERN, titles=None, skip_lines=0, min_words=0, encoding=None):
+    """
+    Read a book line by line and yield each chapter as soon as its end is found
+
+    Args:
+        input_file (str): The book
+        pattern (str): Regex marking the start of a chapter
+        titles (list): Section titles to split on instead of pattern
+        skip_lines (int): Lines at the start to ignore when looking for
+            boundaries (e.g. the Table of Contents)
+        min_words (int): Chapters shorter than this are skipped
+        encoding (str): Encoding of the book (default: try the usual ones)
+
+    Yields:
+        Chapter(index, title, text)
+    """
+
+    titles = set(titles) if titles is not None else None
+    # Settled before the first chapter is handed out: a chapter already
+    # being converted cannot be taken back if a later line fails to decode
+    encoding = encoding or detect_encoding(input_file)
+    if encoding is None:
+        raise ValueError(f"Could not read {input_file} with any supported encoding")
+    yield from _scan(input_file, encoding, pattern, titles, skip_lines, min_words)
+
+
+def convert_book_streaming(input_file, voice="af_bella", speed=1.0, **split_options):
+    """
+    Split a book and convert its chapters, overlapping the two stages
+
+    The splitter runs in a background thread and hands chapters over a
+    small queue, so chapter 1 is synthesizing while the rest of the book
+    is still being scanned.
+
+    Args:
+        input_file (str): The book (an .epub is read by epub_reader)
+        voice (str): Voice to use
+        speed (float): Speech speed
+        **split_options: Passed to iter_chapters
+
+    Returns:
+        bool: True if every chapter converted
+    """
+
+    from lexicon import load_lexicon
+    from text_to_audio_batch import convert_text
+    from tts_config import load_config
+
+    lexicon = load_lexicon(load_config(), Path(input_file).parent)
+    read_chapters = iter_chapters
+    if Path(input_file).suffix.lower() == ".epub":
+        from epub_reader import iter_chapters as read_chapters
+
+        # Chapters come from the book's table of contents; only min_words applies
+        split_options = {"min_words": split_options.get("min_words", 0)}
+
+    chapters = queue.Queue(maxsize=2)
+    done = object()
+    start_time = time.time()
+
+    def produce():
+        try:
+            for chapter in read_chapters(input_file, **split_options):
+                print(f"Found chapter {chapter.index}: {chapter.title} "
+                      f"({len(chapter.text.split()):,} words, {time.time() - start_time:.1f} s)")
+                chapters.put(chapter)
+        except Exception as e:
+            chapters.put(e)
+        finally:
+            chapters.put(done)
+
+    threading.Thread(target=produce, daemon=True).start()
+
+    converted = 0
+    failed = []
+    while True:
+        item = chapters.get()
+        if item is done:
+            break
+        if isinstance(item, Exception):
+            print(f"Error splitting {input_file}: {item}")
+            return False
+        if convert_text(item.text, item.title, chapter_name(item), voice, speed, lexicon):
+            converted += 1
+        else:
+            failed.append(item.title)
+
+    print(f"Converted {converted} chapters in {(time.time() - start_time)/60:.1f} minutes ({len(failed)} failed)")
+    return converted > 0 and not failed
+
+
+def main():
+    """Main function with command line interface"""
+
+    if len(sys.argv) < 2:
+        print("Streaming Book Splitter")
+        print("=" * 40)
+        print("Usage:")
+        print("  python streaming_splitter.py <book.txt> [titles.txt]")
+        print()
+        print("Lists chapters as they are found. With titles.txt (one section")
+        print("title per line) the book is split on those titles instead of")
+        print("'Chapter N' markers.")
+        return False
+
+    titles = None
+    if len(sys.argv) > 2:
+        titles = [t.strip() for t in Path(sys.argv[2]).read_text(encoding='utf-8').splitlines() if t.strip()]
+
+    for chapter in iter_chapters(sys.argv[1], titles=titles):
+        print(f"{chapter_name(chapter)}: {len(chapter.text.split()):,} words")
+    return True
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
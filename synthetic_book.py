@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+"""
+Synthetic Book Generator
+Writes made-up books of any size for testing and benchmarking the splitters
+
+The same seed always gives the same book, byte for byte. Heading styles:
+    chapter  Chapter 1, Chapter 2, ...
+    roman    CHAPTER I, CHAPTER II, ... (past XXXIX the numerals need L, C and M)
+    caps     ALL CAPS titles with no chapter word (THE SILENT RIVER)
+    toc      The Table of Contents titles jaynes_splitter_ultimate looks for,
+             each standing alone between blank lines, after a contents list
+
+Noise imitates text pasted out of a PDF:
+    light    lines hard-wrapped at 72 characters, words hyphenated across
+             lines, page numbers and form feeds every 45 lines
+    heavy    also running headers repeating the chapter heading on every
+             page, and fi/fl ligatures where the encoding has them
+
+Text is written in the chosen encoding (utf-8, utf-8-sig, cp1252, latin1,
+...); accented words and typographic quotes are only used where the
+encoding can store them. Books are written as they are generated, so a
+50 MB book takes no more memory than a small one.
+
+Usage:
+  python synthetic_book.py book.txt [--size 50MB] [--style roman] [--noise light] [--encoding cp1252]
+"""
+
+import argparse
+import codecs
+import random
+import re
+import sys
+
+from jaynes_splitter_ultimate import TOC_ORDER
+
+STYLES = ("chapter", "roman", "caps", "toc")
+NOISE_LEVELS = ("none", "light", "heavy")
+DEFAULT_CHAPTER_SIZE = 40_000   # characters per chapter (about 7,000 words)
+FRONT_MATTER_LINES = 110        # the TOC splitter ignores the first 100 lines
+LINE_WIDTH = 72
+PAGE_LINES = 45
+BOOK_TITLE = "THE SYNTHETIC BOOK"
+
+VOCABULARY = """
+the of and to a in that it was he for on are with as his they at be this from have or by one had not but
+what all were when we there can an your which their said if do will each about how up out them then she
+many some so these would other into has more her two like him see time could no make than first been its
+who now people my made over did down only way find use may water long little very after words called just
+where most know river house night morning letter window garden road silence voice hand door mountain city
+remembered walked answered looked turned waited opened carried understood believed wondered whispered
+slowly quietly suddenly perhaps already almost never always together beneath across between against
+""".split()
+NAMES = ["Elena", "Marcus", "Tobias", "Ingrid", "Ruth", "Amadou", "Keiko", "Wendell", "Priya", "Oskar"]
+# Used only where the encoding can store them
+ACCENTED = ["café", "naïve", "Zürich", "señor", "déjà", "façade", "rôle", "Æsop"]
+ADJECTIVES = ["Silent", "Broken", "Distant", "Hidden", "Last", "Burning", "Quiet", "Golden", "Hollow", "Northern",
+              "Forgotten", "Restless", "Iron", "Pale", "Second"]
+NOUNS = ["River", "Garden", "Letter", "Harbor", "Winter", "Bridge", "Orchard", "Tower", "Promise", "Crossing",
+         "Lantern", "Storm", "Archive", "Meadow", "Return"]
+FRONT_MATTER = ["Copyright (c) The Synthetic Press. All rights reserved.", "First edition.", "For R., who listened.",
+                "Printed on demand.", "No part of this book may be reproduced without permission."]
+
+_SIZE = re.compile(r"^\s*([\d.]+)\s*([kmg]?)i?b?\s*$", re.IGNORECASE)
+
+
+def parse_size(text):
+    """Bytes in a size such as 500k, 50MB or 1.5G (binary units)"""
+
+    match = _SIZE.match(str(text))
+    if not match:
+        raise ValueError(f"not a size: {text!r}")
+    return int(float(match.group(1)) * 1024 ** " kmg".index(match.group(2).lower() or " "))
+
+
+def roman(number):
+    """Roman numeral of a positive integer"""
+
+    numerals = [(1000, "M"), (900, "CM"), (500, "D"), (400, "CD"), (100, "C"), (90, "XC"),
+                (50, "L"), (40, "XL"), (10, "X"), (9, "IX"), (5, "V"), (4, "IV"), (1, "I")]
+    result = []
+    for value, numeral in numerals:
+        count, number = divmod(number, value)
+        result.append(numeral * count)
+    return "".join(result)
+
+
+def heading_titles(style, count, rng):
+    """The chapter headings of a book"""
+
+    if style == "chapter":
+        return [f"Chapter {n}" for n in range(1, count + 1)]
+    if style == "roman":
+        return [f"CHAPTER {roman(n)}" for n in range(1, count + 1)]
+    if style == "caps":
+        return [f"THE {rng.choice(ADJECTIVES)} {rng.choice(NOUNS)}".upper() for _ in range(count)]
+    if style == "toc":
+        return list(TOC_ORDER)
+    raise ValueError(f"Unknown heading style {style!r} (choose from: {', '.join(STYLES)})")
+
+
+def _encodable(text, encoding):
+    try:
+        text.encode(encoding)
+        return True
+    except UnicodeEncodeError:
+        return False
+
+
+class _BookWriter:
+    """Encodes lines, hard-wraps and paginates them according to the noise level"""
+
+    def __init__(self, f, encoding, noise, rng):
+        self.f = f
+        self.encoder = codecs.getincrementalencoder(encoding)()
+        self.noise = noise
+        self.rng = rng
+        self.ligatures = noise == "heavy" and _encodable("ﬁﬂ", encoding)
+        self.bytes = 0
+        self.lines = 0
+        self.page = 1
+        self.running_header = BOOK_TITLE
+
+    def line(self, text=""):
+        if self.ligatures and text:
+            text = text.replace("fi", "ﬁ").replace("fl", "ﬂ")
+        data = self.encoder.encode(text + "\n")
+        self.f.write(data)
+        self.bytes += len(data)
+        self.lines += 1
+        if self.noise != "none" and self.lines % PAGE_LINES == 0:
+            self._page_break()
+
+    def _page_break(self):
+        number = str(self.page)
+        self.page += 1
+        data = self.encoder.encode(f"\n{number:>38}\n\f")
+        if self.noise == "heavy":
+            # Running header: the book title on even pages, the chapter heading on odd ones
+            header = BOOK_TITLE if self.page % 2 == 0 else self.running_header
+            data += self.encoder.encode(f"{self.page}    {header}\n\n")
+        self.f.write(data)
+        self.bytes += len(data)
+
+    def paragraph(self, text):
+        if self.noise == "none":
+            self.line(text)
+        else:
+            for line in self._wrap(text):
+                self.line(line)
+        self.line()
+
+    def _wrap(self, text):
+        line = ""
+        for word in text.split(" "):
+            if not line:
+                line = word
+            elif len(line) + 1 + len(word) <= LINE_WIDTH:
+                line += " " + word
+            elif len(word) > 6 and word.isalpha() and self.rng.random() < 0.15:
+                # Hyphenated across the line break, as PDF text extraction leaves it
+                cut = len(word) // 2
+                yield f"{line} {word[:cut]}-"
+                line = word[cut:]
+            else:
+                yield line
+                line = word
+        if line:
+            yield line
+
+
+def _sentence(rng, words, quotes):
+    count = rng.randint(5, 20)
+    chosen = rng.choices(words, k=count)
+    chosen[0] = chosen[0].capitalize()
+    if count > 8 and rng.random() < 0.4:
+        chosen[count // 2] += ","
+    sentence = " ".join(chosen) + rng.choice(".......?!")
+    if rng.random() < 0.1:
+        sentence = f"{quotes[0]}{sentence}{quotes[1]} said {rng.choice(NAMES)}."
+    return sentence
+
+
+def generate_book(output_file, size, style="chapter", noise="none", encoding="utf-8", seed=0,
+                  chapter_size=DEFAULT_CHAPTER_SIZE, contents=None):
+    """
+    Write a synthetic book
+
+    Args:
+        output_file (str): Where to write it
+        size (int): About how many characters of chapter text to write
+        style (str): Heading style (see STYLES)
+        noise (str): PDF noise level (see NOISE_LEVELS)
+        encoding (str): Text encoding of the file
+        seed (int): Random seed; the same seed gives the same book
+        chapter_size (int): Characters per chapter (toc style: size / sections)
+        contents (bool): Start with a contents list (default: toc style only)
+
+    Returns:
+        dict: path, bytes, lines, and the headings of the chapters written
+    """
+
+    if noise not in NOISE_LEVELS:
+        raise ValueError(f"Unknown noise level {noise!r} (choose from: {', '.join(NOISE_LEVELS)})")
+    codecs.lookup(encoding)
+    rng = random.Random(seed)
+
+    words = VOCABULARY + NAMES + [w for w in ACCENTED if _encodable(w, encoding)]
+    quotes = ("“", "”") if _encodable("“”", encoding) else ('"', '"')
+    count = len(TOC_ORDER) if style == "toc" else max(int(size // chapter_size), 1)
+    titles = heading_titles(style, count, rng)
+    chapter_size = size / len(titles)
+    if contents is None:
+        contents = style == "toc"
+
+    with open(output_file, "wb") as f:
+        book = _BookWriter(f, encoding, noise, rng)
+        for line in (BOOK_TITLE, "", "A Novel", ""):
+            book.line(line)
+        if contents:
+            book.line("Contents")
+            book.line()
+            for title in titles:
+                book.line(title)
+            book.line()
+        while book.lines < FRONT_MATTER_LINES:
+            book.line(rng.choice(FRONT_MATTER))
+            book.line()
+
+        for title in titles:
+            book.running_header = title
+            book.line()
+            book.line(title)
+            book.line()
+            written = 0
+            while written < chapter_size:
+                text = " ".join(_sentence(rng, words, quotes) for _ in range(rng.randint(2, 7)))
+                book.paragraph(text)
+                written += len(text) + 2
+        book.f.write(book.encoder.encode("", final=True))
+
+    return {"path": str(output_file), "bytes": book.bytes, "lines": book.lines, "chapters": titles}
+
+
+def main():
+    """Main function with command line interface"""
+
+    parser = argparse.ArgumentParser(description="Write a synthetic book for testing the splitters")
+    parser.add_argument("output", help="File to write")
+    parser.add_argument("--size", default="1MB", help="About how much text, e.g. 500k, 50MB (default: 1MB)")
+    parser.add_argument("--style", choices=STYLES, default="chapter", help="Heading style (default: chapter)")
+    parser.add_argument("--noise", choices=NOISE_LEVELS, default="none", help="PDF noise (default: none)")
+    parser.add_argument("--encoding", default="utf-8", help="Text encoding (default: utf-8)")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed (default: 0)")
+    parser.add_argument("--chapter-size", default=str(DEFAULT_CHAPTER_SIZE),
+                        help=f"Text per chapter (default: {DEFAULT_CHAPTER_SIZE:,} characters)")
+    parser.add_argument("--contents", action="store_true", help="Start with a contents list for any style")
+    args = parser.parse_args()
+
+    try:
+        book = generate_book(args.output, parse_size(args.size), args.style, args.noise, args.encoding,
+                             args.seed, parse_size(args.chapter_size), args.contents or None)
+    except (LookupError, ValueError) as e:
+        print(f"Error: {e}")
+        return False
+    print(f"Wrote {book['path']}: {book['bytes']:,} bytes, {book['lines']:,} lines, "
+          f"{len(book['chapters'])} chapters ({args.style} headings, "
+          f"{'no' if args.noise == 'none' else args.noise} noise, {args.encoding})")
+    return True
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,147 @@
+"""
+Render cluster tests: several workers on localhost share one batch
+
+The workers get a render function that writes the chapter text into a
+.wav file instead of running TTS, so the tests check leasing, uploads
+and collection, not audio.
+
+Run with: python -m pytest tests  (or python -m unittest discover tests)
+"""
+
+import socket
+import tempfile
+import threading
+import time
+import unittest
+from contextlib import redirect_stdout
+from io import StringIO
+from pathlib import Path
+
+import render_cluster
+
+CHAPTERS = 8
+WORKERS = 3
+
+
+def fake_render(text, name, voice, speed, work_dir):
+    time.sleep(0.05)
+    output = Path(work_dir) / f"{Path(name).stem}.wav"
+    output.write_text(text, encoding="utf-8")
+    return [output]
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def write_chapters(folder):
+    folder.mkdir()
+    for n in range(1, CHAPTERS + 1):
+        (folder / f"Chapter_{n:02d}.txt").write_text(f"Text of chapter {n}", encoding="utf-8")
+
+
+class Run(threading.Thread):
+    """Runs a cluster function in a thread and keeps what it returned"""
+
+    def __init__(self, function, *args, **kwargs):
+        super().__init__(daemon=True)
+        self.function = function
+        self.args = args
+        self.kwargs = kwargs
+        self.result = None
+
+    def run(self):
+        self.result = self.function(*self.args, **self.kwargs)
+
+
+class ClusterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = Path(self.tmp.name)
+        self.input_dir = self.root / "text_input"
+        self.output_dir = self.root / "audio_output"
+        write_chapters(self.input_dir)
+        self.quiet = redirect_stdout(StringIO())
+        self.quiet.__enter__()
+
+    def tearDown(self):
+        self.quiet.__exit__(None, None, None)
+        self.tmp.cleanup()
+
+    def assertEveryChapterRendered(self):
+        for n in range(1, CHAPTERS + 1):
+            output = self.output_dir / f"Chapter_{n:02d}.wav"
+            self.assertTrue(output.exists(), output.name)
+            self.assertEqual(output.read_text(encoding="utf-8"), f"Text of chapter {n}")
+
+    def test_tcp_workers_share_batch(self):
+        port = free_port()
+        coordinator = Run(render_cluster.run_coordinator, str(self.input_dir), "127.0.0.1", port,
+                          str(self.output_dir), lease_seconds=5)
+        coordinator.start()
+
+        def worker(n):
+            for _ in range(50):
+                try:
+                    return render_cluster.run_tcp_worker("127.0.0.1", port, f"worker-{n}",
+                                                         render=fake_render, poll_seconds=0.1)
+                except ConnectionRefusedError:
+                    time.sleep(0.1)
+            return 0
+
+        workers = [Run(worker, n) for n in range(WORKERS)]
+        for w in workers:
+            w.start()
+        for w in workers:
+            w.join(60)
+        coordinator.join(60)
+
+        self.assertIs(coordinator.result, True)
+        self.assertEqual(sum(w.result for w in workers), CHAPTERS)
+        self.assertEveryChapterRendered()
+
+    def test_shared_directory_workers_share_batch(self):
+        shared_dir = self.root / "shared"
+        self.run_shared(shared_dir)
+        self.assertEveryChapterRendered()
+
+    def test_reused_shared_directory_starts_fresh(self):
+        # Leftovers of an earlier run: a chapter that was given up on, one
+        # with attempts counted, and one finished with different text
+        shared = render_cluster.SharedDirectory(self.root / "shared")
+        (shared.failed / "Chapter_01.count").write_text(str(render_cluster.MAX_ATTEMPTS))
+        (shared.failed / "Chapter_01.giveup").touch()
+        (shared.failed / "Chapter_02.count").write_text(str(render_cluster.MAX_ATTEMPTS - 1))
+        (shared.results / "Chapter_03.wav").write_text("Old audio", encoding="utf-8")
+        (shared.results / "Chapter_03.done").touch()
+
+        self.run_shared(shared.root)
+        self.assertEveryChapterRendered()
+        self.assertEqual(list(shared.failed.iterdir()), [])
+
+    def run_shared(self, shared_dir):
+        coordinator = Run(render_cluster.run_shared_coordinator, str(shared_dir), str(self.input_dir),
+                          str(self.output_dir), lease_seconds=5, poll_seconds=0.1)
+        coordinator.start()
+        queue = Path(shared_dir) / "queue"
+        deadline = time.time() + 10
+        while len(list(queue.glob("*.txt"))) < CHAPTERS and time.time() < deadline:
+            time.sleep(0.05)
+
+        workers = [Run(render_cluster.run_shared_worker, str(shared_dir), f"worker-{n}",
+                       render=fake_render, poll_seconds=0.1) for n in range(WORKERS)]
+        for w in workers:
+            w.start()
+        for w in workers:
+            w.join(60)
+        coordinator.join(60)
+
+        self.assertIs(coordinator.result, True)
+        self.assertEqual(sum(w.result for w in workers), CHAPTERS)
+
+
+if __name__ == "__main__":
+    unittest.main()
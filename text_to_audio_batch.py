@@ -6,19 +6,22 @@ Processes individual files with progress tracking
 
 import os
 import sys
-import subprocess
 import time
 from pathlib import Path
 from datetime import datetime
 
-def convert_text_to_audio(input_file, voice="af_bella", speed=1.0):
+from memprofile import profiled
+
+def convert_text_to_audio(input_file, voice="af_bella", speed=1.0, output_dir="audio_output", config_file="config.txt"):
     """
     Convert a text file to audio using Kokoro TTS
     
     Args:
-        input_file (str): Path to the input text file
+        input_file (str): Path to the input text file, or a split manifest (.json)
         voice (str): Voice to use (default: af_bella)
         speed (float): Speech speed (default: 1.0)
+        output_dir (str): Folder for the audio (default: audio_output)
+        config_file (str): Settings file (default: config.txt)
     """
     
     # Validate input file
@@ -27,46 +30,112 @@ def convert_text_to_audio(input_file, voice="af_bella", speed=1.0):
         print(f"Error: Input file '{input_file}' not found!")
         return False
     
+    if input_path.suffix.lower() == ".json":
+        return convert_manifest(input_path, voice, speed, output_dir, config_file)
+    
+    # Read input file (chapters saved from PDFs are often cp1252 or latin-1)
+    from split_manifest import read_book
+    
+    file_content, _ = read_book(input_path)
+    if file_content is None:
+        print(f"Error: could not read '{input_file}' with any supported encoding")
+        return False
+    
+    from lexicon import load_lexicon
+    from tts_config import load_config
+    
+    lexicon = load_lexicon(load_config(config_file), input_path.parent)
+    
     # Get output filename (same as input but .wav)
-    output_name = input_path.stem
-    output_file = Path("audio_output") / f"{output_name}.wav"
+    return convert_text(file_content, input_path.name, input_path.stem, voice, speed, lexicon, output_dir,
+                        config_file=config_file)
+
+def convert_text(file_content, source_name, output_name, voice="af_bella", speed=1.0, lexicon=None,
+                 output_dir="audio_output", chapter=None, config_file="config.txt"):
+    """
+    Convert text to audio using Kokoro TTS
+    
+    Args:
+        file_content (str): The text to convert
+        source_name (str): Where the text came from (for messages)
+        output_name (str): Output filename without extension
+        voice (str): Voice to use (default: af_bella)
+        speed (float): Speech speed (default: 1.0)
+        lexicon (Lexicon): Pronunciation lexicon to apply first
+        output_dir (str): Folder for the audio (default: audio_output)
+        chapter (dict): Chapter details for the timestamp index (title, source, start)
+        config_file (str): Settings file (default: config.txt)
+    """
+    
+    from memprofile import job
+    from tts_config import load_config
+    
+    config = load_config(config_file)
+    with job(output_name, Path(output_dir) / ".memory", config):
+        return _convert_text(file_content, source_name, output_name, voice, speed, lexicon, output_dir, chapter,
+                             config, config_file)
+
+def _convert_text(file_content, source_name, output_name, voice, speed, lexicon, output_dir, chapter, config,
+                  config_file):
+    from memprofile import mark
+    
+    output_file = Path(output_dir) / f"{output_name}.wav"
+    chapter = chapter or {"title": source_name}
+    source_text = file_content
     
     # Create output directory
-    Path("audio_output").mkdir(exist_ok=True)
+    Path(output_dir).mkdir(parents=True, exist_ok=True)
     
-    print(f"Converting '{input_path.name}' to audio...")
+    print(f"Converting '{source_name}' to audio...")
     print(f"Voice: {voice}")
     print(f"Speed: {speed}x")
     print(f"Output: {output_file}")
-    print(f"File size: {input_path.stat().st_size:,} bytes")
+    print(f"Text size: {len(file_content.encode('utf-8')):,} bytes")
+    if lexicon:
+        mark("lexicon")
+        file_content, replaced = lexicon.apply(file_content)
+        print(f"Lexicon: {replaced:,} words respelled ({len(lexicon):,} entries)")
     print("-" * 50)
     
     start_time = time.time()
     
+    from tts_config import get_bool, get_float
+    
+    mark("synthesize")
+    if get_bool(config, "INCREMENTAL"):
+        success = convert_incremental(file_content, output_file, voice, speed, start_time, source_text, chapter,
+                                      config_file)
+    elif config.get("ENGINE", "").strip().lower() not in ("", "streamer"):
+        success = convert_with_engine(file_content, output_file, voice, speed, start_time, source_text, chapter,
+                                      config_file)
+    elif get_float(config, "STALL_TIMEOUT", 0) > 0:
+        success = convert_watched(file_content, output_file, voice, speed, start_time, config, source_text, chapter,
+                                  config_file)
+    else:
+        success = convert_streamer(file_content, output_file, voice, speed, start_time, source_text, chapter,
+                                   config_file)
+    
+    if success and get_bool(config, "VERIFY"):
+        # A zero exit code is not enough: the file itself has to be complete
+        from verify import report, verify_output
+        
+        mark("verify")
+        return report(output_file, verify_output(output_file, len(source_text.split()), speed))
+    return success
+
+def convert_streamer(file_content, output_file, voice, speed, start_time, source_text=None, chapter=None,
+                     config_file="config.txt"):
+    """Render the whole text with one streamer run"""
+    
     try:
-        # Build the command
-        cmd = [
-            "python", "-m", "kokoro_tts_cli.streamer",
-            "--voice", voice,
-            "--speed", str(speed),
-            "--save", str(output_file),
-            "--no-play",
-            "--batch",
-            "--verbose"
-        ]
+        cmd = streamer_command(voice, speed, output_file)
         
-        # Read input file and pipe to command
-        with open(input_file, 'r', encoding='utf-8') as f:
-            file_content = f.read()
+        # Output is read while the streamer runs: a live progress bar, and
+        # only the last lines kept in case they are needed for an error
+        from progress import run_with_progress, print_log
         
-        # Ensure file is closed before running subprocess
-        process = subprocess.run(
-            cmd,
-            input=file_content,
-            text=True,
-            capture_output=True,
-            cwd=Path.cwd()
-        )
+        returncode, log, metrics = run_with_progress(cmd, file_content, output_file.stem, cwd=Path.cwd())
+        metrics.save()
         
         # Small delay to ensure file handles are released
         time.sleep(0.1)
@@ -74,20 +143,379 @@ def convert_text_to_audio(input_file, voice="af_bella", speed=1.0):
         end_time = time.time()
         duration = end_time - start_time
         
-        if process.returncode == 0:
+        if returncode == 0:
             print(f"Success! Audio saved to: {output_file}")
             print(f"Processing time: {duration:.1f} seconds ({duration/60:.1f} minutes)")
+            index = build_timestamps(output_file, file_content, None, source_text or file_content, chapter)
+            finish_output(output_file, speed, config_file, index=index)
             return True
         else:
-            print(f"Error during conversion:")
-            if process.stderr:
-                print(process.stderr)
+            print(f"Error during conversion (exit code {returncode}):")
+            print_log(log)
             return False
             
     except Exception as e:
         print(f"Error: {e}")
         return False
 
+def streamer_command(voice, speed, output_file):
+    """Command line that renders stdin to output_file with the streamer"""
+    
+    return [
+        "python", "-m", "kokoro_tts_cli.streamer",
+        "--voice", voice,
+        "--speed", str(speed),
+        "--save", str(output_file),
+        "--no-play",
+        "--batch",
+        "--verbose"
+    ]
+
+@profiled("timestamps")
+def build_timestamps(wav_file, text, chunks, source_text, chapter):
+    """
+    Sentence timestamp index of a render (see timestamps.py)
+    
+    Args:
+        wav_file (Path): The rendered audio
+        text (str): The text that was synthesized
+        chunks (list): (first, last, start, end) sentence and sample ranges,
+            or None if the whole file is one chunk
+        source_text (str): The text before the lexicon, for text offsets
+        chapter (dict): Chapter details to store with the index
+    
+    Returns:
+        TimestampIndex, or None if it could not be built
+    """
+    
+    from segmenter import split_sentences
+    from timestamps import build_index, text_spans
+    from wav_io import read_wav_info
+    
+    try:
+        sentences = split_sentences(text)
+        if chunks is None:
+            chunks = [(0, len(sentences), 0, read_wav_info(wav_file).frames)]
+        offsets, lengths = text_spans(source_text, len(sentences), text)
+        return build_index(wav_file, chunks, sentences, offsets, lengths, chapter)
+    except (OSError, ValueError) as e:
+        print(f"Warning: no timestamp index ({e})")
+        return None
+
+def convert_watched(file_content, output_file, voice, speed, start_time, config, source_text=None, chapter=None,
+                    config_file="config.txt"):
+    """
+    Render with the streamer under a watchdog (STALL_TIMEOUT), in resumable parts
+    
+    Long texts are cut at sentence ends into parts of about
+    RESUME_PART_CHARS characters, each rendered by its own streamer run into
+    audio_output/.parts/<name>/ and joined at the end. A run that makes no
+    progress for STALL_TIMEOUT seconds is killed and restarted up to
+    STALL_RETRIES times. Finished parts are kept, so a restart - or the next
+    batch after a failure - continues from the first unfinished part.
+    
+    Args:
+        file_content (str): Chapter text
+        output_file (Path): Where the finished WAV goes
+        voice (str): Voice to use
+        speed (float): Speech speed
+        start_time (float): When the conversion started
+        config (dict): Settings from config.txt
+        source_text (str): The text before the lexicon, for the timestamp index
+        chapter (dict): Chapter details for the timestamp index
+        config_file (str): Settings file config came from (for the output stage)
+    """
+    
+    import hashlib
+    import shutil
+    from progress import run_with_progress, print_log
+    from segmenter import pack_chunks, split_sentences
+    from tts_config import get_float
+    
+    stall_timeout = get_float(config, "STALL_TIMEOUT")
+    retries = int(get_float(config, "STALL_RETRIES", 2))
+    part_chars = int(get_float(config, "RESUME_PART_CHARS", 20000))
+    
+    parts = pack_chunks(split_sentences(file_content, strip_notes=False), part_chars, len)
+    parts_dir = output_file.parent / ".parts" / output_file.stem
+    if len(parts) <= 1:
+        # Short enough for one run: rendered straight into the output
+        jobs = [(file_content, output_file)]
+    else:
+        jobs = []
+        for index, text in enumerate(part.text for part in parts):
+            digest = hashlib.sha1(f"{voice}|{speed}|{text}".encode("utf-8")).hexdigest()[:12]
+            jobs.append((text, parts_dir / f"{index:04d}_{digest}.wav"))
+        parts_dir.mkdir(parents=True, exist_ok=True)
+        print(f"Rendering in {len(jobs)} parts (watchdog: {stall_timeout:g} seconds)")
+    
+    for index, (text, target) in enumerate(jobs):
+        if len(jobs) > 1 and target.exists():
+            print(f"Part {index + 1}/{len(jobs)} already rendered")
+            continue
+        
+        partial = target.with_name(f"{target.stem}.partial.wav")
+        name = output_file.stem if len(jobs) == 1 else f"{output_file.stem} {index + 1}/{len(jobs)}"
+        for attempt in range(1, retries + 2):
+            try:
+                returncode, log, metrics = run_with_progress(
+                    streamer_command(voice, speed, partial), text, name, cwd=Path.cwd(),
+                    stall_timeout=stall_timeout, watch_file=partial)
+            except Exception as e:
+                print(f"Error: {e}")
+                return False
+            metrics.attempt = attempt
+            metrics.save()
+            
+            if returncode == 0 and not metrics.stalled:
+                time.sleep(0.1)
+                os.replace(partial, target)
+                break
+            if not metrics.stalled:
+                print(f"Error during conversion (exit code {returncode}):")
+                print_log(log)
+                return False
+            if attempt <= retries:
+                print(f"Stalled: no progress for {stall_timeout:g} seconds, restarting "
+                      f"(attempt {attempt + 1} of {retries + 1})")
+        else:
+            print(f"Error: {name} stalled {retries + 1} times, giving up")
+            print_log(log)
+            return False
+    
+    chunks = None
+    if len(jobs) > 1:
+        from wav_io import WavWriter, iter_wav_blocks, read_wav_info
+        
+        chunks = []
+        first = read_wav_info(jobs[0][1])
+        # Joined into a temporary file, so a failed join never leaves a
+        # valid-looking but truncated output behind
+        joined = output_file.with_name(f"{output_file.stem}.partial.wav")
+        with WavWriter(joined, first.sample_rate, first.channels, "float32") as writer:
+            for part, (_, part_file) in zip(parts, jobs):
+                info = read_wav_info(part_file)
+                if (info.sample_rate, info.channels) != (first.sample_rate, first.channels):
+                    print(f"Error: {part_file.name} is {info.sample_rate} Hz, {info.channels} channel(s), "
+                          f"expected {first.sample_rate} Hz, {first.channels}")
+                    break
+                start = writer.frames_written
+                for block in iter_wav_blocks(part_file):
+                    writer.write(block)
+                chunks.append((part.first, part.last, start, writer.frames_written))
+        if len(chunks) < len(jobs):
+            joined.unlink()
+            return False
+        os.replace(joined, output_file)
+        shutil.rmtree(parts_dir)
+        try:
+            parts_dir.parent.rmdir()
+        except OSError:
+            pass
+    
+    duration = time.time() - start_time
+    print(f"Success! Audio saved to: {output_file}")
+    print(f"Processing time: {duration:.1f} seconds ({duration/60:.1f} minutes)")
+    index = build_timestamps(output_file, file_content, chunks, source_text or file_content, chapter)
+    finish_output(output_file, speed, config_file, index=index)
+    return True
+
+def convert_manifest(manifest_file, voice="af_bella", speed=1.0, output_dir="audio_output", config_file="config.txt"):
+    """
+    Convert every chapter listed in a split manifest
+    
+    Chapters are read straight from the source book by byte offset. A
+    chapter is skipped when the build database says its output is up to
+    date: rendered from the same bytes (same hash) with the same voice,
+    speed, engine, output settings and lexicon (the global one plus a
+    lexicon.lex next to the source book).
+    
+    Args:
+        manifest_file (Path): Manifest written by a splitter
+        voice (str): Voice to use
+        speed (float): Speech speed
+        output_dir (str): Folder for the audio
+        config_file (str): Settings file (default: config.txt)
+    """
+    
+    from build_db import BuildDB, build_key, build_settings
+    from lexicon import load_lexicon
+    from split_manifest import load_manifest, read_chapter
+    from tts_config import load_config
+    
+    manifest = load_manifest(manifest_file)
+    db = BuildDB()
+    config = load_config(config_file)
+    lexicon = load_lexicon(config, Path(manifest["source"]).parent)
+    settings = build_settings(config, voice, speed, lexicon)
+    
+    print(f"Manifest: {manifest_file} ({len(manifest['chapters'])} chapters from {manifest['source']})")
+    failed = 0
+    for chapter in manifest["chapters"]:
+        key = build_key(chapter["sha256"], settings)
+        output_file = Path(output_dir) / f"{chapter['name']}.wav"
+        if db.is_fresh(output_file, key):
+            print(f"Up to date: {chapter['name']}")
+            continue
+        
+        try:
+            text = read_chapter(manifest, chapter)
+        except (OSError, ValueError) as e:
+            print(f"Error: {e}")
+            return False
+        
+        details = {"title": chapter["title"], "source": manifest["source"], "start": chapter["start"]}
+        if convert_text(text, chapter["title"], chapter["name"], voice, speed, lexicon, output_dir, details,
+                        config_file):
+            db.record(output_file, key)
+            db.save()
+        else:
+            failed += 1
+    
+    return failed == 0
+
+def convert_with_engine(file_content, output_file, voice, speed, start_time, source_text=None, chapter=None,
+                        config_file="config.txt"):
+    """
+    Render with the in-process engine chosen by ENGINE (kokoro, onnx)
+    
+    The text is cut into model-sized chunks and each chunk's audio is
+    written as soon as it is ready. Chunks go through
+    incremental.synthesize_chunks, so an engine that starts a process per
+    call renders them in batches instead of loading the model per chunk.
+    
+    Args:
+        file_content (str): Chapter text
+        output_file (Path): Where the finished WAV goes
+        voice (str): Voice to use
+        speed (float): Speech speed
+        start_time (float): When the conversion started
+        source_text (str): The text before the lexicon, for the timestamp index
+        chapter (dict): Chapter details for the timestamp index
+        config_file (str): Settings file (default: config.txt)
+    """
+    
+    from incremental import synthesize_chunks
+    from memprofile import stage
+    from segmenter import segment
+    from tts_config import load_config
+    from tts_engine import get_engine
+    from wav_io import WavWriter
+    
+    writer = None
+    chunks = []
+    try:
+        with stage("load engine"):
+            engine = get_engine(load_config(config_file), voice, speed)
+        print(f"Engine: {engine.name}")
+        packed = segment(file_content, engine.max_tokens)[1]
+        for chunk, (audio, sample_rate) in zip(packed, synthesize_chunks(engine, packed)):
+            if writer is None:
+                writer = WavWriter(output_file, sample_rate, audio.shape[1], "float32")
+            start = writer.frames_written
+            writer.write(audio)
+            chunks.append((chunk.first, chunk.last, start, writer.frames_written))
+    except Exception as e:
+        print(f"Error: {e}")
+        return False
+    finally:
+        if writer is not None:
+            writer.close()
+    
+    if writer is None:
+        print("Error: nothing to convert - the text is empty")
+        return False
+    
+    duration = time.time() - start_time
+    print(f"Success! Audio saved to: {output_file}")
+    print(f"Processing time: {duration:.1f} seconds ({duration/60:.1f} minutes)")
+    index = build_timestamps(output_file, file_content, chunks, source_text or file_content, chapter)
+    finish_output(output_file, speed, config_file, index=index)
+    return True
+
+def convert_incremental(file_content, output_file, voice, speed, start_time, source_text=None, chapter=None,
+                        config_file="config.txt"):
+    """
+    Render only the sentences that changed since the last run (INCREMENTAL=on)
+    
+    Args:
+        file_content (str): Chapter text
+        output_file (Path): Where the finished WAV goes
+        voice (str): Voice to use
+        speed (float): Speech speed
+        start_time (float): When the conversion started
+        source_text (str): The text before the lexicon, for the timestamp index
+        chapter (dict): Chapter details for the timestamp index
+        config_file (str): Settings file (default: config.txt)
+    """
+    
+    from memprofile import stage
+    from tts_config import load_config
+    from tts_engine import get_engine
+    from incremental import render_incremental
+    
+    config = load_config(config_file)
+    try:
+        with stage("load engine"):
+            engine = get_engine(config, voice, speed)
+        counts = render_incremental(None, output_file, engine, text=file_content, config=config,
+                                    source_text=source_text, chapter=chapter)
+    except Exception as e:
+        print(f"Error: {e}")
+        return False
+    
+    duration = time.time() - start_time
+    print(f"Success! Audio saved to: {output_file}")
+    print(f"Reused {counts['reused']} sentences, synthesized {counts['synthesized']}")
+    print(f"Processing time: {duration:.1f} seconds ({duration/60:.1f} minutes)")
+    finish_output(output_file, speed, config_file, finalized=True)
+    return True
+
+@profiled("finish")
+def finish_output(output_file, speed, config_file="config.txt", finalized=False, index=None):
+    """
+    Apply the optional steps from config.txt to a finished render
+    
+    The output stage (POSTPROCESS, OUTPUT_FORMAT, OUTPUT_SAMPLE_RATE) runs
+    first so that the speed variants (SPEED_VARIANTS) are made from the
+    final audio.
+    
+    Args:
+        output_file (Path): The rendered WAV
+        speed (float): Speed the file was synthesized at
+        config_file (str): Config file to read the settings from
+        finalized (bool): The output stage already ran while writing the file
+        index (TimestampIndex): Sentence timestamps of the render, saved
+            next to the output once they match the final audio
+    """
+    
+    from tts_config import load_config, get_list
+    
+    config = load_config(config_file)
+    
+    if not finalized and any(config.get(key) for key in ("POSTPROCESS", "OUTPUT_FORMAT", "OUTPUT_SAMPLE_RATE")):
+        # Imported here so plain conversions never pay for NumPy
+        from postprocess import postprocess_file
+        
+        step_start = time.time()
+        before = output_file.stat().st_size
+        if postprocess_file(output_file, config=config, index=index):
+            after = output_file.stat().st_size
+            print(f"Wrote final audio in {time.time() - step_start:.1f} seconds "
+                  f"({before:,} -> {after:,} bytes)")
+    
+    if index is not None:
+        from timestamps import index_path
+        
+        index.save(index_path(output_file))
+    
+    speeds = get_list(config, "SPEED_VARIANTS", float)
+    if speeds:
+        from time_stretch import make_speed_variants
+        
+        print(f"Creating speed variants: {', '.join(f'{s:g}x' for s in speeds)}")
+        make_speed_variants(output_file, speeds, rendered_speed=speed)
+
 def main():
     """Main function - called by batch script"""
     
@@ -96,11 +524,17 @@ def main():
         print("Please run convert.bat instead.")
         return False
     
+    # Started by the uploads scheduler: go to this worker's CPUs and priority
+    from placement import apply_inherited
+    
+    apply_inherited()
+    
     input_file = sys.argv[1]
     voice = sys.argv[2] if len(sys.argv) > 2 else "af_bella"
     speed = float(sys.argv[3]) if len(sys.argv) > 3 else 1.0
+    output_dir = sys.argv[4] if len(sys.argv) > 4 else "audio_output"
     
-    return convert_text_to_audio(input_file, voice, speed)
+    return convert_text_to_audio(input_file, voice, speed, output_dir)
 
 if __name__ == "__main__":
     success = main()
@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+"""
+Pitch-Preserving Time Stretch
+Produces faster or slower variants of a finished render with WSOLA,
+so a new listening speed does not need a full re-synthesis
+"""
+
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+from wav_io import WAVE_FORMAT_IEEE_FLOAT, WavWriter, iter_wav_blocks, read_wav_info
+
+
+class WsolaStretcher:
+    """
+    Streaming WSOLA (waveform-similarity overlap-add) time stretcher
+
+    Audio is fed in blocks with process() and the stretched output is
+    returned as soon as it is final; flush() returns the tail. Only about
+    one frame of input and output is buffered, whatever the file length.
+    """
+
+    def __init__(self, rate, sample_rate, channels=1, frame_ms=40, tolerance_ms=10):
+        """
+        Args:
+            rate (float): Speed factor (1.2 = 20% faster, shorter output)
+            sample_rate (int): Sample rate of the audio
+            channels (int): Number of channels
+            frame_ms (int): Analysis frame length in milliseconds
+            tolerance_ms (int): How far a frame may shift to find the best overlap
+        """
+
+        if rate <= 0:
+            raise ValueError("Stretch rate must be positive")
+
+        self.rate = float(rate)
+        self.channels = channels
+        self.frame = max(2 * int(sample_rate * frame_ms / 2000), 64)
+        self.hop = self.frame // 2
+        self.tolerance = max(int(sample_rate * tolerance_ms / 1000), 1)
+
+        # A periodic Hann window at 50% overlap sums to exactly one
+        n = np.arange(self.frame)
+        self.window = (0.5 - 0.5 * np.cos(2 * np.pi * n / self.frame)).astype(np.float32)[:, None]
+
+        self._input = np.zeros((0, channels), dtype=np.float32)
+        self._input_base = 0          # absolute index of self._input[0]
+        self._input_total = 0
+        self._accum = np.zeros((self.frame, channels), dtype=np.float32)
+        self._frame_index = 0
+        self._prev_pos = None
+        self._emitted = 0
+
+    def _nominal(self, k):
+        return int(round(k * self.hop * self.rate))
+
+    def _needed_end(self):
+        """Absolute input index that must be buffered to place the next frame"""
+
+        end = self._nominal(self._frame_index) + self.tolerance + self.frame
+        if self._prev_pos is not None:
+            end = max(end, self._prev_pos + self.hop + self.frame)
+        return end
+
+    def _place_frame(self):
+        nominal = self._nominal(self._frame_index)
+        lo = max(nominal - self.tolerance, 0)
+        hi = nominal + self.tolerance
+        x = self._input
+        base = self._input_base
+
+        if self._prev_pos is None:
+            pos = nominal
+        else:
+            # Pick the offset whose waveform best continues the previous frame
+            natural = self._prev_pos + self.hop - base
+            target = x[natural:natural + self.frame].mean(axis=1)
+            region = x[lo - base:hi - base + self.frame].mean(axis=1)
+            corr = np.correlate(region, target, mode="valid")
+            pos = lo + int(np.argmax(corr))
+
+        self._accum += self.window * x[pos - base:pos - base + self.frame]
+        self._prev_pos = pos
+        self._frame_index += 1
+
+        # The first hop of the accumulator can no longer change
+        done = self._accum[:self.hop].copy()
+        self._accum[:-self.hop] = self._accum[self.hop:]
+        self._accum[-self.hop:] = 0.0
+
+        # Drop input that no future frame can reach
+        keep_from = min(self._prev_pos + self.hop,
+                        max(self._nominal(self._frame_index) - self.tolerance, 0))
+        drop = keep_from - base
+        if drop > 0:
+            self._input = self._input[drop:]
+            self._input_base += drop
+        return done
+
+    def process(self, block):
+        """
+        Feed a block of audio and return the stretched audio that is ready
+
+        Args:
+            block: float array shaped (frames, channels)
+        """
+
+        block = np.asarray(block, dtype=np.float32).reshape(-1, self.channels)
+        self._input = np.concatenate([self._input, block])
+        self._input_total += len(block)
+
+        out = []
+        while self._needed_end() <= self._input_base + len(self._input):
+            out.append(self._place_frame())
+        return self._limit(out)
+
+    def flush(self):
+        """Return the remaining output once all input has been fed"""
+
+        expected = int(round(self._input_total / self.rate))
+        out = []
+        produced = self._emitted
+        pad = np.zeros((self.frame + self.tolerance + self.hop, self.channels), dtype=np.float32)
+        while produced < expected:
+            while self._needed_end() > self._input_base + len(self._input):
+                self._input = np.concatenate([self._input, pad])
+            out.append(self._place_frame())
+            produced += self.hop
+        return self._limit(out, expected)
+
+    def _limit(self, out, expected=None):
+        if not out:
+            return np.zeros((0, self.channels), dtype=np.float32)
+        out = np.concatenate(out)
+        if expected is not None:
+            out = out[:max(expected - self._emitted, 0)]
+        self._emitted += len(out)
+        return out
+
+
+def stretch_file(input_file, output_file, rate, sample_format=None):
+    """
+    Time-stretch a WAV file block by block without changing its pitch
+
+    Args:
+        input_file (str): Source WAV (typically the 1.0x render)
+        output_file (str): Where to write the stretched WAV
+        rate (float): Speed factor relative to the source
+        sample_format (str): Output sample format (default: same as the source)
+
+    Returns:
+        int: Number of frames written
+    """
+
+    info = read_wav_info(input_file)
+    stretcher = WsolaStretcher(rate, info.sample_rate, info.channels)
+    if sample_format is None:
+        sample_format = "float32" if info.format_tag == WAVE_FORMAT_IEEE_FLOAT else "int16"
+
+    with WavWriter(output_file, info.sample_rate, info.channels, sample_format) as writer:
+        for block in iter_wav_blocks(input_file):
+            writer.write(stretcher.process(block))
+        writer.write(stretcher.flush())
+        return writer.frames_written
+
+
+def variant_path(output_file, speed):
+    """Return the file name used for a speed variant, e.g. 01_Preface_1.2x.wav"""
+
+    output_file = Path(output_file)
+    return output_file.with_name(f"{output_file.stem}_{speed:g}x{output_file.suffix}")
+
+
+def make_speed_variants(output_file, speeds, rendered_speed=1.0):
+    """
+    Create speed variants of a finished render
+
+    Args:
+        output_file (str): The rendered WAV
+        speeds (list): Listening speeds wanted (e.g. [1.2, 1.5])
+        rendered_speed (float): Speed the file was synthesized at
+
+    Returns:
+        list: Paths of the variant files created
+    """
+
+    created = []
+    for speed in speeds:
+        if abs(speed - rendered_speed) < 1e-6:
+            continue
+        target = variant_path(output_file, speed)
+        start_time = time.time()
+        stretch_file(output_file, target, speed / rendered_speed)
+        print(f"Created {speed:g}x variant: {target} ({time.time() - start_time:.1f} seconds)")
+        created.append(target)
+    return created
+
+
+def main():
+    """Main function with command line interface"""
+
+    if len(sys.argv) < 3:
+        print("Pitch-Preserving Time Stretch")
+        print("=" * 40)
+        print("Usage:")
+        print("  python time_stretch.py <input.wav> <speed> [speed ...]")
+        print()
+        print("Examples:")
+        print("  python time_stretch.py audio_output/01_Preface.wav 1.2")
+        print("  python time_stretch.py audio_output/01_Preface.wav 1.2 1.5 2.0")
+        return False
+
+    input_file = sys.argv[1]
+    if not Path(input_file).exists():
+        print(f"Error: Input file '{input_file}' not found!")
+        return False
+
+    speeds = [float(s) for s in sys.argv[2:]]
+    return bool(make_speed_variants(input_file, speeds))
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+"""
+Sentence Timestamp Index
+Records where every sentence of a chapter starts and ends in its audio
+
+The converters know which sample range each synthesized chunk produced,
+so the index costs no extra synthesis: a chunk holding several sentences
+is divided at the pauses closest to where each sentence should end going
+by its length in characters. A sentence ends where the pause after it
+begins and the next one starts where that pause ends. The index is saved
+next to the output as <name>.index.json and follows the audio through
+post-processing and resampling, so its sample positions are those of the
+finished file.
+
+Sentence starts and text offsets are kept as sorted arrays, so finding the
+sentence playing at a given time, or the sentence at a given place in the
+text, is a binary search.
+
+Usage:
+  python timestamps.py <output.wav | index.json> [seconds | --offset N]
+"""
+
+import json
+import sys
+from pathlib import Path
+
+import numpy as np
+
+from segmenter import sentence_spans
+from wav_io import iter_wav_blocks, read_wav_info
+
+INDEX_VERSION = 1
+INDEX_SUFFIX = ".index.json"
+FRAME_MS = 10
+MIN_PAUSE_MS = 80
+PAUSE_DB = 35       # frames this far below the loud frames count as pause
+SEARCH_WINDOW = 0.4  # look for a pause within this fraction of the expected sentence length
+PAUSE_CHARS = 6     # the pause after a sentence lasts about as long as this many characters
+LONG_PAUSE = 0.6    # pauses at least this fraction of the longest nearby one can end a sentence
+
+
+def index_path(output_file):
+    """Sidecar index file of an output: Chapter_01.wav -> Chapter_01.index.json"""
+
+    output_file = Path(output_file)
+    return output_file.with_name(output_file.stem + INDEX_SUFFIX)
+
+
+def frame_energy(wav_file, start, end, frame):
+    """Mean power in dB of consecutive frames of wav_file[start:end], read block by block"""
+
+    energies = []
+    carry = np.zeros(0, dtype=np.float32)
+    for block in iter_wav_blocks(wav_file, start_frame=start, end_frame=end):
+        x = np.concatenate([carry, (block ** 2).mean(axis=1)])
+        usable = len(x) - len(x) % frame
+        carry = x[usable:]
+        energies.append(x[:usable].reshape(-1, frame).mean(axis=1))
+    if not energies:
+        return np.zeros(0)
+    power = np.concatenate(energies)
+    return 10.0 * np.log10(np.maximum(power, 1e-12))
+
+
+def find_pauses(energy, min_frames):
+    """Return (start, end) frames of every run of at least min_frames quiet frames"""
+
+    if not len(energy):
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    quiet = energy < np.percentile(energy, 95) - PAUSE_DB
+    edges = np.flatnonzero(np.diff(np.concatenate([[0], quiet.astype(np.int8), [0]])))
+    starts, ends = edges[::2], edges[1::2]
+    keep = ends - starts >= min_frames
+    return starts[keep], ends[keep]
+
+
+def place_boundaries(sizes, total, pause_starts, pause_ends):
+    """
+    Choose the pause after each sentence but the last within a chunk
+
+    Each boundary is predicted from the sentence's share of the characters
+    still to come, then moved to the nearest of the long pauses around it;
+    predicting from the last boundary chosen keeps errors from adding up.
+
+    Args:
+        sizes (list): Characters in each sentence of the chunk
+        total (int): Samples in the chunk
+        pause_starts, pause_ends (ndarray): Pauses in samples, ascending
+
+    Returns:
+        list: len(sizes) - 1 (end of sentence, start of next) sample pairs
+            from the chunk start
+    """
+
+    centers = (pause_starts + pause_ends) / 2
+    lengths = (pause_ends - pause_starts).astype(np.float64)
+    bounds = []
+    previous = 0
+    remaining = max(sum(sizes), 1)
+    for size in sizes[:-1]:
+        expected_length = (total - previous) * size / remaining
+        expected = previous + expected_length
+        window = max(expected_length * SEARCH_WINDOW, 1.0)
+        lo = np.searchsorted(centers, max(expected - window, previous), side="right")
+        hi = np.searchsorted(centers, min(expected + window, total), side="left")
+        if lo < hi:
+            # The nearest of the pauses about as long as the longest one
+            # (sentence breaks rather than commas)
+            distance = np.abs(centers[lo:hi] - expected)
+            distance[lengths[lo:hi] < LONG_PAUSE * lengths[lo:hi].max()] = np.inf
+            best = lo + int(np.argmin(distance))
+            bounds.append((int(pause_starts[best]), int(pause_ends[best])))
+        else:
+            bounds.append((int(round(expected)),) * 2)
+        previous = bounds[-1][1]
+        remaining = max(remaining - size, 1)
+    return bounds
+
+
+def cut_points(audio, sample_rate, sizes):
+    """
+    Where to cut audio rendered from several texts back into one piece per text
+
+    Each cut is in the middle of the pause place_boundaries picks after a
+    text, so joining the pieces again gives back the audio unchanged.
+
+    Args:
+        audio (ndarray): Samples shaped (frames, channels)
+        sample_rate (int): Its rate
+        sizes (list): Characters in each text, in order
+
+    Returns:
+        list: len(sizes) - 1 sample positions, ascending
+    """
+
+    frame = max(sample_rate * FRAME_MS // 1000, 1)
+    power = (audio[: len(audio) - len(audio) % frame] ** 2).mean(axis=1)
+    energy = 10.0 * np.log10(np.maximum(power.reshape(-1, frame).mean(axis=1), 1e-12))
+    pause_starts, pause_ends = find_pauses(energy, max(MIN_PAUSE_MS // FRAME_MS, 1))
+    bounds = place_boundaries([size + PAUSE_CHARS for size in sizes], len(audio),
+                              pause_starts * frame, pause_ends * frame)
+    return [(end + start) // 2 for end, start in bounds]
+
+
+class TimestampIndex:
+    """Start and end sample and text offset of every sentence of one output"""
+
+    def __init__(self, sample_rate, starts, ends, offsets, lengths, chapter=None):
+        """
+        Args:
+            sample_rate (int): Rate the sample positions refer to
+            starts, ends (array): First and last+1 sample of each sentence
+            offsets, lengths (array): Where each sentence is in the chapter text
+            chapter (dict): Title, source and start of the chapter in its book
+        """
+
+        self.sample_rate = int(sample_rate)
+        self.starts = np.asarray(starts, dtype=np.int64)
+        self.ends = np.asarray(ends, dtype=np.int64)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.lengths = np.asarray(lengths, dtype=np.int64)
+        self.chapter = chapter or {}
+
+    def __len__(self):
+        return len(self.starts)
+
+    def at_time(self, seconds):
+        """Sentence playing at a time in seconds (the last one that started)"""
+
+        position = np.searchsorted(self.starts, seconds * self.sample_rate, side="right") - 1
+        return int(min(max(position, 0), len(self) - 1))
+
+    def at_offset(self, offset):
+        """Sentence containing a character offset in the chapter text"""
+
+        position = np.searchsorted(self.offsets, offset, side="right") - 1
+        return int(min(max(position, 0), len(self) - 1))
+
+    def seconds(self, sentence):
+        """(start, end) of a sentence in seconds"""
+
+        return self.starts[sentence] / self.sample_rate, self.ends[sentence] / self.sample_rate
+
+    def remap(self, time_map, input_rate, output_rate):
+        """
+        Move the positions to a processed copy of the audio
+
+        Args:
+            time_map (list): (input frame, output frame) pairs from the
+                post-processor, or None if timing was not changed
+            input_rate (int): Rate of the audio the index was made for
+            output_rate (int): Rate of the processed audio
+        """
+
+        starts, ends = self.starts.astype(np.float64), self.ends.astype(np.float64)
+        if time_map:
+            anchors = np.asarray(time_map, dtype=np.float64)
+            starts = np.interp(starts, anchors[:, 0], anchors[:, 1])
+            ends = np.interp(ends, anchors[:, 0], anchors[:, 1])
+        scale = output_rate / input_rate
+        self.starts = np.round(starts * scale).astype(np.int64)
+        self.ends = np.round(ends * scale).astype(np.int64)
+        self.sample_rate = int(output_rate)
+
+    def save(self, path):
+        data = {
+            "version": INDEX_VERSION,
+            "sample_rate": self.sample_rate,
+            "chapter": self.chapter,
+            "start": self.starts.tolist(),
+            "end": self.ends.tolist(),
+            "offset": self.offsets.tolist(),
+            "length": self.lengths.tolist(),
+        }
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(data, f, separators=(",", ":"))
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("version") != INDEX_VERSION:
+            raise ValueError(f"{path} is not a version {INDEX_VERSION} timestamp index")
+        return cls(data["sample_rate"], data["start"], data["end"], data["offset"], data["length"],
+                   data.get("chapter"))
+
+
+def text_spans(text, count, fallback_text=None):
+    """
+    Offsets and lengths of the sentences of text
+
+    If text does not split into count sentences (a lexicon changed where
+    sentences end), the spans of fallback_text, the text that was
+    synthesized, are used instead.
+    """
+
+    spans = sentence_spans(text)
+    if len(spans) != count and fallback_text is not None:
+        spans = sentence_spans(fallback_text)
+    spans = spans[:count] + [("", 0, 0)] * (count - len(spans))
+    return [start for _, start, _ in spans], [end - start for _, start, end in spans]
+
+
+def build_index(wav_file, chunks, sentences, offsets, lengths, chapter=None):
+    """
+    Build the index of a rendered chapter from the chunks it was made of
+
+    Args:
+        wav_file (Path): The rendered audio
+        chunks (list): (first, last, start, end): sentences[first:last] are
+            in samples start..end, in order; pieces of one long sentence
+            repeat its range
+        sentences (list): The sentences that were synthesized
+        offsets, lengths (list): Where each sentence is in the chapter text
+        chapter (dict): Chapter details to store with the index
+
+    Returns:
+        TimestampIndex
+    """
+
+    merged = []
+    for first, last, start, end in chunks:
+        if merged and merged[-1][:2] == [first, last]:
+            merged[-1][3] = end
+        else:
+            merged.append([first, last, start, end])
+
+    sample_rate = read_wav_info(wav_file).sample_rate
+    frame = max(sample_rate * FRAME_MS // 1000, 1)
+    starts = np.zeros(len(sentences), dtype=np.int64)
+    ends = np.zeros(len(sentences), dtype=np.int64)
+    for first, last, start, end in merged:
+        if last - first > 1:
+            energy = frame_energy(wav_file, start, end, frame)
+            pause_starts, pause_ends = find_pauses(energy, max(MIN_PAUSE_MS // FRAME_MS, 1))
+            sizes = [len(s) + PAUSE_CHARS for s in sentences[first:last]]
+            bounds = place_boundaries(sizes, end - start, pause_starts * frame, pause_ends * frame)
+            starts[first:last] = [start] + [start + b for _, b in bounds]
+            ends[first:last] = [start + b for b, _ in bounds] + [end]
+        else:
+            starts[first] = start
+            ends[first] = end
+    return TimestampIndex(sample_rate, starts, ends, offsets, lengths, chapter)
+
+
+def main():
+    """Main function - look up a sentence by time or text offset"""
+
+    if len(sys.argv) < 2:
+        print(__doc__.strip())
+        return False
+
+    path = Path(sys.argv[1])
+    index = TimestampIndex.load(path if path.name.endswith(INDEX_SUFFIX) else index_path(path))
+    chapter = index.chapter.get("title", path.stem)
+    print(f"{chapter}: {len(index)} sentences, "
+          f"{index.ends[-1] / index.sample_rate if len(index) else 0:.1f} seconds at {index.sample_rate} Hz")
+    if len(sys.argv) < 3:
+        return True
+
+    if sys.argv[2] == "--offset":
+        sentence = index.at_offset(int(sys.argv[3]))
+    else:
+        sentence = index.at_time(float(sys.argv[2]))
+    start, end = index.seconds(sentence)
+    print(f"Sentence {sentence}: {start:.2f}-{end:.2f} s, "
+          f"characters {index.offsets[sentence]}-{index.offsets[sentence] + index.lengths[sentence]}")
+    return True
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
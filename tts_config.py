@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Kokoro TTS Configuration Reader
+Reads the KEY=VALUE settings from config.txt used by the converters
+"""
+
+from pathlib import Path
+
+DEFAULTS = {
+    "VOICE": "af_bella",
+    "SPEED": "1.0",
+}
+
+
+def load_config(config_file="config.txt"):
+    """
+    Read config.txt into a dictionary of settings
+
+    Lines starting with '#' and anything after an inline '#' are ignored,
+    so the README examples (VOICE=af_bella    # comment) work as written.
+
+    Args:
+        config_file (str): Path to the config file (default: config.txt)
+
+    Returns:
+        dict: Setting name -> string value, with DEFAULTS filled in
+    """
+
+    config = dict(DEFAULTS)
+    path = Path(config_file)
+    if not path.exists():
+        return config
+
+    with open(path, "r", encoding="utf-8-sig") as f:
+        for line in f:
+            line = line.split("#", 1)[0].strip()
+            if not line or "=" not in line:
+                continue
+            key, value = line.split("=", 1)
+            config[key.strip().upper()] = value.strip()
+
+    return config
+
+
+def get_float(config, key, default=None):
+    """Return a setting as a float, or default if it is missing or empty"""
+
+    value = config.get(key, "")
+    if value == "":
+        return default
+    try:
+        return float(value)
+    except ValueError:
+        print(f"Warning: ignoring invalid {key}={value!r} in config")
+        return default
+
+
+def get_list(config, key, convert=str):
+    """Return a comma-separated setting as a list of converted values"""
+
+    values = []
+    for item in config.get(key, "").split(","):
+        item = item.strip()
+        if not item:
+            continue
+        try:
+            values.append(convert(item))
+        except ValueError:
+            print(f"Warning: ignoring invalid {key} entry {item!r} in config")
+    return values
+
+
+def get_bool(config, key, default=False):
+    """Return an on/off style setting as a boolean"""
+
+    value = config.get(key, "").strip().lower()
+    if value == "":
+        return default
+    return value in ("1", "true", "yes", "on")
@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+"""
+Kokoro TTS Engines
+Turns a piece of text into audio samples with the backend chosen in config.txt
+
+Engines:
+    streamer - runs "python -m kokoro_tts_cli.streamer" once per call (default);
+               synthesize_batch renders many chunks in one run
+    kokoro   - keeps the kokoro model loaded in this process
+    onnx     - runs the ONNX export of the model with ONNX Runtime on the CPU
+               (kokoro-onnx package); ONNX_MODEL can point at the int8 model
+"""
+
+import os
+import tempfile
+from pathlib import Path
+
+SAMPLE_RATE = 24000
+MAX_TOKENS = 510        # phoneme tokens Kokoro reads per call
+BATCH_CHARS = 20000     # text per streamer run when several chunks are rendered together
+
+
+class StreamerEngine:
+    """Synthesizes through the kokoro_tts_cli.streamer command line tool"""
+
+    name = "streamer"
+    package = "kokoro_tts_cli"
+    max_tokens = MAX_TOKENS
+    batch_chars = BATCH_CHARS
+    # Every run loads the model and uses all cores, so runs side by side
+    # only compete for them
+    concurrent = False
+
+    def __init__(self, voice="af_bella", speed=1.0):
+        self.voice = voice
+        self.speed = speed
+
+    def command(self, output_file):
+        return [
+            "python", "-m", "kokoro_tts_cli.streamer",
+            "--voice", self.voice,
+            "--speed", str(self.speed),
+            "--save", str(output_file),
+            "--no-play",
+            "--batch"
+        ]
+
+    def synthesize(self, text):
+        """
+        Render text and return its audio
+
+        Returns:
+            tuple: (float32 samples shaped (frames, channels), sample_rate)
+        """
+
+        from progress import run_streaming
+        from wav_io import read_wav
+
+        fd, output_file = tempfile.mkstemp(suffix=".wav")
+        os.close(fd)
+        try:
+            returncode, log = run_streaming(self.command(output_file), text, cwd=Path.cwd())
+            if returncode != 0:
+                raise RuntimeError("Streamer failed: " + " | ".join(list(log)[-5:]))
+            return read_wav(output_file)
+        finally:
+            os.remove(output_file)
+
+    def synthesize_batch(self, texts):
+        """
+        Render several texts in one streamer run, so the model is loaded
+        once, and cut the audio apart at the pause after each text
+
+        Returns:
+            list: (float32 samples shaped (frames, channels), sample_rate) per text
+        """
+
+        from timestamps import cut_points
+
+        audio, sample_rate = self.synthesize("\n\n".join(texts))
+        cuts = [0] + cut_points(audio, sample_rate, [len(text) for text in texts]) + [len(audio)]
+        return [(audio[start:end], sample_rate) for start, end in zip(cuts, cuts[1:])]
+
+
+class KokoroEngine:
+    """Synthesizes with the kokoro Python package, loading the model only once"""
+
+    name = "kokoro"
+    package = "kokoro"
+    max_tokens = MAX_TOKENS
+    concurrent = False      # one pipeline, one chunk at a time
+
+    def __init__(self, voice="af_bella", speed=1.0):
+        from kokoro import KPipeline
+
+        self.voice = voice
+        self.speed = speed
+        # The first letter of a voice name is its language (a = American, b = British, ...)
+        self.pipeline = KPipeline(lang_code=voice[0])
+
+    def synthesize(self, text):
+        """
+        Render text and return its audio
+
+        Returns:
+            tuple: (float32 samples shaped (frames, 1), sample_rate)
+        """
+
+        import numpy as np
+        from segmenter import segment
+
+        # Our own chunks, packed up to the model's limit, instead of the
+        # pipeline's line-by-line splitting
+        pieces = []
+        for chunk in segment(text, self.max_tokens)[1]:
+            for _, _, audio in self.pipeline(chunk.text, voice=self.voice, speed=self.speed, split_pattern=None):
+                if audio is not None:
+                    pieces.append(np.asarray(audio, dtype=np.float32))
+        if not pieces:
+            return np.zeros((0, 1), dtype=np.float32), SAMPLE_RATE
+        return np.concatenate(pieces)[:, None], SAMPLE_RATE
+
+
+class OnnxEngine:
+    """
+    Synthesizes with ONNX Runtime on the CPU through the kokoro-onnx package
+
+    Uses the same voices and speeds as the other engines. The int8-quantized
+    model (kokoro-v1.0.int8.onnx) is about a quarter of the size of the
+    float32 one and usually faster on CPUs without a GPU.
+    """
+
+    name = "onnx"
+    package = "kokoro_onnx"
+    max_tokens = MAX_TOKENS
+    # ONNX Runtime sessions run calls from several threads at once, and
+    # kokoro-onnx serializes the phonemizer
+    concurrent = True
+    # Settings that change the audio this engine produces (part of build keys)
+    settings = ("ONNX_MODEL",)
+
+    # First letter of a voice name -> language code used by kokoro-onnx
+    LANGUAGES = {
+        "a": "en-us", "b": "en-gb", "e": "es", "f": "fr-fr", "h": "hi",
+        "i": "it", "j": "ja", "p": "pt-br", "z": "cmn",
+    }
+
+    def __init__(self, voice="af_bella", speed=1.0, model="models/kokoro-v1.0.onnx",
+                 voices="models/voices-v1.0.bin", threads=None):
+        import onnxruntime
+        from kokoro_onnx import Kokoro
+
+        for path in (model, voices):
+            if not Path(path).exists():
+                raise FileNotFoundError(f"{path} not found - download the kokoro-onnx model files "
+                                        f"or set ONNX_MODEL / ONNX_VOICES in config.txt")
+
+        self.voice = voice
+        self.speed = speed
+        self.model = model
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if not threads and hasattr(os, "sched_getaffinity"):
+            # ONNX Runtime sizes its pool by the machine's cores, not the ones this worker is pinned to
+            pinned = len(os.sched_getaffinity(0))
+            threads = pinned if pinned < (os.cpu_count() or pinned) else None
+        if threads:
+            options.intra_op_num_threads = threads
+        session = onnxruntime.InferenceSession(model, options, providers=["CPUExecutionProvider"])
+        self.kokoro = Kokoro.from_session(session, voices)
+        self.lang = self.LANGUAGES.get(voice[0], "en-us")
+
+    @staticmethod
+    def options(config):
+        """Constructor arguments taken from config.txt"""
+
+        from tts_config import get_float
+
+        threads = get_float(config, "ONNX_THREADS")
+        return {
+            "model": config.get("ONNX_MODEL") or "models/kokoro-v1.0.onnx",
+            "voices": config.get("ONNX_VOICES") or "models/voices-v1.0.bin",
+            "threads": int(threads) if threads else None,
+        }
+
+    def synthesize(self, text):
+        """
+        Render text and return its audio
+
+        Returns:
+            tuple: (float32 samples shaped (frames, 1), sample_rate)
+        """
+
+        import numpy as np
+        from segmenter import segment
+
+        pieces = []
+        sample_rate = SAMPLE_RATE
+        for chunk in segment(text, self.max_tokens)[1]:
+            audio, sample_rate = self.kokoro.create(chunk.text, voice=self.voice, speed=self.speed, lang=self.lang)
+            pieces.append(np.asarray(audio, dtype=np.float32))
+        if not pieces:
+            return np.zeros((0, 1), dtype=np.float32), sample_rate
+        return np.concatenate(pieces)[:, None], sample_rate
+
+
+ENGINES = {
+    StreamerEngine.name: StreamerEngine,
+    KokoroEngine.name: KokoroEngine,
+    OnnxEngine.name: OnnxEngine,
+}
+
+
+def engine_name(config):
+    """Name of the engine selected by ENGINE in config.txt"""
+
+    name = config.get("ENGINE", "").strip().lower() or StreamerEngine.name
+    if name not in ENGINES:
+        raise ValueError(f"Unknown ENGINE '{name}' (choose from: {', '.join(ENGINES)})")
+    return name
+
+
+def engine_version(name):
+    """Installed version of the package behind an engine ("unknown" if it is not installed)"""
+
+    from importlib import metadata
+
+    package = ENGINES[name].package
+    for distribution in (package, package.replace("_", "-")):
+        try:
+            return metadata.version(distribution)
+        except metadata.PackageNotFoundError:
+            continue
+    return "unknown"
+
+
+def get_engine(config, voice=None, speed=None):
+    """
+    Create the engine selected by ENGINE in config.txt
+
+    Args:
+        config (dict): Settings from tts_config.load_config
+        voice (str): Voice to use (default: VOICE from config)
+        speed (float): Speed to use (default: SPEED from config)
+    """
+
+    from tts_config import get_float
+
+    engine_class = ENGINES[engine_name(config)]
+    voice = voice or config["VOICE"]
+    speed = speed if speed is not None else get_float(config, "SPEED", 1.0)
+    options = engine_class.options(config) if hasattr(engine_class, "options") else {}
+    return engine_class(voice, speed, **options)
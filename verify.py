@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+"""
+Output Verification
+Catches truncated, empty, silent or corrupt WAV outputs without reading them whole
+
+A render that exits with code 0 can still leave a bad file: a header that
+was never finalized, data cut short by a full disk, a file that is much
+shorter than its text, or audio that is silent or NaN throughout. Each
+output is checked by its header, its size, its duration against the
+words of its text, and a sample of short windows spread across the file
+(about 64 KB read per file), so a whole audio_output folder is checked in
+seconds.
+
+A failed output is re-queued: its input is moved from completed/ back to
+text_input/ and its build database entry is dropped, so the next batch
+renders it again.
+
+Usage:
+  python verify.py [audio_output] [--no-requeue]
+"""
+
+import math
+import re
+import shutil
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+from wav_io import decode_frames, read_wav_info
+
+WORDS_PER_MINUTE = 150
+MIN_DURATION_RATIO = 0.35   # shorter than this share of the expected duration: cut short
+MAX_DURATION_RATIO = 4.0
+MIN_CHECKED_SECONDS = 10.0  # too short to judge the duration below this
+SAMPLE_WINDOWS = 64
+WINDOW_FRAMES = 1024
+SILENT_DB = -60.0           # peak level below which a window counts as silent
+
+_VARIANT = re.compile(r"_\d+(\.\d+)?x$")
+
+
+def expected_seconds(words, speed=1.0):
+    """Rough spoken length of a text"""
+
+    return words / WORDS_PER_MINUTE * 60.0 / max(speed, 0.1)
+
+
+def check_samples(f, info, frames, windows=SAMPLE_WINDOWS, window_frames=WINDOW_FRAMES):
+    """
+    Read short windows spread evenly from the first frame to the last
+
+    Returns:
+        list: Problems found (NaN/infinite samples, silence throughout)
+    """
+
+    window_frames = min(window_frames, frames)
+    count = 1 if frames <= window_frames else min(windows, math.ceil(frames / window_frames))
+    starts = np.linspace(0, frames - window_frames, count).astype(np.int64)
+    peak = 0.0
+    for start in starts:
+        f.seek(info.data_offset + int(start) * info.block_align)
+        raw = f.read(window_frames * info.block_align)
+        raw = raw[: len(raw) - len(raw) % info.block_align]
+        if not raw:
+            continue
+        samples = decode_frames(raw, info)
+        if not np.isfinite(samples).all():
+            return [f"NaN or infinite samples near {start / info.sample_rate:.1f} s"]
+        peak = max(peak, float(np.abs(samples).max()))
+    if peak < 10 ** (SILENT_DB / 20):
+        return [f"silent (no sampled window above {SILENT_DB:.0f} dB)"]
+    return []
+
+
+def verify_output(wav_file, words=None, speed=1.0):
+    """
+    Check one output
+
+    Args:
+        wav_file (Path): The output
+        words (int): Words in its text, to check the duration (None: skip)
+        speed (float): Speed it was rendered at
+
+    Returns:
+        list: Problems found; empty if the output looks complete
+    """
+
+    path = Path(wav_file)
+    try:
+        size = path.stat().st_size
+    except OSError:
+        return ["missing"]
+    if size == 0:
+        return ["empty file"]
+
+    with open(path, "rb") as f:
+        try:
+            info = read_wav_info(f)
+        except (ValueError, KeyError) as e:
+            return [f"not a valid WAV file ({e})"]
+        if not info.block_align or not info.sample_rate:
+            return ["WAV header has no channels, sample size or rate"]
+
+        available = size - info.data_offset
+        if info.data_size == 0 and available > 0:
+            return [f"header never finalized ({available:,} bytes of audio but the header says none)"]
+        if info.data_size > available:
+            return [f"truncated: header says {info.data_size:,} bytes of audio, file has {max(available, 0):,}"]
+        frames = info.frames
+        if frames == 0:
+            return ["no audio"]
+
+        problems = []
+        duration = frames / info.sample_rate
+        if words:
+            expected = expected_seconds(words, speed)
+            if expected >= MIN_CHECKED_SECONDS and not (
+                    MIN_DURATION_RATIO * expected <= duration <= MAX_DURATION_RATIO * expected):
+                problems.append(f"{duration:.0f} s of audio for {words:,} words (about {expected:.0f} s expected)")
+        try:
+            problems += check_samples(f, info, frames)
+        except (ValueError, KeyError) as e:
+            problems.append(f"unreadable samples ({e})")
+    return problems
+
+
+def report(output_file, problems):
+    """Print the problems of one output; True if there were none"""
+
+    for problem in problems:
+        print(f"Verification failed: {output_file}: {problem}")
+    return not problems
+
+
+def find_input(stem, text_dirs):
+    """Input text of an output, looked for in text_dirs"""
+
+    for text_dir in text_dirs:
+        candidate = Path(text_dir) / f"{stem}.txt"
+        if candidate.exists():
+            return candidate
+    return None
+
+
+def verify_dir(audio_dir="audio_output", speed=1.0, text_dirs=("text_input", "completed"),
+               input_dir="text_input", requeue=True):
+    """
+    Check every output in a folder, re-queueing the ones that fail
+
+    Args:
+        audio_dir (str): Folder of outputs
+        speed (float): Speed the outputs were rendered at
+        text_dirs (tuple): Where to look for the inputs, for word counts
+        input_dir (str): Where re-queued inputs are moved
+        requeue (bool): Move failed inputs back and drop their build records
+
+    Returns:
+        dict: Counts of checked, failed and re-queued outputs, failures and time taken
+    """
+
+    from build_db import BuildDB
+
+    start_time = time.perf_counter()
+    outputs = sorted(p for p in Path(audio_dir).glob("*.wav")
+                     if not p.name.startswith(".") and not p.stem.endswith(".partial"))
+    db = BuildDB(Path(audio_dir) / ".build.json")
+    failed = {}
+    requeued = 0
+    for output_file in outputs:
+        words = None
+        input_file = None if _VARIANT.search(output_file.stem) else find_input(output_file.stem, text_dirs)
+        if input_file is not None:
+            with open(input_file, "r", encoding="utf-8", errors="replace") as f:
+                words = len(f.read().split())
+        problems = verify_output(output_file, words, speed)
+        if not problems:
+            continue
+        failed[str(output_file)] = problems
+        if not requeue:
+            continue
+        db.forget(output_file)
+        if input_file is not None and input_file.parent != Path(input_dir):
+            Path(input_dir).mkdir(exist_ok=True)
+            shutil.move(str(input_file), Path(input_dir) / input_file.name)
+        requeued += input_file is not None
+    if requeue and failed:
+        db.save()
+
+    return {
+        "checked": len(outputs),
+        "failed": len(failed),
+        "requeued": requeued,
+        "problems": failed,
+        "seconds": time.perf_counter() - start_time,
+    }
+
+
+def main():
+    """Main function with command line interface"""
+
+    from tts_config import get_float, load_config
+
+    args = sys.argv[1:]
+    requeue = "--no-requeue" not in args
+    args = [a for a in args if a != "--no-requeue"]
+    audio_dir = args[0] if args else "audio_output"
+    if not Path(audio_dir).is_dir():
+        print(f"Folder not found: {audio_dir}")
+        return False
+
+    result = verify_dir(audio_dir, get_float(load_config(), "SPEED", 1.0), requeue=requeue)
+    for output_file, problems in result["problems"].items():
+        for problem in problems:
+            print(f"  FAILED {output_file}: {problem}")
+    print(f"{result['checked']} outputs checked in {result['seconds']:.1f} seconds: "
+          f"{result['failed']} failed, {result['requeued']} re-queued")
+    return result["failed"] == 0
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
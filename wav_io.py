@@ -0,0 +1,406 @@
+#!/usr/bin/env python3
+"""
+WAV Reading and Writing Helpers
+Block-by-block access to WAV files so multi-GB outputs never have to fit in memory
+"""
+
+import struct
+from collections import namedtuple
+
+import numpy as np
+
+WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_IEEE_FLOAT = 0x0003
+WAVE_FORMAT_MULAW = 0x0007
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+# RF64 files keep sizes past 4 GB in a ds64 chunk and put this in the 32-bit fields
+RF64_SIZE = 0xFFFFFFFF
+
+DEFAULT_BLOCK_FRAMES = 65536
+
+# G.711 mu-law: 8-bit logarithmic samples, half the size of int16 and good
+# enough for speech at low sample rates
+MULAW_BIAS = 0x84
+MULAW_CLIP = 32635
+
+
+def _mulaw_table():
+    code = ~np.arange(256, dtype=np.int32) & 0xFF
+    exponent = (code >> 4) & 0x07
+    magnitude = ((((code & 0x0F) << 3) + MULAW_BIAS) << exponent) - MULAW_BIAS
+    return (np.where(code & 0x80, -magnitude, magnitude) / 32768.0).astype(np.float32)
+
+
+MULAW_DECODE = _mulaw_table()
+
+
+class WavInfo(namedtuple("WavInfo", "format_tag channels sample_rate bits_per_sample data_offset data_size")):
+    """Header fields of a WAV file plus the location of its sample data"""
+
+    @property
+    def block_align(self):
+        return self.channels * self.bits_per_sample // 8
+
+    @property
+    def frames(self):
+        return self.data_size // self.block_align if self.block_align else 0
+
+    @property
+    def duration(self):
+        return self.frames / self.sample_rate if self.sample_rate else 0.0
+
+
+def read_wav_info(f):
+    """
+    Parse the header of a WAV (or RF64) file without reading its sample data
+
+    Args:
+        f: Path to the WAV file, or an open binary file object
+
+    Returns:
+        WavInfo describing the format and where the data chunk lives
+    """
+
+    if not hasattr(f, "read"):
+        with open(f, "rb") as fh:
+            return read_wav_info(fh)
+
+    riff = f.read(12)
+    if len(riff) < 12 or riff[:4] not in (b"RIFF", b"RF64") or riff[8:12] != b"WAVE":
+        raise ValueError("Not a RIFF/WAVE file")
+
+    fmt = None
+    ds64_data_size = None
+    while True:
+        chunk_header = f.read(8)
+        if len(chunk_header) < 8:
+            raise ValueError("WAV file has no data chunk")
+        chunk_id, chunk_size = struct.unpack("<4sI", chunk_header)
+
+        if chunk_id == b"fmt ":
+            body = f.read(chunk_size + (chunk_size & 1))
+            format_tag, channels, sample_rate, _, _, bits = struct.unpack("<HHIIHH", body[:16])
+            if format_tag == WAVE_FORMAT_EXTENSIBLE and len(body) >= 26:
+                # The real format is the first two bytes of the sub-format GUID
+                format_tag = struct.unpack("<H", body[24:26])[0]
+            fmt = (format_tag, channels, sample_rate, bits)
+        elif chunk_id == b"ds64":
+            body = f.read(chunk_size + (chunk_size & 1))
+            ds64_data_size = struct.unpack("<Q", body[8:16])[0]
+        elif chunk_id == b"data":
+            if fmt is None:
+                raise ValueError("WAV data chunk appears before fmt chunk")
+            if chunk_size == RF64_SIZE and ds64_data_size is not None:
+                chunk_size = ds64_data_size
+            return WavInfo(*fmt, data_offset=f.tell(), data_size=chunk_size)
+        else:
+            f.seek(chunk_size + (chunk_size & 1), 1)
+
+
+def _sample_dtype(info):
+    """Return the NumPy dtype used to decode raw samples for a WAV format"""
+
+    if info.format_tag == WAVE_FORMAT_IEEE_FLOAT:
+        return {32: np.float32, 64: np.float64}[info.bits_per_sample]
+    if info.format_tag == WAVE_FORMAT_PCM:
+        return {8: np.uint8, 16: np.int16, 24: None, 32: np.int32}[info.bits_per_sample]
+    if info.format_tag == WAVE_FORMAT_MULAW and info.bits_per_sample == 8:
+        return np.uint8
+    raise ValueError(f"Unsupported WAV format tag: {info.format_tag:#x}")
+
+
+def decode_frames(raw, info):
+    """
+    Convert raw little-endian sample bytes into float32 frames in [-1, 1]
+
+    Args:
+        raw (bytes): Whole frames of sample data
+        info (WavInfo): Format of the data
+
+    Returns:
+        float32 array shaped (frames, channels)
+    """
+
+    dtype = _sample_dtype(info)
+    if info.format_tag == WAVE_FORMAT_MULAW:
+        samples = MULAW_DECODE[np.frombuffer(raw, dtype=np.uint8)]
+    elif dtype is None:
+        # 24-bit PCM: widen each 3-byte sample into the top of an int32
+        b = np.frombuffer(raw, dtype=np.uint8).reshape(-1, 3)
+        wide = np.zeros((b.shape[0], 4), dtype=np.uint8)
+        wide[:, 1:] = b
+        samples = wide.view("<i4").ravel().astype(np.float32) / 2147483648.0
+    else:
+        samples = np.frombuffer(raw, dtype=np.dtype(dtype).newbyteorder("<"))
+        if dtype == np.uint8:
+            samples = (samples.astype(np.float32) - 128.0) / 128.0
+        elif dtype == np.int16:
+            samples = samples.astype(np.float32) / 32768.0
+        elif dtype == np.int32:
+            samples = samples.astype(np.float32) / 2147483648.0
+        else:
+            samples = samples.astype(np.float32)
+    return samples.reshape(-1, info.channels)
+
+
+def iter_wav_blocks(path, block_frames=DEFAULT_BLOCK_FRAMES, start_frame=0, end_frame=None):
+    """
+    Yield the sample data of a WAV file as float32 blocks
+
+    Args:
+        path (str): WAV file to read
+        block_frames (int): Frames per yielded block
+        start_frame (int): First frame to read
+        end_frame (int): Frame to stop before (default: end of data)
+
+    Yields:
+        float32 arrays shaped (frames, channels)
+    """
+
+    with open(path, "rb") as f:
+        info = read_wav_info(f)
+        # Trust the file size over the header if the writer never patched it
+        f.seek(0, 2)
+        available = (f.tell() - info.data_offset) // info.block_align
+        total = min(info.frames, available) if info.data_size else available
+        end = total if end_frame is None else min(end_frame, total)
+
+        pos = max(start_frame, 0)
+        f.seek(info.data_offset + pos * info.block_align)
+        while pos < end:
+            count = min(block_frames, end - pos)
+            raw = f.read(count * info.block_align)
+            if not raw:
+                break
+            raw = raw[: len(raw) - len(raw) % info.block_align]
+            yield decode_frames(raw, info)
+            pos += len(raw) // info.block_align
+
+
+def read_wav(path):
+    """
+    Read a whole WAV file into memory (only for short segments)
+
+    Returns:
+        tuple: (float32 samples shaped (frames, channels), sample_rate)
+    """
+
+    info = read_wav_info(path)
+    blocks = list(iter_wav_blocks(path))
+    if blocks:
+        samples = np.concatenate(blocks)
+    else:
+        samples = np.zeros((0, info.channels), dtype=np.float32)
+    return samples, info.sample_rate
+
+
+def encode_frames(samples, sample_format, dither=None):
+    """
+    Convert float frames into raw little-endian bytes
+
+    Args:
+        samples: float array shaped (frames, channels)
+        sample_format (str): "int16", "float32" or "mulaw"
+        dither (numpy.random.Generator): Adds TPDF dither before rounding
+            to int16, so quiet passages fade out as noise instead of
+            harmonic distortion
+    """
+
+    if sample_format == "float32":
+        return np.ascontiguousarray(samples, dtype="<f4").tobytes()
+    if sample_format == "int16":
+        scaled = samples * 32767.0
+        if dither is not None:
+            scaled = scaled + (dither.random(scaled.shape, dtype=np.float32)
+                               - dither.random(scaled.shape, dtype=np.float32))
+        scaled = np.clip(np.rint(scaled), -32768, 32767)
+        return scaled.astype("<i2").tobytes()
+    if sample_format == "mulaw":
+        linear = np.rint(np.clip(samples, -1.0, 1.0) * 32767.0).astype(np.int32)
+        sign = np.where(linear < 0, 0x80, 0)
+        magnitude = np.minimum(np.abs(linear), MULAW_CLIP) + MULAW_BIAS
+        # Segment: position of the highest set bit above bit 7 (0-7)
+        exponent = np.frexp(magnitude)[1] - 8
+        mantissa = (magnitude >> (exponent + 3)) & 0x0F
+        return (~(sign | (exponent << 4) | mantissa) & 0xFF).astype(np.uint8).tobytes()
+    raise ValueError(f"Unsupported sample format: {sample_format}")
+
+
+class Resampler:
+    """
+    Streaming windowed-sinc sample rate converter
+
+    Each output sample is a Kaiser-windowed sinc interpolation of the input
+    around its exact position, computed for a whole block at once. Below
+    the input rate the filter cutoff follows the output Nyquist frequency,
+    so downsampling 24 kHz speech to 16 kHz does not alias.
+    """
+
+    def __init__(self, input_rate, output_rate, channels=1, half_taps=16, beta=8.0, max_phases=4096):
+        self.input_rate = int(input_rate)
+        self.output_rate = int(output_rate)
+        self.channels = channels
+        self.cutoff = min(1.0, self.output_rate / self.input_rate) * 0.95
+        self.half_width = int(np.ceil(half_taps / self.cutoff))
+        self._offsets = np.arange(-self.half_width + 1, self.half_width + 1)
+
+        # Output n sits at input position n * input_rate / output_rate. For
+        # common rate pairs the fractional part takes only a few distinct
+        # values, so the filter weights are tabulated once per phase.
+        step = np.gcd(self.input_rate, self.output_rate)
+        self._phases = min(self.output_rate // step, max_phases)
+        fractions = np.arange(self._phases) / self._phases
+        distance = fractions[:, None] - self._offsets[None, :]
+        window = np.i0(beta * np.sqrt(np.clip(1.0 - (distance / self.half_width) ** 2, 0.0, 1.0))) / np.i0(beta)
+        self._table = (self.cutoff * np.sinc(self.cutoff * distance) * window).astype(np.float32)
+
+        # Input buffer starts half_width zeros before sample 0
+        self._buffer = np.zeros((self.half_width, channels), dtype=np.float32)
+        self._buffer_base = -self.half_width
+        self._input_total = 0
+        self._next_out = 0
+
+    def _render(self, available_end):
+        """Produce every output sample whose filter support is inside the buffer"""
+
+        # Last n whose rightmost tap, floor(position) + half_width, is buffered
+        last = ((available_end - self.half_width) * self.output_rate - 1) // self.input_rate
+        if last < self._next_out:
+            return np.zeros((0, self.channels), dtype=np.float32)
+
+        n = np.arange(self._next_out, last + 1, dtype=np.int64) * self.input_rate
+        base = n // self.output_rate
+        phase = (n % self.output_rate) * self._phases // self.output_rate
+        taps = base[:, None] + self._offsets[None, :] - self._buffer_base
+        frames = self._buffer[taps]                              # (outputs, taps, channels)
+        out = np.einsum("ot,otc->oc", self._table[phase], frames)
+        self._next_out = last + 1
+
+        # Keep only the input the next output still needs
+        keep_from = self._next_out * self.input_rate // self.output_rate - self.half_width + 1
+        drop = keep_from - self._buffer_base
+        if drop > 0:
+            self._buffer = self._buffer[drop:]
+            self._buffer_base += drop
+        return out.astype(np.float32)
+
+    def process(self, block):
+        block = np.asarray(block, dtype=np.float32).reshape(-1, self.channels)
+        self._buffer = np.concatenate([self._buffer, block])
+        self._input_total += len(block)
+        return self._render(self._buffer_base + len(self._buffer))
+
+    def flush(self):
+        expected = -(-self._input_total * self.output_rate // self.input_rate)
+        pad = np.zeros((self.half_width + 1, self.channels), dtype=np.float32)
+        self._buffer = np.concatenate([self._buffer, pad])
+        out = self._render(self._buffer_base + len(self._buffer))
+        already = self._next_out - len(out)
+        return out[:max(expected - already, 0)]
+
+
+SAMPLE_FORMATS = {
+    # name: (format tag, bits per sample)
+    "int16": (WAVE_FORMAT_PCM, 16),
+    "float32": (WAVE_FORMAT_IEEE_FLOAT, 32),
+    "mulaw": (WAVE_FORMAT_MULAW, 8),
+}
+
+
+class WavWriter:
+    """
+    Streaming WAV writer
+
+    Blocks are appended as they arrive and the header sizes are patched
+    when the writer is closed, so memory use does not depend on length.
+    """
+
+    def __init__(self, path, sample_rate, channels=1, sample_format="int16", output_rate=None, dither=True):
+        """
+        Args:
+            path (str): File to create
+            sample_rate (int): Rate of the blocks passed to write()
+            channels (int): Number of channels
+            sample_format (str): "int16", "float32" or "mulaw" on disk
+            output_rate (int): Rate on disk if different (resampled while writing)
+            dither (bool): Apply TPDF dither when writing int16
+        """
+
+        if sample_format not in SAMPLE_FORMATS:
+            raise ValueError(f"Unsupported sample format: {sample_format}")
+
+        self.path = path
+        self.sample_rate = int(output_rate or sample_rate)
+        self.channels = int(channels)
+        self.sample_format = sample_format
+        self.frames_written = 0
+
+        self._resampler = None
+        if self.sample_rate != int(sample_rate):
+            self._resampler = Resampler(sample_rate, self.sample_rate, self.channels)
+        self._dither = np.random.default_rng(0) if dither and sample_format == "int16" else None
+
+        format_tag, bits = SAMPLE_FORMATS[sample_format]
+        self._block_align = self.channels * bits // 8
+        self._file = open(path, "wb")
+
+        fmt_body = struct.pack("<HHIIHH", format_tag, self.channels, self.sample_rate,
+                               self.sample_rate * self._block_align, self._block_align, bits)
+        if format_tag != WAVE_FORMAT_PCM:
+            fmt_body += struct.pack("<H", 0)
+
+        header = b"RIFF" + struct.pack("<I", 0) + b"WAVE"
+        header += b"fmt " + struct.pack("<I", len(fmt_body)) + fmt_body
+        self._fact_offset = None
+        if format_tag != WAVE_FORMAT_PCM:
+            # Non-PCM formats carry a fact chunk with the frame count
+            self._fact_offset = len(header) + 8
+            header += b"fact" + struct.pack("<II", 4, 0)
+        header += b"data" + struct.pack("<I", 0)
+        self._data_offset = len(header)
+        self._file.write(header)
+
+    def write(self, samples):
+        """Append float frames shaped (frames, channels) or (frames,)"""
+
+        samples = np.asarray(samples)
+        if samples.ndim == 1:
+            samples = samples[:, None]
+        if samples.shape[1] != self.channels:
+            raise ValueError(f"Expected {self.channels} channel(s), got {samples.shape[1]}")
+        if self._resampler is not None:
+            samples = self._resampler.process(samples)
+        self._write_encoded(samples)
+
+    def _write_encoded(self, samples):
+        if len(samples):
+            self._file.write(encode_frames(samples, self.sample_format, self._dither))
+            self.frames_written += len(samples)
+
+    def close(self):
+        """Patch header sizes and close the file"""
+
+        if self._file is None:
+            return
+        if self._resampler is not None:
+            self._write_encoded(self._resampler.flush())
+            self._resampler = None
+        data_size = self.frames_written * self._block_align
+        if data_size & 1:
+            self._file.write(b"\x00")
+        self._file.seek(4)
+        self._file.write(struct.pack("<I", self._data_offset - 8 + data_size + (data_size & 1)))
+        if self._fact_offset is not None:
+            self._file.seek(self._fact_offset)
+            self._file.write(struct.pack("<I", self.frames_written))
+        self._file.seek(self._data_offset - 4)
+        self._file.write(struct.pack("<I", data_size))
+        self._file.close()
+        self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()